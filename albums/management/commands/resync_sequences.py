@@ -0,0 +1,18 @@
+#!/usr/bin/python3
+
+from django.core.management.base import BaseCommand
+
+from moundmusic.dbutils import SERIAL_PK_MODEL_CLASSES, resync_pk_sequences
+
+
+# A one-time fix for a database whose SERIAL sequences have fallen
+# behind the primary key values in their tables; see
+# moundmusic.dbutils.resync_pk_sequences(). Run it with `python
+# manage.py resync_sequences`.
+class Command(BaseCommand):
+    help = "Moves each table's primary key sequence past its greatest primary key."
+
+    def handle(self, *args, **options):
+        resync_pk_sequences()
+        for model_class in SERIAL_PK_MODEL_CLASSES:
+            self.stdout.write(f"resynced sequence for `{model_class._meta.db_table}`")
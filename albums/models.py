@@ -1,6 +1,8 @@
 #!/usr/bin/python3
 
 import codecs
+import functools
+import operator
 
 from datetime import date
 from django.db import models
@@ -14,19 +16,67 @@ from django.db import models
 # name of their own app.
 
 
+# Serializing a row is the hottest code path on the list endpoints, so
+# rather than walking __columns__ for every row, a serializer function is
+# compiled once per model class and tuple of columns and then cached.
+# validate_fields_param() in moundmusic.viewutils puts a ?fields= tuple
+# in the order of __columns__, so each set of columns has one entry, and
+# the cache is bounded besides, so clients can't grow it without end.
+# The function takes a tuple of column values in the order of `fields`
+# (as from QuerySet.values_list()) and returns the dict to be jsonified.
+# Trailing values past the end of `fields` are ignored, which lets a
+# caller append the primary key to a row without it being serialized.
+# The only per-value work is decoding bytes values in the columns that
+# can hold them (BinaryFields), just as Serializable.serialize() did.
+@functools.lru_cache(maxsize=1024)
+def row_serializer(model_class, fields=None):
+    fields = tuple(model_class.__columns__.keys()) if fields is None else fields
+    bytes_col_indexes = tuple(
+        index
+        for index, column in enumerate(fields)
+        if isinstance(model_class._meta.get_field(column), models.BinaryField)
+    )
+    if not bytes_col_indexes:
+
+        def serialize_row(row):
+            return dict(zip(fields, row))
+
+    else:
+
+        def serialize_row(row):
+            row = list(row)
+            for index in bytes_col_indexes:
+                if isinstance(row[index], bytes):
+                    row[index] = codecs.decode(row[index])
+            return dict(zip(fields, row))
+
+    return serialize_row
+
+
+# The counterpart to row_serializer() for model objects: a compiled
+# function that returns the tuple of a model object's values for
+# `fields`, so that the two can be composed. It's cached the same way.
+@functools.lru_cache(maxsize=1024)
+def obj_row_getter(model_class, fields=None):
+    fields = tuple(model_class.__columns__.keys()) if fields is None else fields
+    if len(fields) == 1:
+        getter = operator.attrgetter(fields[0])
+        return lambda model_obj: (getter(model_obj),)
+    return operator.attrgetter(*fields)
+
+
 # This class is multi-inherited by a model class if its objects need
 # to be able to convert their attribute/value pairs to a dict. This is
 # used by the JSON interface to interpolate a python object into a JSON
-# object when returning a value at a REST endpoint.
+# object when returning a value at a REST endpoint. If `fields` is
+# given (a tuple of keys from __columns__, as from a ?fields= query
+# parameter), only those columns are serialized.
 class Serializable(object):
-    def serialize(self):
-        serialization = dict()
-        for column in self.__columns__.keys():
-            column_value = getattr(self, column)
-            if isinstance(column_value, bytes):
-                column_value = codecs.decode(column_value)
-            serialization[column] = column_value
-        return serialization
+    def serialize(self, fields=None):
+        model_class = type(self)
+        return row_serializer(model_class, fields)(
+            obj_row_getter(model_class, fields)(self)
+        )
 
 
 class Album(models.Model, Serializable):
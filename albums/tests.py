@@ -4,11 +4,22 @@ import pytest
 import re
 import random
 import json
+import threading
+import time
 
-from django.test.client import RequestFactory
-from django.http.response import JsonResponse
+import psycopg2
+
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import OperationalError, connection, connections
+from django.test.client import AsyncClient, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.http.response import JsonResponse, StreamingHttpResponse
 
 from .models import (
+    row_serializer,
     Album,
     AlbumGenreBridge,
     AlbumSongBridge,
@@ -18,6 +29,26 @@ from .models import (
     Song,
 )
 
+from moundmusic import cacheutils
+from moundmusic.asyncviewutils import async_view
+from moundmusic.cacheutils import (
+    DjangoResponseCache,
+    LRUResponseCache,
+    PKFilter,
+    get_pk_filter,
+    get_response_cache,
+    get_row_cache,
+)
+from moundmusic import dbrouters
+from moundmusic.dbutils import insert_model_obj, warm_pk_filters
+from moundmusic.pooled_postgresql.base import (
+    ConnectionPool,
+    DatabaseWrapper,
+    connection_stats,
+    get_pool,
+)
+from moundmusic.viewutils import encode_page_cursor, input_validators
+
 from .views import (
     index,
     single_album,
@@ -28,6 +59,7 @@ from .views import (
     single_album_artists,
     single_album_single_artist,
 )
+from genres.views import single_genre_albums
 
 request_factory = RequestFactory()
 
@@ -109,6 +141,343 @@ def test_index_post_inval_args():
     assert json_content["message"] == "value for 'title' is a string of zero length"
 
 
+@pytest.mark.django_db
+def test_index_post_bulk():
+    new_album_dicts = [
+        {
+            "title": f"Some Album {album_no}",
+            "number_of_discs": 1,
+            "number_of_tracks": 12,
+            "release_date": "1998-01-01",
+        }
+        for album_no in range(3)
+    ]
+    request = request_factory.post(
+        "/albums/", data=new_album_dicts, content_type="application/json"
+    )
+    response = index(request)
+    assert response.status_code == 201
+    json_content = json.loads(response.content)
+    assert [album_dict["title"] for album_dict in json_content] == [
+        new_album_dict["title"] for new_album_dict in new_album_dicts
+    ]
+    album_ids = [album_dict["album_id"] for album_dict in json_content]
+    assert len(set(album_ids)) == 3
+    assert Album.objects.filter(album_id__in=album_ids).count() == 3
+
+
+@pytest.mark.django_db
+def test_index_post_bulk_inval_args():
+    album_count = Album.objects.count()
+    new_album_dicts = [
+        {
+            "title": "Some Album",
+            "number_of_discs": 1,
+            "number_of_tracks": 12,
+            "release_date": "1998-01-01",
+        },
+        {"title": "", "number_of_discs": 1, "number_of_tracks": 12},
+        {"album_id": 1, "title": "Some Album"},
+    ]
+    request = request_factory.post(
+        "/albums/", data=new_album_dicts, content_type="application/json"
+    )
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "2 of 3 objects failed validation; none were inserted"
+    )
+    assert json_content["errors"] == [
+        {"index": 1, "message": "value for 'title' is a string of zero length"},
+        {
+            "index": 2,
+            "message": "a new album object must not have a album_id value",
+        },
+    ]
+    assert Album.objects.count() == album_count
+
+
+@pytest.mark.django_db
+def test_index_patch_bulk():
+    albums = list(Album.objects.order_by("album_id")[:2])
+    nonext_album_id = Album.objects.order_by("-album_id")[0].album_id + 1000
+    patch_list = [
+        {"album_id": albums[0].album_id, "title": "Some Other Album"},
+        {"album_id": nonext_album_id, "title": "Nonexistent Album"},
+        {"album_id": albums[1].album_id, "release_date": "2001-02-03"},
+    ]
+    request = request_factory.patch(
+        "/albums", data=patch_list, content_type="application/json"
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert len(captured_queries) <= 2
+    assert response.status_code == 200
+    assert json.loads(response.content) == {
+        "updated": [albums[0].album_id, albums[1].album_id],
+        "missing": [nonext_album_id],
+    }
+    first_album = Album.objects.get(album_id=albums[0].album_id)
+    assert first_album.title == "Some Other Album"
+    assert first_album.release_date == albums[0].release_date
+    second_album = Album.objects.get(album_id=albums[1].album_id)
+    assert second_album.title == albums[1].title
+    assert second_album.release_date.isoformat() == "2001-02-03"
+
+
+@pytest.mark.django_db
+def test_index_patch_bulk_inval_args():
+    album = random.choice(Album.objects.filter())
+    patch_list = [
+        {"album_id": album.album_id, "title": "Some Other Album"},
+        {"title": "No Id"},
+        {"album_id": album.album_id, "number_of_discs": 2},
+        {"album_id": album.album_id + 1, "release_date": "soon"},
+    ]
+    request = request_factory.patch(
+        "/albums", data=patch_list, content_type="application/json"
+    )
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "3 of 4 objects failed validation; none were updated"
+    )
+    assert json_content["errors"] == [
+        {"index": 1, "message": "object has no album_id value"},
+        {"index": 2, "message": f"duplicate album_id value: {album.album_id}"},
+        {
+            "index": 3,
+            "message": "value for 'release_date' isn't in format YYYY-MM-DD and "
+            + "column is a DATE",
+        },
+    ]
+    assert Album.objects.get(album_id=album.album_id).title == album.title
+
+
+@pytest.mark.django_db
+def test_index_delete_bulk():
+    album_ids = [
+        bridge_row.album_id
+        for bridge_row in AlbumSongBridge.objects.order_by("album_id").distinct(
+            "album_id"
+        )[:2]
+    ]
+    nonext_album_id = Album.objects.order_by("-album_id")[0].album_id + 1000
+    ids_param = ",".join(map(str, [album_ids[0], nonext_album_id, album_ids[1]]))
+    request = request_factory.delete(f"/albums?ids={ids_param}")
+    response = index(request)
+    assert response.status_code == 200
+    assert json.loads(response.content) == {
+        "deleted": album_ids,
+        "missing": [nonext_album_id],
+    }
+    assert not Album.objects.filter(album_id__in=album_ids).exists()
+    assert not AlbumSongBridge.objects.filter(album_id__in=album_ids).exists()
+
+
+@pytest.mark.django_db
+def test_index_delete_bulk_inval_ids():
+    request = request_factory.delete("/albums?ids=1,two")
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'ids' isn't a comma-separated list of integers greater "
+        + "than 0: 1,two"
+    )
+
+
+@pytest.mark.django_db
+def test_index_get_paged():
+    request = request_factory.get("/albums", {"limit": 5})
+    response = index(request)
+    assert response.status_code == 200
+    first_page = json.loads(response.content)
+    assert len(first_page) == 5
+    first_page_ids = [album_dict["album_id"] for album_dict in first_page]
+    assert first_page_ids == sorted(first_page_ids)
+    link_match = re.match(r'^<(.+)>; rel="next"$', response["Link"])
+    assert link_match
+    next_url = urlsplit(link_match.group(1))
+    assert next_url.path == "/albums"
+    request = request_factory.get(f"{next_url.path}?{next_url.query}")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert response.status_code == 200
+    second_page = json.loads(response.content)
+    assert len(second_page) == 5
+    assert second_page[0]["album_id"] > first_page_ids[-1]
+    assert all(
+        "OFFSET" not in query_dict["sql"]
+        for query_dict in captured_queries.captured_queries
+    )
+
+
+@pytest.mark.django_db
+def test_index_get_last_page():
+    album_ids = sorted(album.album_id for album in Album.objects.filter())
+    request = request_factory.get(
+        "/albums", {"limit": 1, "after": encode_page_cursor(album_ids[-2])}
+    )
+    response = index(request)
+    json_content = json.loads(response.content)
+    assert [album_dict["album_id"] for album_dict in json_content] == album_ids[-1:]
+    assert "Link" not in response
+
+
+@pytest.mark.django_db
+def test_index_get_inval_limit():
+    request = request_factory.get("/albums", {"limit": "0"})
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'limit' isn't an integer between 1 and 1000: 0"
+    )
+
+
+@pytest.mark.django_db
+def test_index_get_inval_cursor():
+    request = request_factory.get("/albums", {"after": "not a cursor"})
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'after' isn't a valid cursor: not a cursor"
+    )
+
+
+@pytest.mark.django_db
+def test_index_get_fields():
+    request = request_factory.get("/albums", {"fields": "album_id,title", "limit": 5})
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert response.status_code == 200
+    json_content = json.loads(response.content)
+    assert len(json_content) == 5
+    assert all(set(album_dict) == {"album_id", "title"} for album_dict in json_content)
+    assert "release_date" not in captured_queries[0]["sql"]
+    assert "fields=album_id%2Ctitle" in response["Link"]
+
+
+@pytest.mark.django_db
+def test_index_get_inval_fields():
+    request = request_factory.get("/albums", {"fields": "title,not_a_column"})
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'fields' isn't a comma-separated list of album properties: "
+        + "title,not_a_column"
+    )
+
+
+@pytest.mark.django_db
+def test_row_serializer():
+    album = random.choice(Album.objects.filter())
+    columns = tuple(Album.__columns__.keys())
+    row = Album.objects.filter(album_id=album.album_id).values_list(*columns)[0]
+    assert row_serializer(Album)(row) == album.serialize()
+    assert row_serializer(Album, ("title",))(row[1:]) == {"title": album.title}
+
+
+def test_input_validator_validate_many():
+    validator = input_validators[Album]
+    validated_list, errors = validator.validate_many(
+        [
+            {"title": "Some Album", "number_of_discs": "2", "album_id": None},
+            {"title": "", "number_of_discs": 1},
+            "not an object",
+            {"number_of_tracks": 0},
+        ]
+    )
+    assert validated_list == [
+        {"title": "Some Album", "number_of_discs": 2, "album_id": None}
+    ]
+    assert errors == [
+        {"index": 1, "message": "value for 'title' is a string of zero length"},
+        {"index": 2, "message": "array element isn't a JSON object"},
+        {"index": 3, "message": "value for 'number_of_tracks' isn't greater than 0: 0"},
+    ]
+
+
+@pytest.mark.django_db
+def test_index_get_stream():
+    request = request_factory.get("/albums", {"stream": "1"})
+    response = index(request)
+    assert isinstance(response, StreamingHttpResponse)
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = b"".join(response.streaming_content).splitlines()
+    assert len(lines) == Album.objects.count()
+    album_ids = [json.loads(line)["album_id"] for line in lines]
+    assert album_ids == sorted(album_ids)
+
+
+@pytest.mark.django_db
+def test_index_get_stream_accept_header():
+    request = request_factory.get(
+        "/albums", {"limit": 3}, HTTP_ACCEPT="application/x-ndjson"
+    )
+    response = index(request)
+    assert isinstance(response, StreamingHttpResponse)
+    assert response.status_code == 200
+    lines = b"".join(response.streaming_content).splitlines()
+    assert len(lines) == 3
+    sample_album_jsobject = json.loads(lines[0])
+    assert "title" in sample_album_jsobject
+    assert matches_date_isoformat(sample_album_jsobject["release_date"])
+
+
+# This test doesn't run inside a transaction: the POSTs are issued from
+# several threads at once, each with its own database connection, so
+# that their INSERTs genuinely race. The rows it creates are deleted
+# afterwards.
+def test_index_post_concurrent(django_db_setup, django_db_blocker):
+    request_count = 8
+    barrier = threading.Barrier(request_count)
+    responses = list()
+
+    def post_album(album_no):
+        try:
+            new_album_dict = {
+                "title": f"Concurrent Album {album_no}",
+                "number_of_discs": 1,
+                "number_of_tracks": 10,
+                "release_date": "2001-01-01",
+            }
+            request = request_factory.post(
+                "/albums/", data=new_album_dict, content_type="application/json"
+            )
+            barrier.wait()
+            responses.append(index(request))
+        finally:
+            connection.close()
+
+    with django_db_blocker.unblock():
+        threads = [
+            threading.Thread(target=post_album, args=(album_no,))
+            for album_no in range(request_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        album_ids = [
+            json.loads(response.content)["album_id"]
+            for response in responses
+            if response.status_code == 201
+        ]
+        try:
+            assert len(album_ids) == request_count
+            assert len(set(album_ids)) == request_count
+            assert Album.objects.filter(album_id__in=album_ids).count() == request_count
+        finally:
+            Album.objects.filter(album_id__in=album_ids).delete()
+            connection.close()
+
+
 @pytest.mark.django_db
 def test_album_get():
     new_album_dict = {
@@ -117,14 +486,7 @@ def test_album_get():
         "number_of_tracks": 12,
         "release_date": "1998-01-01",
     }
-    # This handles a bug where attempting to save a new model class
-    # object yields an IntegrityError that claims a pre-existing primary
-    # key column value was used. This when no primary key column value
-    # was set. (This bug is likely in pytest-django, not psycopg2.) This
-    # workaround pre-determines the next primary key column value.
-    max_album_id = max(album.album_id for album in Album.objects.filter())
-    album = Album(album_id=max_album_id, **new_album_dict)
-    album.save()
+    album = insert_model_obj(Album, **new_album_dict)
     album_id = album.album_id
     request = request_factory.get(f"/albums/{album_id}")
     response = single_album(request, album_id)
@@ -137,6 +499,110 @@ def test_album_get():
     assert json_content["album_id"] == album.album_id
 
 
+@pytest.mark.django_db
+def test_album_get_fields():
+    album = random.choice(Album.objects.filter())
+    request = request_factory.get(
+        f"/albums/{album.album_id}", {"fields": "release_date,title"}
+    )
+    response = single_album(request, album.album_id)
+    json_content = json.loads(response.content)
+    assert list(json_content) == ["title", "release_date"]
+    assert json_content["title"] == album.title
+    # The properties come out in the same order however they're listed,
+    # with the same ETag.
+    request = request_factory.get(
+        f"/albums/{album.album_id}", {"fields": "title,release_date,title"}
+    )
+    reordered_response = single_album(request, album.album_id)
+    assert reordered_response.content == response.content
+    assert reordered_response["ETag"] == response["ETag"]
+
+
+@pytest.mark.django_db
+def test_album_get_include():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(
+        f"/albums/{album_id}", {"include": "songs,artists,genres"}
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request, album_id)
+    assert len(captured_queries) == 4
+    json_content = json.loads(response.content)
+    assert json_content["album_id"] == album_id
+    songs_response = single_album_songs(
+        request_factory.get(f"/albums/{album_id}/songs"), album_id
+    )
+    if songs_response.status_code == 200:
+        assert json_content["songs"] == json.loads(songs_response.content)
+    else:
+        assert json_content["songs"] == dict()
+    artist_ids = set(
+        ArtistAlbumBridge.objects.filter(album_id=album_id).values_list(
+            "artist_id", flat=True
+        )
+    )
+    assert {artist["artist_id"] for artist in json_content["artists"]} == artist_ids
+    genre_ids = set(
+        AlbumGenreBridge.objects.filter(album_id=album_id).values_list(
+            "genre_id", flat=True
+        )
+    )
+    assert {genre["genre_id"] for genre in json_content["genres"]} == genre_ids
+
+
+@pytest.mark.django_db
+def test_album_get_inval_include():
+    album = random.choice(Album.objects.filter())
+    request = request_factory.get(
+        f"/albums/{album.album_id}", {"include": "songs,lyrics"}
+    )
+    response = single_album(request, album.album_id)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'include' isn't a comma-separated list of album relations "
+        + "(artists, genres, songs): songs,lyrics"
+    )
+
+
+@pytest.mark.django_db
+def test_album_get_etag(no_caches):
+    album = insert_model_obj(
+        Album,
+        title="Some Album",
+        number_of_discs=1,
+        number_of_tracks=10,
+        release_date="1998-01-01",
+    )
+    album_id = album.album_id
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    etag = response["ETag"]
+    request = request_factory.get(f"/albums/{album_id}", HTTP_IF_NONE_MATCH=etag)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request, album_id)
+    assert len(captured_queries) == 1
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    assert response.content == b""
+    # An UPDATE that doesn't change the row leaves its version alone.
+    album.save()
+    assert single_album(request, album_id).status_code == 304
+    album.title = "Some Other Album"
+    album.save()
+    response = single_album(request, album_id)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert json.loads(response.content)["title"] == "Some Other Album"
+    request = request_factory.get(
+        f"/albums/{album_id}", {"include": "genres"}, HTTP_IF_NONE_MATCH="*"
+    )
+    response = single_album(request, album_id)
+    assert response.status_code == 200
+    assert "ETag" not in response
+
+
 @pytest.mark.django_db
 def test_album_get_nonext_id():
     albums = Album.objects.filter()
@@ -163,14 +629,7 @@ def test_album_patch():
         "number_of_tracks": 12,
         "release_date": "1998-01-01",
     }
-    # This handles a bug where attempting to save a new model class
-    # object yields an IntegrityError that claims a pre-existing primary
-    # key column value was used. This when no primary key column value
-    # was set. (This bug is likely in pytest-django, not psycopg2.) This
-    # workaround pre-determines the next primary key column value.
-    max_album_id = max(album.album_id for album in Album.objects.filter())
-    album = Album(album_id=max_album_id + 1, **new_album_dict)
-    album.save()
+    album = insert_model_obj(Album, **new_album_dict)
     album_id = album.album_id
     album_patch_dict = {"title": "Some Other Album"}
     request = request_factory.patch(
@@ -287,6 +746,155 @@ def test_album_songs_get():
     )
 
 
+# Each ?fields= narrowing of a row is a different body, so it has an
+# ETag of its own; the full body's ETag doesn't match it, nor the other
+# way around.
+@pytest.mark.django_db
+def test_album_get_etag_fields(no_caches):
+    album_id = Album.objects.order_by("album_id").first().album_id
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    full_etag = response["ETag"]
+    request = request_factory.get(
+        f"/albums/{album_id}", {"fields": "title"}, HTTP_IF_NONE_MATCH=full_etag
+    )
+    response = single_album(request, album_id)
+    assert response.status_code == 200
+    assert list(json.loads(response.content)) == ["title"]
+    fields_etag = response["ETag"]
+    assert fields_etag != full_etag
+    request = request_factory.get(
+        f"/albums/{album_id}", {"fields": "title"}, HTTP_IF_NONE_MATCH=fields_etag
+    )
+    assert single_album(request, album_id).status_code == 304
+    request = request_factory.get(f"/albums/{album_id}", HTTP_IF_NONE_MATCH=fields_etag)
+    assert single_album(request, album_id).status_code == 200
+    response = index(request_factory.get("/albums/", {"limit": "5"}))
+    request = request_factory.get(
+        "/albums/",
+        {"limit": "5", "fields": "title"},
+        HTTP_IF_NONE_MATCH=response["ETag"],
+    )
+    assert index(request).status_code == 200
+
+
+@pytest.mark.django_db
+def test_index_get_etag(no_caches):
+    request = request_factory.get("/albums/", {"limit": "5"})
+    response = index(request)
+    etag = response["ETag"]
+    request = request_factory.get("/albums/", {"limit": "5"}, HTTP_IF_NONE_MATCH=etag)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert len(captured_queries) == 1
+    assert response.status_code == 304
+    album = Album.objects.order_by("album_id")[2]
+    album.title += " (Remastered)"
+    album.save()
+    response = index(request)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_album_genres_get_etag(no_caches):
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    response = single_album_genres(
+        request_factory.get(f"/albums/{album_id}/genres"), album_id
+    )
+    etag = response["ETag"]
+    request = request_factory.get(f"/albums/{album_id}/genres", HTTP_IF_NONE_MATCH=etag)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album_genres(request, album_id)
+    assert len(captured_queries) == 1
+    assert response.status_code == 304
+    genre_ids = AlbumGenreBridge.objects.filter(album_id=album_id).values_list(
+        "genre_id", flat=True
+    )
+    genre = Genre.objects.exclude(genre_id__in=genre_ids).order_by("?")[0]
+    bridge_row = insert_model_obj(
+        AlbumGenreBridge, album_id=album_id, genre_id=genre.genre_id
+    )
+    response = single_album_genres(request, album_id)
+    assert response.status_code == 200
+    new_etag = response["ETag"]
+    assert new_etag != etag
+    genre.genre_name += " Revival"
+    genre.save()
+    request = request_factory.get(
+        f"/albums/{album_id}/genres", HTTP_IF_NONE_MATCH=new_etag
+    )
+    assert single_album_genres(request, album_id).status_code == 200
+    bridge_row.delete()
+    request = request_factory.get(f"/albums/{album_id}/genres", HTTP_IF_NONE_MATCH=etag)
+    assert single_album_genres(request, album_id).status_code == 304
+
+
+@pytest.mark.django_db
+def test_album_genre_get_etag(no_caches):
+    bridge_row = random.choice(AlbumGenreBridge.objects.filter())
+    album_id, genre_id = bridge_row.album_id, bridge_row.genre_id
+    url = f"/albums/{album_id}/genres/{genre_id}"
+    response = single_album_single_genre(request_factory.get(url), album_id, genre_id)
+    etag = response["ETag"]
+    request = request_factory.get(url, HTTP_IF_NONE_MATCH=f"W/{etag}")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album_single_genre(request, album_id, genre_id)
+    assert len(captured_queries) == 1
+    assert response.status_code == 304
+    genre = Genre.objects.get(genre_id=genre_id)
+    genre.genre_name += " Revival"
+    genre.save()
+    response = single_album_single_genre(request, album_id, genre_id)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
+@pytest.mark.django_db
+def test_album_songs_get_query_count():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}/songs")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album_songs(request, album_id)
+    assert len(captured_queries) == 1
+    json_content = json.loads(response.content)
+    track_count = sum(len(disc_dict) for disc_dict in json_content.values())
+    assert track_count == AlbumSongBridge.objects.filter(album_id=album_id).count()
+
+
+@pytest.mark.django_db
+def test_album_songs_get_fields():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(
+        f"/albums/{album_id}/songs", {"fields": "song_id,title"}
+    )
+    response = single_album_songs(request, album_id)
+    json_content = json.loads(response.content)
+    for disc_dict in json_content.values():
+        for track_dict in disc_dict.values():
+            assert set(track_dict) == {"song_id", "title"}
+
+
+@pytest.mark.django_db
+def test_album_songs_get_stream():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}/songs", {"stream": "1"})
+    response = single_album_songs(request, album_id)
+    assert isinstance(response, StreamingHttpResponse)
+    tracks = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert len(tracks) == AlbumSongBridge.objects.filter(album_id=album_id).count()
+    disc_track_numbers = [
+        (track["disc_number"], track["track_number"]) for track in tracks
+    ]
+    assert disc_track_numbers == sorted(disc_track_numbers)
+    assert "song_id" in tracks[0]["song"] and "title" in tracks[0]["song"]
+
+
 @pytest.mark.django_db
 def test_album_songs_get_nonext_id():
     albums = Album.objects.filter()
@@ -330,6 +938,18 @@ def test_album_song_get():
     )
 
 
+@pytest.mark.django_db
+def test_album_song_get_query_count():
+    bridge_row = random.choice(AlbumSongBridge.objects.filter())
+    album_id, song_id = bridge_row.album_id, bridge_row.song_id
+    request = request_factory.get(f"/albums/{album_id}/songs/{song_id}")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album_single_song(request, album_id, song_id)
+    assert len(captured_queries) == 1
+    json_content = json.loads(response.content)
+    assert json_content == Song.objects.get(song_id=song_id).serialize()
+
+
 @pytest.mark.django_db
 def test_album_song_get_nonext_id():
     album_ids = [album.album_id for album in Album.objects.filter()]
@@ -370,6 +990,22 @@ def test_album_genres_get():
     )
 
 
+@pytest.mark.django_db
+def test_album_genres_get_stream():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}/genres", {"stream": "1"})
+    response = single_album_genres(request, album_id)
+    assert isinstance(response, StreamingHttpResponse)
+    genre_dicts = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert sorted(genre_dict["genre_id"] for genre_dict in genre_dicts) == sorted(
+        bridge_row.genre_id
+        for bridge_row in AlbumGenreBridge.objects.filter(album_id=album_id)
+    )
+
+
 @pytest.mark.django_db
 def test_album_genres_get_nonext_id():
     albums = Album.objects.filter()
@@ -418,6 +1054,53 @@ def test_album_genres_post():
     assert any(bridge_row.genre_id == genre_id for bridge_row in bridge_rows)
 
 
+@pytest.mark.django_db
+def test_album_genres_post_many():
+    album = insert_model_obj(
+        Album,
+        title="Some Album",
+        number_of_discs=1,
+        number_of_tracks=12,
+        release_date="1998-01-01",
+    )
+    album_id = album.album_id
+    genre_ids = [genre.genre_id for genre in Genre.objects.order_by("genre_id")[:3]]
+    insert_model_obj(AlbumGenreBridge, album_id=album_id, genre_id=genre_ids[0])
+    nonext_genre_id = max(genre_ids) + 10000
+    request = request_factory.post(
+        f"/albums/{album_id}/genres",
+        data={"genre_id": [genre_ids[2], genre_ids[0], nonext_genre_id, genre_ids[1]]},
+        content_type="application/json",
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album_genres(request, album_id)
+    assert len(captured_queries) == 3
+    assert response.status_code == 200
+    assert json.loads(response.content) == {
+        "linked": [genre_ids[2], genre_ids[1]],
+        "already_linked": [genre_ids[0]],
+        "missing": [nonext_genre_id],
+    }
+    linked_genre_ids = AlbumGenreBridge.objects.filter(album_id=album_id).values_list(
+        "genre_id", flat=True
+    )
+    assert sorted(linked_genre_ids) == sorted(genre_ids)
+
+
+@pytest.mark.django_db
+def test_album_genres_post_many_inval_args():
+    album_id = random.choice(Album.objects.filter()).album_id
+    request = request_factory.post(
+        f"/albums/{album_id}/genres",
+        data={"genre_id": [1, "two"]},
+        content_type="application/json",
+    )
+    response = single_album_genres(request, album_id)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == "value for 'genre_id' isn't an integer: two"
+
+
 @pytest.mark.django_db
 def test_album_genres_post_nonext_album_id():
     album_ids = [album.album_id for album in Album.objects.filter()]
@@ -699,6 +1382,33 @@ def test_album_artists_get():
     )
 
 
+@pytest.mark.django_db
+def test_album_artists_get_query_count():
+    artist_ids = [artist.artist_id for artist in Artist.objects.all()[:10]]
+    query_counts = list()
+    for artist_count in (1, 10):
+        album = insert_model_obj(
+            Album,
+            title="Some Album",
+            number_of_discs=1,
+            number_of_tracks=12,
+            release_date="1998-01-01",
+        )
+        for artist_id in artist_ids[:artist_count]:
+            insert_model_obj(
+                ArtistAlbumBridge, album_id=album.album_id, artist_id=artist_id
+            )
+        request = request_factory.get(f"/albums/{album.album_id}/artists")
+        with CaptureQueriesContext(connection) as captured_queries:
+            response = single_album_artists(request, album.album_id)
+        json_content = json.loads(response.content)
+        assert [artist["artist_id"] for artist in json_content] == sorted(
+            artist_ids[:artist_count]
+        )
+        query_counts.append(len(captured_queries))
+    assert query_counts[0] == query_counts[1] == 2
+
+
 @pytest.mark.django_db
 def test_album_artists_get_nonext_id():
     albums = Album.objects.filter()
@@ -923,3 +1633,720 @@ def test_album_artist_delete_not_assoc():
         f"album with album_id={album_id} not associated with artist with "
         + f"artist_id={artist_id}"
     )
+
+
+@pytest.mark.django_db
+def test_album_get_cached():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}")
+    first_response = single_album(request, album_id)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request, album_id)
+    assert len(captured_queries) == 0
+    assert response.status_code == 200
+    assert response.content == first_response.content
+    assert response["ETag"] == first_response["ETag"]
+    request = request_factory.get(
+        f"/albums/{album_id}", HTTP_IF_NONE_MATCH=first_response["ETag"]
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request, album_id)
+    assert len(captured_queries) == 0
+    assert response.status_code == 304
+    request = request_factory.patch(
+        f"/albums/{album_id}",
+        data={"title": "Some Other Album"},
+        content_type="application/json",
+    )
+    single_album(request, album_id)
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert json.loads(response.content)["title"] == "Some Other Album"
+    assert get_response_cache().stats()["stale"] == 1
+
+
+@pytest.mark.django_db
+def test_index_get_cached():
+    request = request_factory.get("/albums/", {"limit": "5"})
+    index(request)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert len(captured_queries) == 0
+    assert "Link" in response
+    album_id = json.loads(response.content)[0]["album_id"]
+    response = index(request_factory.delete(f"/albums/?ids={album_id}"))
+    assert json.loads(response.content)["deleted"] == [album_id]
+    response = index(request_factory.get("/albums/", {"limit": "5"}))
+    assert album_id not in [album["album_id"] for album in json.loads(response.content)]
+
+
+@pytest.mark.django_db
+def test_album_genres_get_cached():
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}/genres")
+    single_album_genres(request, album_id)
+    with CaptureQueriesContext(connection) as captured_queries:
+        single_album_genres(request, album_id)
+    assert len(captured_queries) == 0
+    # Linking the two from the genre's side invalidates the album's list.
+    genre_ids = AlbumGenreBridge.objects.filter(album_id=album_id).values_list(
+        "genre_id", flat=True
+    )
+    genre_id = Genre.objects.exclude(genre_id__in=genre_ids).order_by("?")[0].genre_id
+    single_genre_albums(
+        request_factory.post(
+            f"/genres/{genre_id}/albums",
+            data={"album_id": album_id},
+            content_type="application/json",
+        ),
+        genre_id,
+    )
+    response = single_album_genres(request, album_id)
+    assert genre_id in [genre["genre_id"] for genre in json.loads(response.content)]
+
+
+@pytest.mark.django_db
+def test_album_get_cached_django_backend(settings):
+    settings.RESPONSE_CACHE = {"BACKEND": "django", "CACHE_ALIAS": "default"}
+    get_response_cache().clear()
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    request = request_factory.get(f"/albums/{album_id}")
+    single_album(request, album_id)
+    with CaptureQueriesContext(connection) as captured_queries:
+        single_album(request, album_id)
+    assert len(captured_queries) == 0
+    request = request_factory.delete(f"/albums/{album_id}")
+    single_album(request, album_id)
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert response.status_code == 404
+    stats = get_response_cache().stats()
+    assert stats["backend"] == "django"
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (1, 2, 1)
+
+
+# The django cache may hold other things than responses and rows, so
+# clearing the response cache and the row cache only makes their own
+# entries unreachable.
+@pytest.mark.django_db
+def test_django_backend_clear(settings):
+    settings.RESPONSE_CACHE = {"BACKEND": "django", "CACHE_ALIAS": "default"}
+    caches["default"].set("other", "kept")
+    album_id = Album.objects.order_by("album_id").first().album_id
+    request = request_factory.get(f"/albums/{album_id}")
+    single_album(request, album_id)
+    get_response_cache().clear()
+    get_row_cache().clear()
+    with CaptureQueriesContext(connection) as captured_queries:
+        single_album(request, album_id)
+    assert len(captured_queries) == 1
+    assert caches["default"].get("other") == "kept"
+
+
+def test_lru_response_cache():
+    response_cache = LRUResponseCache(max_entries=2)
+    for cache_key in ("a", "b", "c"):
+        tag_versions = response_cache.tag_versions([cache_key])
+        response_cache.store(cache_key, tag_versions, b"{}", {})
+    assert response_cache.lookup("a", ["a"]) is None
+    assert response_cache.lookup("b", ["b"]) == (b"{}", {}, False)
+    response_cache.bump_tags(["b"])
+    assert response_cache.lookup("b", ["b"]) is None
+    stats = response_cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 2
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_lru_response_cache_windows(monkeypatch):
+    response_cache = LRUResponseCache(
+        max_entries=10,
+        families={"single": {"FRESH": 10, "STALE": 100, "SLOW_QUERY_SECONDS": 0.5}},
+    )
+    now = [1000.0]
+    monkeypatch.setattr(cacheutils.time, "time", lambda: now[0])
+    tag_versions = response_cache.tag_versions(["a"])
+    response_cache.store("a", tag_versions, b"{}", {}, "single")
+    now[0] += 5
+    assert response_cache.lookup("a", ["a"], "single") == (b"{}", {}, False)
+    now[0] += 50
+    assert response_cache.lookup("a", ["a"], "single") == (b"{}", {}, True)
+    # A family with no windows serves it until it's invalidated.
+    assert response_cache.lookup("a", ["a"], "index") == (b"{}", {}, False)
+    response_cache.bump_tags(["a"])
+    assert response_cache.lookup("a", ["a"], "single") is None
+    assert response_cache.lookup(
+        "a", ["a"], "single", lambda threshold: threshold < 1
+    ) == (b"{}", {}, True)
+    now[0] += 100
+    assert response_cache.lookup("a", ["a"], "single", lambda threshold: True) is None
+    stats = response_cache.stats()
+    assert stats["stale_serves"] == 2
+    assert stats["slow_db_stale_serves"] == 1
+    assert stats["stale"] == 2
+
+
+@pytest.mark.django_db
+def test_album_get_stale_while_revalidate(settings):
+    settings.RESPONSE_CACHE = {
+        "BACKEND": "lru",
+        "FAMILIES": {"single": {"FRESH": 0, "STALE": 3600}},
+    }
+    album = random.choice(Album.objects.filter())
+    album_id = album.album_id
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    with CaptureQueriesContext(connection) as captured_queries:
+        stale_response = single_album(
+            request_factory.get(f"/albums/{album_id}"), album_id
+        )
+    assert len(captured_queries) == 0
+    assert stale_response.content == response.content
+    response_cache = get_response_cache()
+    response_cache.join_refreshes()
+    stats = response_cache.stats()
+    assert stats["stale_serves"] == 1
+    assert stats["refreshes"] == 1
+    assert stats["stores"] == 2
+
+
+def test_response_cache_coalesce():
+    response_cache = LRUResponseCache(max_entries=10, coalesce_timeout=5)
+    fill_started = threading.Event()
+    release_fill = threading.Event()
+    fill_calls = []
+
+    def fill():
+        fill_calls.append(None)
+        fill_started.set()
+        release_fill.wait(5)
+        return "response", (200, b"{}", {})
+
+    results = []
+    filling_thread = threading.Thread(
+        target=lambda: results.append(response_cache.coalesce(("a", (0,)), fill))
+    )
+    filling_thread.start()
+    fill_started.wait(5)
+    waiting_threads = [
+        threading.Thread(
+            target=lambda: results.append(response_cache.coalesce(("a", (0,)), fill))
+        )
+        for _ in range(4)
+    ]
+    for waiting_thread in waiting_threads:
+        waiting_thread.start()
+    while response_cache.stats()["coalesced"] < 4:
+        threading.Event().wait(0.01)
+    # A request that read other tag versions isn't coalesced onto it.
+    assert response_cache.coalesce(("a", (1,)), lambda: ("other", None)) == (
+        "other",
+        None,
+    )
+    release_fill.set()
+    for thread in [filling_thread] + waiting_threads:
+        thread.join()
+    assert len(fill_calls) == 1
+    assert results.count((None, (200, b"{}", {}))) == 4
+    assert results.count(("response", (200, b"{}", {}))) == 1
+
+
+# Two DjangoResponseCache objects on the same django cache stand in for
+# two processes sharing a memcached server.
+def test_response_cache_fill_lock():
+    response_cache = DjangoResponseCache("default", 300, fill_lock_timeout=5)
+    other_response_cache = DjangoResponseCache("default", 300, fill_lock_timeout=5)
+    tag_versions = response_cache.tag_versions(["a"])
+    flight_key = ("http://testserver/a", tag_versions)
+    assert response_cache.acquire_fill_lock(flight_key)
+    assert not other_response_cache.acquire_fill_lock(flight_key)
+
+    def fill():
+        threading.Event().wait(0.1)
+        response_cache.store(flight_key[0], tag_versions, b"{}", {})
+        response_cache.release_fill_lock(flight_key)
+
+    filling_thread = threading.Thread(target=fill)
+    filling_thread.start()
+    assert other_response_cache.wait_for_fill(*flight_key) == (b"{}", {})
+    filling_thread.join()
+    # Released without storing anything, eg. for a 404.
+    response_cache.bump_tags(["a"])
+    tag_versions = response_cache.tag_versions(["a"])
+    flight_key = ("http://testserver/a", tag_versions)
+    assert response_cache.acquire_fill_lock(flight_key)
+    response_cache.release_fill_lock(flight_key)
+    assert other_response_cache.wait_for_fill(*flight_key) is None
+
+
+@pytest.mark.django_db
+def test_album_get_nonext_id_pk_filter(settings):
+    # The filter only trusts its clear bits below the highest id it has
+    # seen, so the nonexistent id is one from the middle of the table.
+    first_album, last_album = Album.objects.bulk_create(
+        [
+            Album(
+                title="Some Album",
+                number_of_discs=1,
+                number_of_tracks=12,
+                release_date="1998-01-01",
+            )
+            for _ in range(2)
+        ]
+    )
+    album_id = first_album.album_id
+    first_album.delete()
+    settings.PK_FILTER = {"CATCH_UP_INTERVAL": 3600, "REBUILD_INTERVAL": 3600}
+    warm_pk_filters([Album, Song])
+    song_id = Song.objects.order_by("song_id").first().song_id
+    with CaptureQueriesContext(connection) as captured_queries:
+        album_response = single_album(
+            request_factory.get(f"/albums/{album_id}"), album_id
+        )
+        album_song_response = single_album_single_song(
+            request_factory.get(f"/albums/{album_id}/songs/{song_id}"),
+            album_id,
+            song_id,
+        )
+    assert len(captured_queries) == 0
+    for response in (album_response, album_song_response):
+        assert response.status_code == 404
+        assert json.loads(response.content) == {
+            "message": f"no album with album_id={album_id}"
+        }
+
+
+@pytest.mark.django_db
+def test_album_get_pk_filter_insert_and_delete(settings):
+    settings.PK_FILTER = {"CATCH_UP_INTERVAL": 3600, "REBUILD_INTERVAL": 3600}
+    warm_pk_filters([Album])
+    request = request_factory.post(
+        "/albums/",
+        data={
+            "title": "Some Album",
+            "number_of_discs": 1,
+            "number_of_tracks": 12,
+            "release_date": "1998-01-01",
+        },
+        content_type="application/json",
+    )
+    album_id = json.loads(index(request).content)["album_id"]
+    # The insert set the album's bit; no catch-up was needed to find it.
+    response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert response.status_code == 200
+    # Rebuilt, the filter has scanned the album's id, so once its bit is
+    # cleared the id is trusted to be absent.
+    settings.PK_FILTER = {"CATCH_UP_INTERVAL": 3600, "REBUILD_INTERVAL": 3600}
+    warm_pk_filters([Album])
+    response = single_album(request_factory.delete(f"/albums/{album_id}"), album_id)
+    assert response.status_code == 200
+    # The test's transaction never commits, so the bit is still set and
+    # the 404 comes from the database.
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert response.status_code == 404
+    assert len(captured_queries) == 1
+    get_pk_filter(Album).discard([album_id])
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert response.status_code == 404
+    assert len(captured_queries) == 0
+
+
+@pytest.mark.django_db
+def test_pk_filter_catch_up():
+    pk_filter = PKFilter(Album, 0, 3600)
+    max_album_id = Album.objects.order_by("-album_id").first().album_id
+    assert not pk_filter.definitely_absent(max_album_id)
+    assert pk_filter.definitely_absent(0)
+    # An id above the highest one scanned may have been handed out since.
+    assert not pk_filter.definitely_absent(max_album_id + 1000)
+    # Rows inserted by another process, which don't set their bits, are
+    # found by the catch-up query.
+    (new_album,) = Album.objects.bulk_create(
+        [
+            Album(
+                title="Some Album",
+                number_of_discs=1,
+                number_of_tracks=12,
+                release_date="1998-01-01",
+            )
+        ]
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        assert not pk_filter.definitely_absent(new_album.album_id)
+    assert len(captured_queries) == 1
+    assert pk_filter.stats()["present"] == Album.objects.count()
+
+
+# Between catch-ups, an id above the ones scanned is maybe present, not
+# absent, since another process may have just inserted it.
+@pytest.mark.django_db
+def test_pk_filter_between_catch_ups():
+    pk_filter = PKFilter(Album, 3600, 3600)
+    pk_filter.warm()
+    (new_album,) = Album.objects.bulk_create(
+        [
+            Album(
+                title="Some Album",
+                number_of_discs=1,
+                number_of_tracks=12,
+                release_date="1998-01-01",
+            )
+        ]
+    )
+    with CaptureQueriesContext(connection) as captured_queries:
+        assert not pk_filter.definitely_absent(new_album.album_id)
+        assert not pk_filter.definitely_absent(new_album.album_id + 1000)
+    assert len(captured_queries) == 0
+    assert pk_filter.stats()["catch_ups"] == 0
+
+
+# A rebuild that's due runs in the background; until it's done, the old
+# bitmap goes on answering, without the request waiting on a query.
+@pytest.mark.django_db
+def test_pk_filter_background_rebuild():
+    pk_filter = PKFilter(Album, 3600, 3600)
+    pk_filter.warm()
+    album_id = Album.objects.order_by("album_id").first().album_id
+    pk_filter.discard([album_id])
+    pk_filter.rebuild_interval = 0
+    # Held, so the rebuild can't finish before the old bitmap answers.
+    with pk_filter._scan_lock:
+        with CaptureQueriesContext(connection) as captured_queries:
+            assert pk_filter.definitely_absent(album_id)
+        assert len(captured_queries) == 0
+    pk_filter.join_rebuild()
+    pk_filter.rebuild_interval = 3600
+    assert not pk_filter.definitely_absent(album_id)
+    assert pk_filter.stats()["present"] == Album.objects.count()
+
+
+# An id handed out before a catch-up to a transaction that commits after
+# it isn't trusted to be absent until that transaction has ended. Like
+# test_index_post_concurrent(), this test doesn't run inside a
+# transaction, since the pending one has to be seen from outside it; the
+# row it commits is deleted afterwards.
+def test_pk_filter_pending_insert(django_db_setup, django_db_blocker):
+    insert_sql = (
+        "INSERT INTO album (title, number_of_discs, number_of_tracks, "
+        + "release_date) VALUES ('Some Album', 1, 12, '1998-01-01') "
+        + "RETURNING album_id;"
+    )
+    with django_db_blocker.unblock():
+        pk_filter = PKFilter(Album, 0, 3600)
+        pk_filter.warm()
+        other_connection = connection.copy()
+        other_connection.set_autocommit(False)
+        later_album_id = None
+        try:
+            with other_connection.cursor() as cursor:
+                cursor.execute(insert_sql)
+                (pending_album_id,) = cursor.fetchone()
+            with connection.cursor() as cursor:
+                cursor.execute(insert_sql)
+                (later_album_id,) = cursor.fetchone()
+            assert later_album_id > pending_album_id
+            assert not pk_filter.definitely_absent(later_album_id)
+            assert not pk_filter.definitely_absent(pending_album_id)
+            other_connection.rollback()
+            # Once it has ended, the next catch-up settles the ids it saw.
+            assert not pk_filter.definitely_absent(later_album_id + 1)
+            assert pk_filter.definitely_absent(pending_album_id)
+        finally:
+            other_connection.rollback()
+            other_connection.close()
+            if later_album_id is not None:
+                Album.objects.filter(album_id=later_album_id).delete()
+            connection.close()
+
+
+# The async counterpart fetches the object and its included relations
+# at the same time; the result is the same.
+@pytest.mark.django_db
+def test_async_album_get_include():
+    album_id = AlbumSongBridge.objects.order_by("album_id").first().album_id
+    request = request_factory.get(
+        f"/albums/{album_id}", {"include": "songs,artists,genres"}
+    )
+    response = async_to_sync(async_view(single_album))(request, album_id)
+    assert response.status_code == 200
+    assert json.loads(response.content) == json.loads(
+        single_album(request, album_id).content
+    )
+    album_id = Album.objects.order_by("-album_id").first().album_id + 1000
+    request = request_factory.get(f"/albums/{album_id}", {"include": "songs"})
+    response = async_to_sync(async_view(single_album))(request, album_id)
+    assert response.status_code == 404
+    assert json.loads(response.content) == {
+        "message": f"no album with album_id={album_id}"
+    }
+
+
+# The ASGI app serves moundmusic.asgi_urls, where every endpoint is
+# wrapped in its async counterpart; the entries of a batch it serves
+# still have to run.
+@pytest.mark.django_db
+def test_async_batch(settings):
+    settings.ROOT_URLCONF = "moundmusic.asgi_urls"
+    album_id = Album.objects.order_by("album_id").first().album_id
+    batch_entries = [
+        {"method": "GET", "path": f"/albums/{album_id}"},
+        {"method": "GET", "path": "/batch"},
+    ]
+
+    async def post_batch():
+        return await AsyncClient().post(
+            "/batch", data=batch_entries, content_type="application/json"
+        )
+
+    response = async_to_sync(post_batch)()
+    assert response.status_code == 200
+    results = json.loads(response.content)
+    assert [result["status"] for result in results] == [200, 400]
+    album_response = single_album(request_factory.get(f"/albums/{album_id}"), album_id)
+    assert results[0]["body"] == json.loads(album_response.content)
+
+
+# Ends the postgres session behind a psycopg2 connection, as a server
+# restart or an idle timeout would, and waits for it to end.
+def terminate_backend(conn):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_terminate_backend(%s, 5000)", [conn.get_backend_pid()]
+        )
+
+
+def test_connection_pool():
+    conn_params = connection.get_connection_params()
+
+    def connect():
+        return psycopg2.connect(**conn_params)
+
+    pool = ConnectionPool(min_size=1, max_size=2, checkout_timeout=0.2)
+    pool.warm(connect)
+    assert pool.stats()["idle"] == 1
+    first_conn = pool.checkout(connect)
+    second_conn = pool.checkout(connect)
+    stats = pool.stats()
+    assert (stats["open"], stats["in_use"], stats["saturation"]) == (2, 2, 1.0)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.checkout(connect)
+    assert pool.stats()["timeouts"] == 1
+    # A connection given back while a checkout waits goes to it.
+    threading.Timer(0.05, pool.checkin, [first_conn]).start()
+    assert pool.checkout(connect) is first_conn
+    stats = pool.stats()
+    assert stats["waits"] == 1
+    assert stats["max_wait_seconds"] >= 0.05
+    for conn in (first_conn, second_conn):
+        pool.checkin(conn)
+    pool.close_idle()
+    assert pool.stats()["open"] == 0
+
+
+# A pooled connection that's been idle for more than HEALTH_CHECK_IDLE
+# seconds and no longer answers is replaced on checkout.
+@pytest.mark.django_db
+def test_connection_pool_health_check():
+    conn_params = connection.get_connection_params()
+
+    def connect():
+        return psycopg2.connect(**conn_params)
+
+    pool = ConnectionPool(max_size=1, health_check_idle=0)
+    idle_conn = pool.checkout(connect)
+    pool.checkin(idle_conn)
+    terminate_backend(idle_conn)
+    health_check_failures = connection_stats()["health_check_failures"]
+    conn = pool.checkout(connect)
+    assert conn is not idle_conn
+    assert connection_stats()["health_check_failures"] == health_check_failures + 1
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    pool.checkin(conn)
+    pool.close_idle()
+
+
+# Threads share the pool's connections: one given back at the end of a
+# request is the next one checked out, and a checkout past MAX_SIZE
+# times out as django's OperationalError.
+@pytest.mark.django_db
+def test_pooled_database_wrapper():
+    settings_dict = dict(
+        connection.settings_dict, POOL={"MAX_SIZE": 1, "CHECKOUT_TIMEOUT": 0.1}
+    )
+    first_wrapper = DatabaseWrapper(settings_dict, alias="pool_test")
+    second_wrapper = DatabaseWrapper(settings_dict, alias="pool_test")
+    assert first_wrapper.pool is second_wrapper.pool
+    first_wrapper.ensure_connection()
+    pooled_conn = first_wrapper.connection
+    with pytest.raises(OperationalError):
+        second_wrapper.ensure_connection()
+    first_wrapper.close_if_unusable_or_obsolete()
+    assert first_wrapper.connection is None
+    second_wrapper.ensure_connection()
+    assert second_wrapper.connection is pooled_conn
+    with second_wrapper.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    stats = connection_stats()["pools"]["pool_test"]
+    assert (stats["checkouts"], stats["timeouts"], stats["saturation"]) == (2, 1, 1.0)
+    second_wrapper.close()
+    get_pool("pool_test", {}).close_idle()
+
+
+# A kept connection that's been idle for more than HEALTH_CHECK_IDLE
+# seconds is checked when the next request starts, and closed, to be
+# reopened by the first query, if it doesn't answer.
+@pytest.mark.django_db
+def test_kept_connection_health_check():
+    settings_dict = dict(
+        connection.settings_dict, CONN_MAX_AGE=60, HEALTH_CHECK_IDLE=0, POOL=None
+    )
+    wrapper = DatabaseWrapper(settings_dict, alias="kept_test")
+    wrapper.ensure_connection()
+    wrapper.released_at = time.monotonic() - 1
+    wrapper.check_kept_connection()
+    assert wrapper.connection is not None
+    terminate_backend(wrapper.connection)
+    wrapper.check_kept_connection()
+    assert wrapper.connection is None
+    with wrapper.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    wrapper.close()
+
+
+# A GET reads from the read replica; the primary isn't queried.
+def test_replica_reads_get(read_replica, no_caches):
+    album_id = Album.objects.order_by("album_id").first().album_id
+    request = request_factory.get(f"/albums/{album_id}")
+    with CaptureQueriesContext(connection) as primary_queries:
+        with CaptureQueriesContext(connections[read_replica]) as replica_queries:
+            response = single_album(request, album_id)
+    assert response.status_code == 200
+    assert json.loads(response.content)["album_id"] == album_id
+    assert len(primary_queries) == 0
+    assert any("album_id" in query["sql"] for query in replica_queries)
+    assert dbrouters.routing_stats()["lag_seconds"][read_replica] == 0
+    # So does an endpoint function that only handles GET.
+    request = request_factory.get(f"/albums/{album_id}/songs")
+    with CaptureQueriesContext(connection) as primary_queries:
+        with CaptureQueriesContext(connections[read_replica]) as replica_queries:
+            response = single_album_songs(request, album_id)
+    assert response.status_code in (200, 404)
+    assert len(primary_queries) == 0
+    assert any("album_song_bridge" in query["sql"] for query in replica_queries)
+
+
+# The replica doesn't have the album a client just added, so the client
+# reads from the primary until its cookie expires; another client reads
+# from the replica.
+def test_replica_reads_sticky_after_write(read_replica, no_caches):
+    request = request_factory.post(
+        "/albums/",
+        data={
+            "title": "Some Album",
+            "number_of_discs": 1,
+            "number_of_tracks": 12,
+            "release_date": "1998-01-01",
+        },
+        content_type="application/json",
+    )
+    response = index(request)
+    assert response.status_code == 201
+    album_id = json.loads(response.content)["album_id"]
+    sticky_cookie = response.cookies[dbrouters.STICKY_COOKIE_NAME]
+    assert sticky_cookie["max-age"] == 5
+    request = request_factory.get(
+        f"/albums/{album_id}",
+        HTTP_COOKIE=f"{dbrouters.STICKY_COOKIE_NAME}={sticky_cookie.value}",
+    )
+    assert single_album(request, album_id).status_code == 200
+    request = request_factory.get(f"/albums/{album_id}")
+    assert single_album(request, album_id).status_code == 404
+
+
+# A replica lagging by more than MAX_LAG_SECONDS isn't read from.
+def test_replica_lag_fallback(read_replica, no_caches, monkeypatch):
+    monkeypatch.setattr(dbrouters, "LAG_SQL", "SELECT 5.0;")
+    lag_fallbacks = dbrouters.routing_stats()["lag_fallbacks"]
+    album_id = Album.objects.order_by("album_id").first().album_id
+    request = request_factory.get(f"/albums/{album_id}")
+    with CaptureQueriesContext(connection) as primary_queries:
+        response = single_album(request, album_id)
+    assert response.status_code == 200
+    assert any("album_id" in query["sql"] for query in primary_queries)
+    stats = dbrouters.routing_stats()
+    assert stats["lag_fallbacks"] > lag_fallbacks
+    assert stats["lag_seconds"][read_replica] == 5.0
+
+
+# A request's reads all go to the one replica it picked; the next
+# request takes the other's turn.
+def test_replica_reads_one_replica_per_request(read_replicas, no_caches):
+    album_id = AlbumSongBridge.objects.order_by("album_id").first().album_id
+    request = request_factory.get(
+        f"/albums/{album_id}", {"include": "songs,artists,genres"}
+    )
+    replica_aliases = set()
+    for _ in range(2):
+        with CaptureQueriesContext(connection) as primary_queries:
+            with CaptureQueriesContext(
+                connections[read_replicas[0]]
+            ) as first_queries, CaptureQueriesContext(
+                connections[read_replicas[1]]
+            ) as second_queries:
+                response = single_album(request, album_id)
+        assert response.status_code == 200
+        assert len(primary_queries) == 0
+        # The lag queries aside, one replica ran them all.
+        read_counts = [
+            sum(query["sql"] != dbrouters.LAG_SQL for query in captured_queries)
+            for captured_queries in (first_queries, second_queries)
+        ]
+        assert sorted(read_counts)[0] == 0 and sorted(read_counts)[1] >= 4
+        replica_aliases.add(read_replicas[read_counts.index(max(read_counts))])
+    assert replica_aliases == set(read_replicas)
+
+
+# A GET reading from the replica caches what it read there. The client
+# that made a change the replica hasn't replayed isn't served that; it
+# reads its change from the primary.
+def test_replica_filled_response_cache(read_replica):
+    album = Album.objects.order_by("album_id").first()
+    album_id = album.album_id
+    request = request_factory.patch(
+        f"/albums/{album_id}",
+        data={"title": "Some Other Title"},
+        content_type="application/json",
+    )
+    response = single_album(request, album_id)
+    assert response.status_code == 200
+    sticky_cookie = response.cookies[dbrouters.STICKY_COOKIE_NAME]
+    request = request_factory.get(f"/albums/{album_id}")
+    with CaptureQueriesContext(connections[read_replica]) as replica_queries:
+        response = single_album(request, album_id)
+    assert json.loads(response.content)["title"] == album.title
+    assert len(replica_queries) > 0
+    with CaptureQueriesContext(connections[read_replica]) as replica_queries:
+        response = single_album(request, album_id)
+    assert json.loads(response.content)["title"] == album.title
+    assert len(replica_queries) == 0
+    request = request_factory.get(
+        f"/albums/{album_id}",
+        HTTP_COOKIE=f"{dbrouters.STICKY_COOKIE_NAME}={sticky_cookie.value}",
+    )
+    response = single_album(request, album_id)
+    assert json.loads(response.content)["title"] == "Some Other Title"
+
+
+# A response built from a replica is only cached for a family with a
+# freshness window, which bounds how long it's served.
+def test_replica_filled_response_cache_needs_fresh_window():
+    response_cache = LRUResponseCache(10, families={"single": {"FRESH": 60}})
+    tag_versions = response_cache.tag_versions(["a"])
+    response_cache.store("a", tag_versions, b"{}", {}, "index", from_replica=True)
+    assert response_cache.lookup("a", ["a"], "index") is None
+    response_cache.store("a", tag_versions, b"{}", {}, "single", from_replica=True)
+    assert response_cache.lookup("a", ["a"], "single") == (b"{}", {}, False)
+    assert response_cache.lookup("a", ["a"], "single", from_replica=False) is None
@@ -1,7 +1,6 @@
 #!/usr/bin/python3
 
-from operator import itemgetter
-
+from django.conf import settings
 from django.http.response import JsonResponse
 
 from rest_framework import status
@@ -17,11 +16,19 @@ from .models import (
     ArtistAlbumBridge,
 )
 
+from moundmusic.cacheutils import link_tag, row_tag, table_tag
 from moundmusic.viewutils import (
     index_defclo,
     single_model_defclo,
     outer_id_inner_list_defclo,
     outer_id_inner_id_defclo,
+    cached_get_response,
+    replica_get_response,
+    stream_requested,
+    ndjson_streaming_response,
+    validate_fields_param,
+    narrow_queryset,
+    bridge_include_loader,
 )
 
 
@@ -34,40 +41,120 @@ from moundmusic.viewutils import (
 index = index_defclo(Album, "album_id")
 
 
+# Returns the album_song_bridge rows for an album, each with its song
+# object, in one query that joins album_song_bridge to song and has the
+# database order it by disc_number and track_number, which the composite
+# index idx_album_song_bridge_album_id_disc_number_track_number covers.
+def album_tracklist_queryset(album_id, fields=None):
+    return narrow_queryset(
+        AlbumSongBridge.objects.filter(album_id=album_id)
+        .select_related("song")
+        .order_by("disc_number", "track_number"),
+        fields,
+        related_name="song",
+        keep_fields=("disc_number", "track_number"),
+    )
+
+
+# songs are organized by disc number and track number, so it makes
+# sense to structure the output into an object with properties named
+# disc_{number} pointing to objects with properties named track_{number}
+# pointing to the track objects.
+def serialize_tracklist(bridge_rows, fields=None):
+    return_struct = dict()
+    for bridge_row in bridge_rows:
+        disc_key = "disc_%i" % bridge_row.disc_number
+        track_key = "track_%i" % bridge_row.track_number
+        disc_struct = return_struct.setdefault(disc_key, dict())
+        disc_struct[track_key] = bridge_row.song.serialize(fields)
+    return return_struct
+
+
 # GET,PATCH,DELETE /albums/<album_id>/
-single_album = single_model_defclo(Album, "album_id")
+#
+# GET accepts ?include=songs,artists,genres to embed those collections
+# in the album object, in the same form the matching
+# /albums/<album_id>/<relation> endpoints return them.
+single_album = single_model_defclo(
+    Album,
+    "album_id",
+    includes={
+        "songs": lambda album_id: serialize_tracklist(
+            album_tracklist_queryset(album_id)
+        ),
+        "artists": bridge_include_loader(
+            "album_id", Artist, "artist_id", ArtistAlbumBridge
+        ),
+        "genres": bridge_include_loader(
+            "album_id", Genre, "genre_id", AlbumGenreBridge
+        ),
+    },
+)
 
 
 # GET /albums/<album_id>/songs
+#
+# It's served through the response cache; the tracklist changes with
+# the album, with its album_song_bridge rows, and with any of the songs.
+# Like the other GETs, it reads from the read replicas if there are any.
 @api_view(["GET"])
-def single_album_songs(_, outer_model_obj_id):
-    bridge_rows = AlbumSongBridge.objects.filter(album_id=outer_model_obj_id)
-    if not len(bridge_rows):
+def single_album_songs(request, outer_model_obj_id):
+    return replica_get_response(
+        request,
+        lambda: cached_get_response(
+            request,
+            "association",
+            [
+                row_tag(Album, outer_model_obj_id),
+                link_tag(AlbumSongBridge, "album_id", outer_model_obj_id),
+                table_tag(Song),
+            ],
+            lambda: single_album_songs_response(request, outer_model_obj_id),
+        ),
+    )
+
+
+def single_album_songs_response(request, outer_model_obj_id):
+    # ?fields= narrows the song objects in the tracklist.
+    result = validate_fields_param(request, Song)
+    if isinstance(result, JsonResponse):
+        return result
+    else:
+        fields = result
+
+    bridge_rows = album_tracklist_queryset(outer_model_obj_id, fields)
+
+    # The disc_{number}/track_{number} object below can't be emitted a
+    # piece at a time, so when the output is streamed each track is
+    # instead one line with disc_number and track_number properties
+    # and a song property pointing to the track object, in disc and
+    # track order.
+    if stream_requested(request):
+        if not bridge_rows.exists():
+            return JsonResponse(
+                {"message": f"no songs with album_id={outer_model_obj_id}"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return ndjson_streaming_response(
+            {
+                "disc_number": bridge_row.disc_number,
+                "track_number": bridge_row.track_number,
+                "song": bridge_row.song.serialize(fields),
+            }
+            for bridge_row in bridge_rows.iterator(
+                chunk_size=settings.STREAM_CHUNK_SIZE
+            )
+        )
+
+    bridge_rows = list(bridge_rows)
+    if not bridge_rows:
         return JsonResponse(
             {"message": f"no songs with album_id={outer_model_obj_id}"},
             status=status.HTTP_404_NOT_FOUND,
         )
-    return_struct = dict()
-
-    # songs are organized by disc number and track number, so it makes
-    # sense to structure the output into an object with properties
-    # named disc_{number} pointing to objects with properties named
-    # track_{number} pointing to the track objects.
-    rows_by_disc_and_track_numbers = {
-        (bridge_row.disc_number, bridge_row.track_number): bridge_row
-        for bridge_row in bridge_rows
-    }
-    for disc_number in map(itemgetter(0), rows_by_disc_and_track_numbers.keys()):
-        return_struct["disc_%i" % disc_number] = dict()
-    for (disc_number, track_number), bridge_row in sorted(
-        rows_by_disc_and_track_numbers.items()
-    ):
-        disc_key = "disc_%i" % disc_number
-        track_key = "track_%i" % track_number
-        return_struct[disc_key][track_key] = Song.objects.get(
-            song_id=bridge_row.song_id
-        ).serialize()
-    return JsonResponse(return_struct, status=status.HTTP_200_OK)
+    return JsonResponse(
+        serialize_tracklist(bridge_rows, fields), status=status.HTTP_200_OK
+    )
 
 
 # GET,DELETE /albums/<album_id>/songs/<song_id>
@@ -5,6 +5,7 @@ from moundmusic.viewutils import (
     single_model_defclo,
     outer_id_inner_list_defclo,
     outer_id_inner_id_defclo,
+    bridge_include_loader,
 )
 
 from .models import (
@@ -28,7 +29,23 @@ index = index_defclo(Artist, "artist_id")
 
 
 # GET,PATCH,DELETE /artists/<artist_id>
-single_artist = single_model_defclo(Artist, "artist_id")
+#
+# GET accepts ?include=albums,songs,genres to embed those collections in
+# the artist object, in the same form the matching
+# /artists/<artist_id>/<relation> endpoints return them.
+single_artist = single_model_defclo(
+    Artist,
+    "artist_id",
+    includes={
+        "albums": bridge_include_loader(
+            "artist_id", Album, "album_id", ArtistAlbumBridge
+        ),
+        "songs": bridge_include_loader("artist_id", Song, "song_id", ArtistSongBridge),
+        "genres": bridge_include_loader(
+            "artist_id", Genre, "genre_id", ArtistGenreBridge
+        ),
+    },
+)
 
 
 # GET,POST /artists/<artist_id>/albums
@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+# Load-tests the WSGI launch profile (gunicorn sync workers serving
+# moundmusic.wsgi) against the ASGI one (gunicorn with uvicorn workers
+# serving moundmusic.asgi; see gunicorn_asgi.conf.py) at the same number
+# of worker processes, so at about the same memory, which is reported
+# for each. Each profile is started as a subprocess on a free port and
+# sent GETs of the user listing routes, whose async views look up the
+# user, the account and the listings at the same time, at increasing
+# concurrency. Nothing is written to the database. Run it from the base
+# directory against a seeded database:
+#
+#     python benchmarks/bench_asgi_load.py [--workers 1] [--concurrency 1 8 32 64]
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from albums.models import ToBuyListing, User  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Returns the URLs of the user listing routes for the first `count`
+# to-buy listings.
+def listing_urls(count):
+    urls = []
+    for listing in ToBuyListing.objects.order_by("to_buy_listing_id")[:count]:
+        user_id = User.objects.get(buyer_id=listing.buyer_id).user_id
+        account_url = f"/users/{user_id}/buyer_account/{listing.buyer_id}"
+        urls.append(f"{account_url}/listings")
+        urls.append(f"{account_url}/listings/{listing.to_buy_listing_id}")
+    return urls
+
+
+def start_server(profile, port, workers):
+    bind = f"127.0.0.1:{port}"
+    if profile == "wsgi":
+        command = ["gunicorn", "--bind", bind, "--workers", str(workers)]
+        command += ["moundmusic.wsgi:application"]
+    else:
+        command = ["gunicorn", "-c", "gunicorn_asgi.conf.py", "--bind", bind]
+        command += ["--workers", str(workers), "moundmusic.asgi:application"]
+    server = subprocess.Popen(
+        command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"the {profile} server didn't start")
+
+
+# The resident memory, in MiB, of the server and its worker processes.
+def server_rss(server):
+    pids = [server.pid]
+    children_path = f"/proc/{server.pid}/task/{server.pid}/children"
+    with open(children_path) as children_file:
+        pids += [int(pid) for pid in children_file.read().split()]
+    rss_kib = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    rss_kib += int(line.split()[1])
+    return rss_kib / 1024
+
+
+async def get(port, url):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(
+        f"GET {url} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_code = int(response.split(b" ", 2)[1])
+    assert status_code == 200, response[:200]
+
+
+# Sends `request_count` GETs, `concurrency` at a time, and returns the
+# requests per second and the median and 99th percentile latencies.
+async def run_load(port, urls, concurrency, request_count):
+    latencies = []
+    next_index = 0
+
+    async def client():
+        nonlocal next_index
+        while next_index < request_count:
+            url = urls[next_index % len(urls)]
+            next_index += 1
+            start_time = time.perf_counter()
+            await get(port, url)
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed_time = time.perf_counter() - start_time
+    latencies.sort()
+    return (
+        request_count / elapsed_time,
+        statistics.median(latencies),
+        latencies[int(len(latencies) * 0.99) - 1],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    urls = listing_urls(50)
+    for profile in ("wsgi", "asgi"):
+        port = free_port()
+        server = start_server(profile, port, args.workers)
+        try:
+            asyncio.run(run_load(port, urls, 8, len(urls)))
+            for concurrency in args.concurrency:
+                requests_per_second, median, p99 = asyncio.run(
+                    run_load(port, urls, concurrency, args.requests)
+                )
+                print(
+                    f"{profile}, {args.workers} worker(s), "
+                    + f"{server_rss(server):6.1f} MiB, {concurrency:>3} concurrent: "
+                    + f"{requests_per_second:7,.0f} requests/s, "
+                    + f"p50 {median * 1000:7.1f} ms, p99 {p99 * 1000:7.1f} ms"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
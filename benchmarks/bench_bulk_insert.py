@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+# Measures the throughput of bulk inserts through POST /albums (a JSON
+# array of album objects) at 1k, 10k and 100k objects per request,
+# against the one-object-per-request POST it replaces. Each request runs
+# in a transaction that's rolled back afterwards, so the database is
+# left as it was. Run it from the base directory against a seeded
+# database:
+#
+#     python benchmarks/bench_bulk_insert.py [--sizes 1000 10000 100000]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import transaction  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+
+from albums.views import index  # noqa: E402
+
+request_factory = RequestFactory()
+
+
+def album_dicts(album_count):
+    return [
+        {
+            "title": f"Bulk Album {album_no}",
+            "number_of_discs": 1,
+            "number_of_tracks": 12,
+            "release_date": "1998-01-01",
+        }
+        for album_no in range(album_count)
+    ]
+
+
+def post_albums(posted_json):
+    request = request_factory.post(
+        "/albums/", data=json.dumps(posted_json), content_type="application/json"
+    )
+    response = index(request)
+    assert response.status_code == 201, response.content
+    return response
+
+
+def time_objects_per_second(func, object_count):
+    with transaction.atomic():
+        start_time = time.perf_counter()
+        func()
+        elapsed_time = time.perf_counter() - start_time
+        transaction.set_rollback(True)
+    return object_count / elapsed_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--single-object-requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    single_count = args.single_object_requests
+    single_dicts = album_dicts(single_count)
+    rate = time_objects_per_second(
+        lambda: [post_albums(album_dict) for album_dict in single_dicts], single_count
+    )
+    print(f"{single_count:>7} objects, one per request: {rate:12,.0f} objects/s")
+    for size in args.sizes:
+        bulk_dicts = album_dicts(size)
+        rate = time_objects_per_second(lambda: post_albums(bulk_dicts), size)
+        print(f"{size:>7} objects in one request:  {rate:12,.0f} objects/s")
+
+
+if __name__ == "__main__":
+    main()
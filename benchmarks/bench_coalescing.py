@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+# Measures how many database queries a burst of identical concurrent
+# GET /albums/<album_id>/songs requests costs when the response cache
+# entry they all want has just been invalidated, at increasing
+# concurrency, with request coalescing on and off (COALESCE_TIMEOUT 0
+# has every request build its own response). With coalescing, a burst
+# should cost the same few queries however many requests are in it.
+# Nothing is written to the database; each burst is made cold by
+# invalidating the album's cache tags. Run it from the base directory
+# against a seeded database:
+#
+#     python benchmarks/bench_coalescing.py [--concurrency 1 8 32 128]
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from albums.models import Album, AlbumSongBridge  # noqa: E402
+from albums.views import single_album_songs  # noqa: E402
+from moundmusic.cacheutils import invalidate_model_objs  # noqa: E402
+
+request_factory = RequestFactory()
+
+
+# Runs one burst of `concurrency` requests, released together, and
+# returns the number of queries they ran between them.
+def run_burst(album_id, concurrency):
+    barrier = threading.Barrier(concurrency)
+    query_counts = []
+    query_counts_lock = threading.Lock()
+
+    def count_query(execute, sql, params, many, context):
+        with query_counts_lock:
+            query_counts.append(sql)
+        return execute(sql, params, many, context)
+
+    def get_songs():
+        request = request_factory.get(f"/albums/{album_id}/songs")
+        with connection.execute_wrapper(count_query):
+            barrier.wait()
+            response = single_album_songs(request, album_id)
+        assert response.status_code == 200, response.content
+        connection.close()
+
+    invalidate_model_objs(Album, [album_id])
+    threads = [threading.Thread(target=get_songs) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(query_counts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--bursts", type=int, default=20)
+    args = parser.parse_args()
+
+    album_id = (
+        AlbumSongBridge.objects.values_list("album_id", flat=True)
+        .order_by("album_id")
+        .first()
+    )
+    for coalesce_timeout, label in ((0, "off"), (30, "on")):
+        response_cache_settings = {
+            "BACKEND": "lru",
+            "COALESCE_TIMEOUT": coalesce_timeout,
+        }
+        with override_settings(RESPONSE_CACHE=response_cache_settings):
+            for concurrency in args.concurrency:
+                start_time = time.perf_counter()
+                query_count = sum(
+                    run_burst(album_id, concurrency) for _ in range(args.bursts)
+                )
+                elapsed_time = time.perf_counter() - start_time
+                print(
+                    f"coalescing {label:>3}, {concurrency:>4} concurrent: "
+                    + f"{query_count / args.bursts:8.1f} queries/burst, "
+                    + f"{concurrency * args.bursts / elapsed_time:10,.0f} requests/s"
+                )
+
+
+if __name__ == "__main__":
+    main()
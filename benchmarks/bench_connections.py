@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+# Measures the request rate of GET /albums/<album_id>, and the database
+# connections opened to serve it, with a new connection per request
+# (CONN_MAX_AGE=0, django's default), with each thread keeping its
+# connection (CONN_MAX_AGE=60), and with a connection pool shared by the
+# threads (see moundmusic.pooled_postgresql). The requests go through
+# django's WSGI handler, so connections are opened and closed, or
+# checked out and given back, as they would be under gunicorn. With the
+# pool, its mean and longest checkout waits and the most connections in
+# use at once are reported too; with more threads than --pool-size,
+# checkouts wait. The response cache is turned off so every request
+# queries the database. Nothing is written to the database. Run it from
+# the base directory against a seeded database:
+#
+#     python benchmarks/bench_connections.py [--requests 2000] [--threads 1 8]
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from albums.models import Album  # noqa: E402
+from moundmusic.dbutils import warm_database_connections  # noqa: E402
+from moundmusic.pooled_postgresql.base import connection_stats, get_pool  # noqa: E402
+
+request_factory = RequestFactory()
+handler = WSGIHandler()
+
+
+def get(album_id):
+    environ = request_factory._base_environ(
+        PATH_INFO=f"/albums/{album_id}", REQUEST_METHOD="GET"
+    )
+    response = handler(environ, lambda status, headers: None)
+    b"".join(response)
+    response.close()
+    assert response.status_code == 200
+
+
+# Sends `request_count` GETs from `thread_count` threads, each with a
+# database connection of its own (or none, between requests, with the
+# pool), and returns the requests per second.
+def run_load(album_ids, thread_count, request_count):
+    def client(thread_index):
+        for index in range(thread_index, request_count, thread_count):
+            get(album_ids[index % len(album_ids)])
+        connections.close_all()
+
+    threads = [
+        threading.Thread(target=client, args=(thread_index,))
+        for thread_index in range(thread_count)
+    ]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return request_count / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    album_ids = list(Album.objects.values_list("album_id", flat=True)[:100])
+    connections.close_all()
+    database_settings = connections.settings["default"]
+    pool_settings = {"MIN_SIZE": args.pool_size, "MAX_SIZE": args.pool_size}
+    with override_settings(RESPONSE_CACHE={"BACKEND": None}, ROW_CACHE=None):
+        for conn_max_age, pool, label in (
+            (0, None, "CONN_MAX_AGE=0 "),
+            (60, None, "CONN_MAX_AGE=60"),
+            (60, pool_settings, "pool          "),
+        ):
+            database_settings["CONN_MAX_AGE"] = conn_max_age
+            database_settings["POOL"] = pool
+            # The pool is warmed from a new thread, whose connection is
+            # made with the new settings, as the client threads' are.
+            if pool is not None:
+                warming_thread = threading.Thread(target=warm_database_connections)
+                warming_thread.start()
+                warming_thread.join()
+            for thread_count in args.threads:
+                before_stats = connection_stats()
+                requests_per_second = run_load(album_ids, thread_count, args.requests)
+                after_stats = connection_stats()
+                connects = after_stats["connects"] - before_stats["connects"]
+                report = (
+                    f"{label}, {thread_count:>2} thread(s): "
+                    + f"{requests_per_second:7,.0f} requests/s, "
+                    + f"{connects:>5,} connections opened"
+                )
+                if pool is not None:
+                    pool_stats = after_stats["pools"]["default"]
+                    before_pool_stats = before_stats["pools"]["default"]
+                    mean_wait = (
+                        pool_stats["wait_seconds"] - before_pool_stats["wait_seconds"]
+                    ) / (pool_stats["checkouts"] - before_pool_stats["checkouts"])
+                    report += (
+                        f", mean wait {mean_wait * 1000:.3f} ms"
+                        + f", max wait {pool_stats['max_wait_seconds'] * 1000:.1f} ms"
+                        + f", max in use {pool_stats['max_in_use']}"
+                        + f"/{pool_stats['max_size']}"
+                    )
+                print(report)
+    get_pool("default", pool_settings).close_idle()
+
+
+if __name__ == "__main__":
+    main()
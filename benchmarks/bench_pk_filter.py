@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+# Measures the database queries per request and the request rate of
+# GET /albums/<album_id> under a workload where most of the requested
+# ids don't exist (90% by default, as from a crawler walking the id
+# space), with the primary key filter off and on. It's run twice: with
+# the missing ids drawn from gaps in the table, made by deleting
+# --deleted albums inside a transaction that's rolled back at the end,
+# and with them drawn from past the greatest id. With the filter, gap
+# misses should cost no queries at all; ids past the greatest one it
+# has scanned may have just been inserted by another process, so those
+# misses cost a query each, as they do without it. The ids are drawn
+# from the same seeded random sequence for both runs. Run it from the
+# base directory against a seeded database:
+#
+#     python benchmarks/bench_pk_filter.py [--requests 20000] [--miss-rate 0.9]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from albums.models import Album  # noqa: E402
+from albums.views import single_album  # noqa: E402
+from moundmusic.dbutils import warm_pk_filters  # noqa: E402
+
+request_factory = RequestFactory()
+
+
+# Returns `request_count` album ids, of which about `miss_rate` are
+# drawn from `missing_ids`, and the rest from `album_ids`.
+def workload_ids(request_count, miss_rate, seed, album_ids, missing_ids):
+    rng = random.Random(seed)
+    return [
+        rng.choice(missing_ids) if rng.random() < miss_rate else rng.choice(album_ids)
+        for _ in range(request_count)
+    ]
+
+
+# Runs the requests and returns the number of queries they ran, the
+# number that were answered with a 404, and the time they took.
+def run_workload(workload):
+    query_count = 0
+    not_found_count = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal query_count
+        query_count += 1
+        return execute(sql, params, many, context)
+
+    start_time = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        for album_id in workload:
+            request = request_factory.get(f"/albums/{album_id}")
+            response = single_album(request, album_id)
+            not_found_count += response.status_code == 404
+    elapsed_time = time.perf_counter() - start_time
+    return query_count, not_found_count, elapsed_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--miss-rate", type=float, default=0.9)
+    parser.add_argument("--deleted", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with transaction.atomic():
+        all_album_ids = list(Album.objects.values_list("album_id", flat=True))
+        deleted_ids = random.Random(args.seed).sample(all_album_ids[:-1], args.deleted)
+        Album.objects.filter(album_id__in=deleted_ids).delete()
+        album_ids = sorted(set(all_album_ids) - set(deleted_ids))
+        max_album_id = max(all_album_ids)
+        for missing_ids, miss_label in (
+            (deleted_ids, "gaps"),
+            (range(max_album_id + 1, max_album_id * 10), "past"),
+        ):
+            workload = workload_ids(
+                args.requests, args.miss_rate, args.seed, album_ids, missing_ids
+            )
+            for pk_filter_settings, label in (
+                (None, "off"),
+                ({"CATCH_UP_INTERVAL": 1, "REBUILD_INTERVAL": 300}, "on"),
+            ):
+                with override_settings(PK_FILTER=pk_filter_settings):
+                    warm_pk_filters([Album])
+                    query_count, not_found_count, elapsed_time = run_workload(workload)
+                print(
+                    f"misses {miss_label}, pk filter {label:>3}: "
+                    + f"{len(workload):,} requests, "
+                    + f"{not_found_count:,} 404s, "
+                    + f"{query_count / len(workload):6.3f} queries/request, "
+                    + f"{len(workload) / elapsed_time:10,.0f} requests/s"
+                )
+        transaction.set_rollback(True)
+
+
+if __name__ == "__main__":
+    main()
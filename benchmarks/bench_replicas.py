@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+
+# Measures how much of the read load of a GET workload (single albums,
+# album song lists and pages of songs) moves from the primary to the
+# read replicas (see moundmusic.dbrouters), counting the queries each
+# database runs per request with the replicas off and on, with and
+# without the response cache. With the cache on, the responses it
+# caches are built from the replicas too, for the endpoint families with
+# a freshness window. The requests go through django's WSGI handler.
+# Nothing is written to the database. Run it from the base directory
+# against a seeded database, with the replicas listed in
+# postgres_replicas.dat (see moundmusic.settings):
+#
+#     python benchmarks/bench_replicas.py [--requests 2000]
+
+import argparse
+import os
+import sys
+import time
+
+from contextlib import ExitStack
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from albums.models import Album  # noqa: E402
+from moundmusic.cacheutils import get_response_cache, get_row_cache  # noqa: E402
+from moundmusic.settings import row_cache_settings  # noqa: E402
+from moundmusic.viewutils import encode_page_cursor  # noqa: E402
+
+request_factory = RequestFactory()
+handler = WSGIHandler()
+
+
+def get(path, query_string=""):
+    environ = request_factory._base_environ(
+        PATH_INFO=path, QUERY_STRING=query_string, REQUEST_METHOD="GET"
+    )
+    response = handler(environ, lambda status, headers: None)
+    b"".join(response)
+    response.close()
+    assert response.status_code == 200
+
+
+def workload(request_count):
+    album_ids = list(Album.objects.values_list("album_id", flat=True)[:50])
+    requests = []
+    for index in range(request_count):
+        album_id = album_ids[index % len(album_ids)]
+        requests.append(
+            (
+                (f"/albums/{album_id}", ""),
+                (f"/albums/{album_id}/songs", ""),
+                ("/songs", "limit=20&after=" + encode_page_cursor(index % 200)),
+            )[index % 3]
+        )
+    return requests
+
+
+# Runs the requests and returns the queries run on each database and the
+# time they took.
+def run_workload(requests):
+    query_counts = {alias: 0 for alias in connections}
+
+    def count_query(alias):
+        def counting_wrapper(execute, sql, params, many, context):
+            query_counts[alias] += 1
+            return execute(sql, params, many, context)
+
+        return counting_wrapper
+
+    start_time = time.perf_counter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count_query(alias)))
+        for path, query_string in requests:
+            get(path, query_string)
+    return query_counts, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    if not settings.DATABASE_REPLICAS["ALIASES"]:
+        sys.exit("no read replicas are configured; see moundmusic.settings")
+    requests = workload(args.requests)
+    for cache_settings, cache_label in (
+        ({"RESPONSE_CACHE": {"BACKEND": None}, "ROW_CACHE": None}, "cache off"),
+        (
+            {
+                "RESPONSE_CACHE": dict(settings.RESPONSE_CACHE, BACKEND="lru"),
+                "ROW_CACHE": row_cache_settings,
+            },
+            "cache on ",
+        ),
+    ):
+        for aliases, replica_label in (
+            ([], "replicas off"),
+            (settings.DATABASE_REPLICAS["ALIASES"], "replicas on "),
+        ):
+            replica_settings = dict(settings.DATABASE_REPLICAS, ALIASES=aliases)
+            with override_settings(
+                DATABASE_REPLICAS=replica_settings, **cache_settings
+            ):
+                for cache in (get_response_cache(), get_row_cache()):
+                    if cache is not None:
+                        cache.clear()
+                query_counts, elapsed_time = run_workload(requests)
+            per_request = ", ".join(
+                f"{alias} {query_count / len(requests):5.2f}"
+                for alias, query_count in query_counts.items()
+            )
+            print(
+                f"{cache_label}, {replica_label}: queries/request: {per_request}; "
+                + f"{len(requests) / elapsed_time:6,.0f} requests/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
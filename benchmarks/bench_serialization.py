@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+
+# A micro-benchmark of the list endpoints' serialization path, comparing
+# the old path (a django model object built per row, serialized by a
+# loop over __columns__ with a getattr() and an isinstance() per field)
+# with the new one (rows read as tuples, fed to the model class's
+# compiled serializer; see albums.models.row_serializer()).
+#
+# By default it times both paths over synthetic `song` rows held in
+# memory, which isolates the python overhead from the database. With
+# --db it also times both paths end-to-end over the `song` table, reading
+# it repeatedly until the row count is reached. Run it from the base
+# directory:
+#
+#     python benchmarks/bench_serialization.py [--rows 100000] [--db]
+
+import argparse
+import codecs
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from albums.models import Song, row_serializer  # noqa: E402
+
+
+# Serializable.serialize() as it was before the compiled serializers.
+def legacy_serialize(model_obj):
+    serialization = dict()
+    for column in model_obj.__columns__.keys():
+        column_value = getattr(model_obj, column)
+        if isinstance(column_value, bytes):
+            column_value = codecs.decode(column_value)
+        serialization[column] = column_value
+    return serialization
+
+
+def synthetic_song_rows(row_count):
+    return [
+        (song_id, f"Song Title {song_id}", song_id % 10, song_id % 60, song_id)
+        for song_id in range(1, row_count + 1)
+    ]
+
+
+def time_rows_per_second(func, row_count):
+    start_time = time.perf_counter()
+    func()
+    return row_count / (time.perf_counter() - start_time)
+
+
+def bench_in_memory(row_count):
+    rows = synthetic_song_rows(row_count)
+    attnames = [field.attname for field in Song._meta.concrete_fields]
+    serialize_row = row_serializer(Song)
+
+    def old_path():
+        return [
+            legacy_serialize(Song.from_db(connection.alias, attnames, row))
+            for row in rows
+        ]
+
+    def new_path():
+        return [serialize_row(row) for row in rows]
+
+    assert old_path()[:10] == new_path()[:10]
+    return time_rows_per_second(old_path, row_count), time_rows_per_second(
+        new_path, row_count
+    )
+
+
+def bench_database(row_count):
+    table_size = Song.objects.count()
+    passes = max(1, -(-row_count // table_size))
+    columns = tuple(Song.__columns__.keys())
+    serialize_row = row_serializer(Song)
+
+    def old_path():
+        for _ in range(passes):
+            [legacy_serialize(song) for song in Song.objects.order_by("song_id")]
+
+    def new_path():
+        for _ in range(passes):
+            [
+                serialize_row(row)
+                for row in Song.objects.order_by("song_id").values_list(*columns)
+            ]
+
+    return time_rows_per_second(old_path, passes * table_size), time_rows_per_second(
+        new_path, passes * table_size
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--db", action="store_true")
+    args = parser.parse_args()
+
+    benches = [("in-memory", bench_in_memory)]
+    if args.db:
+        benches.append(("database", bench_database))
+    for bench_name, bench_func in benches:
+        old_rate, new_rate = bench_func(args.rows)
+        print(
+            f"{bench_name:>10}, {args.rows} rows: "
+            + f"model objects + legacy serialize {old_rate:12,.0f} rows/s; "
+            + f"values_list + compiled serializer {new_rate:12,.0f} rows/s "
+            + f"({new_rate / old_rate:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
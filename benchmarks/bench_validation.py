@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+# A micro-benchmark of input validation, comparing validate_input() as
+# it was before the precompiled validators (rebuilding sets and
+# branching on each column's type for every field of every object) with
+# an InputValidator built once per model class, both one object at a
+# time and in one pass over an array with validate_many(). Run it from
+# the base directory:
+#
+#     python benchmarks/bench_validation.py [--objects 100000]
+
+import argparse
+import os
+import sys
+import time
+
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from albums.models import Artist  # noqa: E402
+from moundmusic.viewutils import input_validators  # noqa: E402
+
+
+# validate_input() as it was before the precompiled validators.
+def legacy_validate_input(model_class, input_argd, all_nullable=False):
+    validated_dict = dict()
+    diff = set(input_argd.keys()) - set(model_class.__columns__)
+    if diff:
+        diff_expr = ", ".join(f"'{key}'" for key in diff)
+        raise ValueError(
+            f"unexpected propert"
+            + ("ies" if len(diff) > 1 else "y")
+            + f" in input: {diff_expr}"
+        )
+    for column, value in input_argd.items():
+        column_type = model_class.__columns__[column]
+        if value is None:
+            if not all_nullable and column not in model_class.__nullable_cols__:
+                raise ValueError(
+                    f"value for '{column}' is null and column not nullable"
+                )
+        elif column_type is int:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(
+                    f"value for '{column}' isn't an integer: " + str(value)
+                )
+            if value <= 0:
+                raise ValueError(
+                    f"value for '{column}' isn't greater than 0: " + str(value)
+                )
+        elif column_type is str and not len(value):
+            raise ValueError(f"value for '{column}' is a string of zero length")
+        elif column_type is date:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(
+                    f"value for '{column}' isn't in format YYYY-MM-DD and "
+                    + "column is a DATE"
+                )
+        elif isinstance(column_type, tuple):
+            if value not in column_type:
+                enum_expr = (
+                    ", ".join(f"'{option}'" for option in column_type[:-1])
+                    + f" or '{column_type[-1]}'"
+                )
+                raise ValueError(
+                    f"value for '{column}' not one of {enum_expr} and column "
+                    + "is an ENUM type"
+                )
+        validated_dict[column] = value
+    return validated_dict
+
+
+def artist_objects(object_count):
+    genders = ("male", "female", "nonbinary")
+    return [
+        {
+            "first_name": f"First{index}",
+            "last_name": f"Last{index}",
+            "gender": genders[index % 3],
+            "birth_date": f"19{index % 100:02d}-01-01",
+        }
+        for index in range(object_count)
+    ]
+
+
+def time_per_second(func, object_count):
+    start_time = time.perf_counter()
+    func()
+    return object_count / (time.perf_counter() - start_time)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, default=100000)
+    args = parser.parse_args()
+
+    input_list = artist_objects(args.objects)
+    validator = input_validators[Artist]
+
+    def legacy_path():
+        return [legacy_validate_input(Artist, input_argd) for input_argd in input_list]
+
+    def validator_path():
+        return [validator.validate(input_argd) for input_argd in input_list]
+
+    def validate_many_path():
+        return validator.validate_many(input_list)
+
+    assert legacy_path() == validator_path() == validate_many_path()[0]
+    legacy_rate = time_per_second(legacy_path, args.objects)
+    for path_name, path_func in (
+        ("legacy validate_input()", legacy_path),
+        ("InputValidator.validate()", validator_path),
+        ("InputValidator.validate_many()", validate_many_path),
+    ):
+        rate = time_per_second(path_func, args.objects)
+        print(
+            f"{path_name:>30}: {rate:12,.0f} validations/s "
+            + f"({rate / legacy_rate:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,12 @@
 import pytest
 import os
 
+from django.db import connections
+from django.test.utils import override_settings
+
 from moundmusic import settings
+from moundmusic.cacheutils import get_response_cache, get_row_cache
+from moundmusic.dbutils import query_latency_monitor, warm_pk_filters
 
 
 with open(
@@ -16,10 +21,90 @@ with open(
 @pytest.fixture(scope="session")
 def django_db_setup():
     settings.DATABASES["default"] = {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "moundmusic.pooled_postgresql",
         "NAME": "moundmusic",
         "USER": username,
         "PASSWORD": password,
         "HOST": "127.0.0.1",
         "PORT": "5432",
     }
+
+
+# The test suite runs in one process, so it has the response cache
+# ("lru") and the row cache on over the local memory backend, as a
+# single-process deployment may (see moundmusic.settings).
+@pytest.fixture(autouse=True)
+def process_local_caches():
+    with override_settings(
+        RESPONSE_CACHE=dict(settings.RESPONSE_CACHE, BACKEND="lru"),
+        ROW_CACHE=settings.row_cache_settings,
+    ):
+        yield
+
+
+# The response cache and the row cache outlive any one test, and a
+# test's writes are rolled back without invalidating them, so they're
+# emptied before each test. The query latencies are forgotten too, so
+# a slow query in one test can't have the response cache serve stale
+# responses in the next. (It asks for process_local_caches, so the
+# caches that fixture turns on are the ones emptied.)
+@pytest.fixture(autouse=True)
+def clear_caches(process_local_caches):
+    query_latency_monitor.reset()
+    response_cache = get_response_cache()
+    if response_cache is not None:
+        response_cache.clear()
+    row_cache = get_row_cache()
+    if row_cache is not None:
+        row_cache.clear()
+
+
+# The primary key filters are built before each test, as they would be
+# when a worker starts, so the query that builds one isn't counted
+# against whichever test happens to ask first. They don't need emptying:
+# a rolled-back insert only leaves a bit set for a row that may exist,
+# and the bits of rows deleted in a test are only cleared on commit.
+@pytest.fixture(autouse=True)
+def built_pk_filters(django_db_blocker):
+    with django_db_blocker.unblock():
+        warm_pk_filters()
+
+
+# For tests that change rows through the ORM rather than the API, which
+# the caches never hear about.
+@pytest.fixture
+def no_caches(settings):
+    settings.RESPONSE_CACHE = {"BACKEND": None}
+    settings.ROW_CACHE = None
+
+
+# Read replicas for the routing tests (see moundmusic.dbrouters): more
+# connections to the same database. They hold the committed rows but not
+# the ones a test writes in its transaction, like replicas that haven't
+# replayed the test's writes yet.
+def read_replica_aliases(settings, replica_count):
+    aliases = [f"replica_{number}" for number in range(1, replica_count + 1)]
+    for alias in aliases:
+        connections.settings[alias] = dict(connections.settings["default"])
+    settings.DATABASE_REPLICAS = {
+        "ALIASES": aliases,
+        "MAX_LAG_SECONDS": 1,
+        "LAG_CHECK_INTERVAL": 0,
+        "STICKY_SECONDS": 5,
+    }
+    yield aliases
+    for alias in aliases:
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+
+@pytest.fixture
+def read_replica(db, settings):
+    for aliases in read_replica_aliases(settings, 1):
+        yield aliases[0]
+
+
+@pytest.fixture
+def read_replicas(db, settings):
+    yield from read_replica_aliases(settings, 2)
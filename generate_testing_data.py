@@ -86,6 +86,9 @@ def main():
             print("Seeing `to_sell_listing` table....")
             table_seeder.seed_to_sell_listing_table()
 
+            print("Resyncing primary key sequences....")
+            table_seeder.resync_pk_sequences()
+
 
 def title_case(strval):
     title_case_lc_words = {
@@ -173,6 +176,26 @@ class Table_Seeder(object):
         "Album_Song_Bridge_Row", ("album_id", "disc_number", "track_number", "song_id")
     )
 
+    Tables_To_Pk_Columns = {
+        "album": "album_id",
+        "album_genre_bridge": "album_genre_bridge_id",
+        "album_song_bridge": "album_song_bridge_id",
+        "artist": "artist_id",
+        "artist_album_bridge": "artist_album_bridge_id",
+        "artist_genre_bridge": "artist_genre_bridge_id",
+        "artist_song_bridge": "artist_song_bridge_id",
+        "buyer_account": "buyer_id",
+        "genre": "genre_id",
+        "seller_account": "seller_id",
+        "song": "song_id",
+        "song_genre_bridge": "song_genre_bridge_id",
+        "song_lyrics": "song_lyrics_id",
+        "to_buy_listing": "to_buy_listing_id",
+        "to_sell_listing": "to_sell_listing_id",
+        "user_": "user_id",
+        "user_password": "password_id",
+    }
+
     def __init__(self, faker_obj, cursor):
         self.faker_obj = faker_obj
         self.cursor = cursor
@@ -560,6 +583,19 @@ class Table_Seeder(object):
             "to_sell_listing", "seller_id", "asking_price", "user_ids_to_seller_ids"
         )
 
+    # The REST API allocates new primary key values from each table's
+    # SERIAL sequence, so after seeding every sequence has to be past
+    # the greatest primary key value in its table. (The same resync is
+    # available from django as `python manage.py resync_sequences`.)
+    def resync_pk_sequences(self):
+        for table_name, pk_col_name in self.Tables_To_Pk_Columns.items():
+            self.cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, %s), "
+                f"COALESCE(MAX({pk_col_name}), 0) + 1, false) FROM {table_name};",
+                (table_name, pk_col_name),
+            )
+        self.cursor.execute("COMMIT;")
+
 
 if __name__ == "__main__":
     main()
@@ -5,6 +5,7 @@ from moundmusic.viewutils import (
     single_model_defclo,
     outer_id_inner_list_defclo,
     outer_id_inner_id_defclo,
+    bridge_include_loader,
 )
 
 from .models import (
@@ -28,7 +29,23 @@ index = index_defclo(Genre, "genre_id")
 
 
 # GET,PATCH,DELETE /genres/<genre_id>
-single_genre = single_model_defclo(Genre, "genre_id")
+#
+# GET accepts ?include=albums,artists,songs to embed those collections in
+# the genre object, in the same form the matching
+# /genres/<genre_id>/<relation> endpoints return them.
+single_genre = single_model_defclo(
+    Genre,
+    "genre_id",
+    includes={
+        "albums": bridge_include_loader(
+            "genre_id", Album, "album_id", AlbumGenreBridge
+        ),
+        "artists": bridge_include_loader(
+            "genre_id", Artist, "artist_id", ArtistGenreBridge
+        ),
+        "songs": bridge_include_loader("genre_id", Song, "song_id", SongGenreBridge),
+    },
+)
 
 
 # GET,POST /genres/<genre_id>/albums
@@ -0,0 +1,22 @@
+#!/usr/bin/python3
+
+# The WSGI launch profile: gunicorn's sync workers serving
+# moundmusic.wsgi:application. gunicorn reads this file when it's run
+# from the base directory, as the Dockerfile and docker-compose.yml run
+#
+#     gunicorn --bind 0.0.0.0:8000 moundmusic.wsgi:application
+#
+# The number of workers is set with --workers or WEB_CONCURRENCY. More
+# than one is refused while the settings keep any of the caches in each
+# process (see moundmusic.gunicornutils), where a write through one
+# worker can't make another's entries stale.
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+from moundmusic.gunicornutils import (  # noqa: E402
+    refuse_workers_with_process_local_caches,
+)
+
+on_starting = refuse_workers_with_process_local_caches
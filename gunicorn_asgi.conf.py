@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+
+# The ASGI launch profile: gunicorn managing uvicorn workers, serving
+# moundmusic.asgi:application, whose endpoints are the async views of
+# moundmusic.asyncviewutils. Run it from the base directory with
+#
+#     gunicorn -c gunicorn_asgi.conf.py moundmusic.asgi:application
+#
+# or, for a single process without gunicorn,
+#
+#     uvicorn moundmusic.asgi:application --host 0.0.0.0 --port 8000
+#
+# One uvicorn worker serves many requests at once, so fewer workers are
+# needed than with the WSGI profile's sync workers; each worker's
+# queries run on settings.ASYNC_VIEWS['DB_THREADS'] threads, each with a
+# database connection of its own.
+#
+# More than one worker is refused while the settings keep any of the
+# caches in each process (see moundmusic.gunicornutils), where a write
+# through one worker can't make another's entries stale.
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
+
+from moundmusic.gunicornutils import (  # noqa: E402
+    refuse_workers_with_process_local_caches,
+)
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+on_starting = refuse_workers_with_process_local_caches
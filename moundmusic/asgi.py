@@ -10,9 +10,51 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
+import threading
 
-from django.core.asgi import get_asgi_application
+import django
+
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
 
-application = get_asgi_application()
+
+# Serves moundmusic.asgi_urls, where the endpoints that have async
+# counterparts (see moundmusic.asyncviewutils) are async views, instead
+# of the ROOT_URLCONF the WSGI application serves.
+class AsyncViewsASGIHandler(ASGIHandler):
+    urlconf = "moundmusic.asgi_urls"
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = self.urlconf
+        return request, error_response
+
+
+# As get_asgi_application() does.
+django.setup(set_prefix=False)
+application = AsyncViewsASGIHandler()
+
+from django.db import connection  # noqa: E402
+
+from moundmusic.asyncviewutils import warm_db_threads  # noqa: E402
+from moundmusic.dbutils import warm_pk_filters  # noqa: E402
+
+
+# The primary key filters are built, and the database threads'
+# connections opened, before the first request, as moundmusic.wsgi does.
+# uvicorn imports this module from inside its event loop, where the ORM
+# can't be used, so that's done on a thread of its own, which closes its
+# connection when it's done.
+def warm_up_on_startup():
+    try:
+        warm_pk_filters()
+    finally:
+        connection.close()
+    warm_db_threads()
+
+
+warming_thread = threading.Thread(target=warm_up_on_startup)
+warming_thread.start()
+warming_thread.join()
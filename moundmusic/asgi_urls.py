@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+"""moundmusic ASGI URL Configuration
+
+The same routes as moundmusic.urls, with each endpoint function that
+has an async counterpart (see moundmusic.asyncviewutils) replaced by
+it. moundmusic.asgi serves this URLconf; moundmusic.wsgi serves
+moundmusic.urls.
+"""
+from django.urls import URLPattern, URLResolver
+
+from moundmusic import urls
+from moundmusic.asyncviewutils import async_view
+
+
+def async_urlpatterns(urlpatterns):
+    async_patterns = list()
+    for url_pattern in urlpatterns:
+        if isinstance(url_pattern, URLResolver):
+            async_patterns.append(
+                URLResolver(
+                    url_pattern.pattern,
+                    async_urlpatterns(url_pattern.url_patterns),
+                    url_pattern.default_kwargs,
+                    url_pattern.app_name,
+                    url_pattern.namespace,
+                )
+            )
+        else:
+            async_patterns.append(
+                URLPattern(
+                    url_pattern.pattern,
+                    async_view(url_pattern.callback),
+                    url_pattern.default_args,
+                    url_pattern.name,
+                )
+            )
+    return async_patterns
+
+
+urlpatterns = async_urlpatterns(urls.urlpatterns)
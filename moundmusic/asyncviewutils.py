@@ -0,0 +1,568 @@
+#!/usr/bin/python3
+
+import asyncio
+import contextvars
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.http.response import JsonResponse
+
+from rest_framework import status
+
+from albums.models import BuyerAccount, User
+
+from moundmusic.cacheutils import cached_model_obj
+from moundmusic.dbrouters import replica_reads, replica_reads_allowed
+from moundmusic.dbutils import warm_database_connections
+from moundmusic.viewutils import (
+    absent_model_obj_response,
+    make_etag,
+    narrow_queryset,
+    row_version_annotation,
+    stream_requested,
+    validate_fields_param,
+    validate_include_param,
+)
+
+
+# Async counterparts of the higher-order functions in
+# moundmusic.viewutils, served when the package runs under ASGI (see
+# moundmusic.asgi and moundmusic.asgi_urls). Each takes the endpoint
+# function the synchronous higher-order function returned, followed by
+# that function's arguments.
+#
+# Django 3.2 has no async ORM (QuerySet.aget() and the like arrived in
+# 4.1), so queries are run on a pool of database threads with
+# run_in_db_thread(), and an endpoint awaits them without holding a
+# thread of its own. Where an endpoint's lookups don't depend on one
+# another (a user, its account and a listing, say), they're run at the
+# same time with asyncio.gather(), so the request waits on the slowest
+# of them rather than on all of them in turn. Their 404s are checked in
+# the same order the synchronous endpoint checks them in, so the same
+# request gets the same error.
+#
+# GETs whose lookups are sequential by nature (a conditional GET, which
+# has to be answered before anything else is fetched, or a response
+# cache fill) run the synchronous endpoint function whole on a database
+# thread. Every other method is handed to the synchronous endpoint
+# function with sync_to_async(), on the thread django 3.2 runs all
+# synchronous code on under ASGI, so writes keep their transactions and
+# django's connection handling. (That one thread is also why the GETs
+# don't go there: a synchronous endpoint function under ASGI serves one
+# request at a time.)
+#
+# django 3.2 iterates a streamed response on the event loop, where the
+# ORM can't be used, so an NDJSON stream (see
+# moundmusic.viewutils.ndjson_streaming_response()) is read to the end on
+# the database thread and sent as an ordinary response.
+
+
+_db_executor = None
+_db_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    global _db_executor
+    if _db_executor is None:
+        with _db_executor_lock:
+            if _db_executor is None:
+                _db_executor = ThreadPoolExecutor(
+                    max_workers=settings.ASYNC_VIEWS.get("DB_THREADS", 8),
+                    thread_name_prefix="moundmusic-db",
+                )
+    return _db_executor
+
+
+# Each database thread keeps its own connection to each database (the
+# primary and any read replicas) open between calls for as long as it
+# works, whatever CONN_MAX_AGE is: there are only
+# DB_THREADS of them, and reconnecting for each lookup would cost more
+# than the lookups that run at the same time save. A connection that
+# had an error is closed if it's no longer usable, as django does at the
+# end of a request. With a connection pool (see
+# moundmusic.pooled_postgresql), the connection is given back to it
+# after each call instead, which costs no reconnecting.
+def _call_with_connection(func, args):
+    try:
+        return func(*args)
+    finally:
+        for db_connection in connections.all():
+            if db_connection.pool is not None:
+                db_connection.close()
+            elif db_connection.errors_occurred:
+                if db_connection.is_usable():
+                    db_connection.errors_occurred = False
+                else:
+                    db_connection.close()
+
+
+# Opens each database thread's connection, or, with a connection pool,
+# the pool's MIN_SIZE connections (see
+# moundmusic.dbutils.warm_database_connections()). moundmusic.asgi calls
+# this when a worker starts. Each thread waits at a barrier until all of
+# them have connected, so no one thread takes two of the calls.
+def warm_db_threads():
+    if connection.pool is not None:
+        warm_database_connections()
+        return
+    db_threads = settings.ASYNC_VIEWS.get("DB_THREADS", 8)
+    barrier = threading.Barrier(db_threads)
+
+    def warm_thread_connection():
+        warm_database_connections()
+        barrier.wait(timeout=30)
+
+    executor = get_db_executor()
+    futures = [executor.submit(warm_thread_connection) for _ in range(db_threads)]
+    for future in futures:
+        future.result()
+
+
+# Runs `func(*args)` on a database thread and returns its result. It
+# runs in a copy of the caller's context, so that it reads from the
+# database the caller would (see moundmusic.dbrouters).
+async def run_in_db_thread(func, *args):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_db_executor(), context.run, _call_with_connection, func, args
+    )
+
+
+# Calls a synchronous endpoint function and, if its response is
+# streamed, reads the stream into an ordinary response; see above.
+def buffered_view_response(view, request, *view_args, **view_kwargs):
+    response = view(request, *view_args, **view_kwargs)
+    if not response.streaming:
+        return response
+    content = b"".join(response.streaming_content)
+    buffered_response = HttpResponse(
+        content, content_type=response["Content-Type"], status=response.status_code
+    )
+    response.close()
+    return buffered_response
+
+
+# Runs a GET through the synchronous endpoint function, whole, on a
+# database thread.
+async def sync_view_get_response(view, request, *view_args):
+    return await run_in_db_thread(buffered_view_response, view, request, *view_args)
+
+
+# The async counterpart of moundmusic.viewutils.func_dispatch(). A
+# method without an async function is handed to the synchronous
+# endpoint function, which answers an unsupported one with a 405. A GET
+# reads from the read replicas as it would there.
+async def async_func_dispatch(functions, request, view, *view_args):
+    dispatch_table = dict()
+    for function in functions:
+        func_name = function.__name__
+        _, method = func_name.rsplit("_", 1)
+        dispatch_table[method] = function
+    method = request.method.lower()
+    if method not in dispatch_table:
+        return await sync_to_async(view)(request, *view_args)
+    elif method == "get" and replica_reads_allowed(request):
+        with replica_reads():
+            return await dispatch_table[method]()
+    return await dispatch_table[method]()
+
+
+def user_404_response(user_id):
+    return JsonResponse(
+        {"message": f"no user with user_id={user_id}"},
+        status=status.HTTP_404_NOT_FOUND,
+    )
+
+
+def account_404_response(buyer_or_seller_id_col_name, buyer_or_seller_id):
+    kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
+    return JsonResponse(
+        {
+            "message": f"no {kind_of_account} account with "
+            + f"{buyer_or_seller_id_col_name}={buyer_or_seller_id}"
+        },
+        status=status.HTTP_404_NOT_FOUND,
+    )
+
+
+# The async counterpart of index_defclo(). A page is one query, so a GET
+# is the synchronous endpoint's, run on a database thread.
+def async_index_defclo(index_closure, model_class, model_id_attr_name):
+
+    # BEGIN closure
+    async def async_index_closure(request):
+        async def _index_get():
+            return await sync_view_get_response(index_closure, request)
+
+        return await async_func_dispatch((_index_get,), request, index_closure)
+
+    # END closure
+
+    return async_index_closure
+
+
+# The async counterpart of single_model_defclo(). A GET with ?include=
+# fetches the object and each included relation at the same time.
+def async_single_model_defclo(
+    single_model_closure, model_class, model_id_attr_name, includes=None
+):
+    includes = dict() if includes is None else includes
+
+    # BEGIN closure
+    async def async_single_model_closure(request, model_obj_id):
+        async def _single_model_get():
+            if "include" not in request.GET:
+                return await sync_view_get_response(
+                    single_model_closure, request, model_obj_id
+                )
+            result = validate_fields_param(request, model_class)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                fields = result
+            result = validate_include_param(request, model_class, includes)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                relations = result
+            if not relations:
+                return await sync_view_get_response(
+                    single_model_closure, request, model_obj_id
+                )
+            response = await run_in_db_thread(
+                absent_model_obj_response, model_class, model_id_attr_name, model_obj_id
+            )
+            if response is not None:
+                return response
+
+            def fetch_model_obj():
+                return (
+                    narrow_queryset(model_class.objects, fields)
+                    .annotate(row_version=row_version_annotation(model_class))
+                    .filter(**{model_id_attr_name: model_obj_id})
+                    .first()
+                )
+
+            model_obj, *relation_values = await asyncio.gather(
+                run_in_db_thread(fetch_model_obj),
+                *(
+                    run_in_db_thread(includes[relation], model_obj_id)
+                    for relation in relations
+                ),
+            )
+            if model_obj is None:
+                return JsonResponse(
+                    {
+                        "message": f"no {model_class.__name__.lower()} with "
+                        + f"{model_id_attr_name}={model_obj_id}"
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            serialization = model_obj.serialize(fields)
+            serialization.update(zip(relations, relation_values))
+            return JsonResponse(serialization, status=status.HTTP_200_OK)
+
+        return await async_func_dispatch(
+            (_single_model_get,), request, single_model_closure, model_obj_id
+        )
+
+    # END closure
+
+    return async_single_model_closure
+
+
+# The async counterpart of outer_id_inner_list_defclo(). A GET goes
+# through the response cache, whose fill has to look the outer object
+# up before it fetches the list, so it's the synchronous endpoint's, run
+# on a database thread.
+def async_outer_id_inner_list_defclo(
+    outer_id_inner_list_closure,
+    outer_model_class,
+    outer_model_id_attr_name,
+    inner_model_class,
+    inner_model_id_attr_name,
+    bridge_class,
+):
+
+    # BEGIN closure
+    async def async_outer_id_inner_list_closure(request, outer_model_obj_id):
+        async def _outer_id_inner_list_get():
+            return await sync_view_get_response(
+                outer_id_inner_list_closure, request, outer_model_obj_id
+            )
+
+        return await async_func_dispatch(
+            (_outer_id_inner_list_get,),
+            request,
+            outer_id_inner_list_closure,
+            outer_model_obj_id,
+        )
+
+    # END closure
+
+    return async_outer_id_inner_list_closure
+
+
+# The async counterpart of buyer_seller_acct_defclo(). The account is
+# looked up by the id set on the user, so the two lookups can't overlap;
+# a GET is the synchronous endpoint's, run on a database thread.
+def async_buyer_seller_acct_defclo(
+    buyer_seller_acct_closure,
+    buyer_or_seller_account_class,
+    buyer_or_seller_id_col_name,
+):
+
+    # BEGIN closure
+    async def async_buyer_seller_acct_closure(request, outer_model_obj_id):
+        async def _buyer_seller_acct_get():
+            return await sync_view_get_response(
+                buyer_seller_acct_closure, request, outer_model_obj_id
+            )
+
+        return await async_func_dispatch(
+            (_buyer_seller_acct_get,),
+            request,
+            buyer_seller_acct_closure,
+            outer_model_obj_id,
+        )
+
+    # END closure
+
+    return async_buyer_seller_acct_closure
+
+
+# The async counterpart of single_buyer_seller_defclo(). A GET looks up
+# the user and the account at the same time.
+def async_single_buyer_seller_defclo(
+    single_buyer_seller_closure,
+    buyer_or_seller_account_class,
+    buyer_or_seller_id_col_name,
+):
+
+    # BEGIN closure
+    async def async_single_buyer_seller_closure(
+        request, outer_model_obj_id, inner_model_obj_id
+    ):
+        async def _single_buyer_seller_get():
+            user, buyer_or_seller_account = await asyncio.gather(
+                run_in_db_thread(cached_model_obj, User, outer_model_obj_id),
+                run_in_db_thread(
+                    cached_model_obj, buyer_or_seller_account_class, inner_model_obj_id
+                ),
+            )
+            if user is None:
+                return user_404_response(outer_model_obj_id)
+            if buyer_or_seller_account is None:
+                return JsonResponse(
+                    {
+                        "message": f"no buyer account with "
+                        + f"{buyer_or_seller_id_col_name}={inner_model_obj_id}"
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            return JsonResponse(
+                buyer_or_seller_account.serialize(),
+                status=status.HTTP_200_OK,
+                safe=False,
+            )
+
+        return await async_func_dispatch(
+            (_single_buyer_seller_get,),
+            request,
+            single_buyer_seller_closure,
+            outer_model_obj_id,
+            inner_model_obj_id,
+        )
+
+    # END closure
+
+    return async_single_buyer_seller_closure
+
+
+# The async counterpart of buyer_seller_all_defclo(). A GET looks up the
+# user and the account and fetches the listings at the same time.
+def async_buyer_seller_all_defclo(
+    buyer_seller_all_closure,
+    buyer_or_seller_class,
+    buyer_or_seller_id_col_name,
+    to_buy_or_to_sell_listing_class,
+):
+    def fetch_listings(buyer_or_seller_id):
+        return [
+            listing.serialize()
+            for listing in to_buy_or_to_sell_listing_class.objects.filter(
+                **{buyer_or_seller_id_col_name: buyer_or_seller_id}
+            )
+        ]
+
+    # BEGIN closure
+    async def async_buyer_seller_all_closure(
+        request, outer_model_obj_id, inner_model_obj_id
+    ):
+        async def _buyer_seller_all_get():
+            if stream_requested(request):
+                return await sync_view_get_response(
+                    buyer_seller_all_closure,
+                    request,
+                    outer_model_obj_id,
+                    inner_model_obj_id,
+                )
+            user, buyer_or_seller_account, listings_serialized = await asyncio.gather(
+                run_in_db_thread(cached_model_obj, User, outer_model_obj_id),
+                run_in_db_thread(
+                    cached_model_obj, buyer_or_seller_class, inner_model_obj_id
+                ),
+                run_in_db_thread(fetch_listings, inner_model_obj_id),
+            )
+            if user is None:
+                return user_404_response(outer_model_obj_id)
+            if buyer_or_seller_account is None:
+                return account_404_response(
+                    buyer_or_seller_id_col_name, inner_model_obj_id
+                )
+            return JsonResponse(
+                listings_serialized, status=status.HTTP_200_OK, safe=False
+            )
+
+        return await async_func_dispatch(
+            (_buyer_seller_all_get,),
+            request,
+            buyer_seller_all_closure,
+            outer_model_obj_id,
+            inner_model_obj_id,
+        )
+
+    # END closure
+
+    return async_buyer_seller_all_closure
+
+
+# The async counterpart of buyer_seller_listing_defclo(). A GET looks up
+# the user, the account and the listing at the same time. A conditional
+# GET is answered by the synchronous endpoint, since its version query
+# has to come first.
+def async_buyer_seller_listing_defclo(
+    buyer_seller_listing_closure,
+    buyer_or_seller_class,
+    buyer_or_seller_id_col_name,
+    to_buy_or_to_sell_listing_class,
+    to_buy_or_to_sell_listing_id_col_name,
+):
+    kind_of_listing = (
+        "to-buy listing" if buyer_or_seller_class is BuyerAccount else "to-sell listing"
+    )
+
+    def fetch_listing(listing_id):
+        return (
+            to_buy_or_to_sell_listing_class.objects.annotate(
+                row_version=row_version_annotation(to_buy_or_to_sell_listing_class)
+            )
+            .filter(**{to_buy_or_to_sell_listing_id_col_name: listing_id})
+            .first()
+        )
+
+    # BEGIN closure
+    async def async_buyer_seller_listing_closure(
+        request, outer_model_obj_id, inner_model_obj_id, third_model_obj_id
+    ):
+        async def _buyer_seller_listing_get():
+            if "HTTP_IF_NONE_MATCH" in request.META:
+                return await sync_view_get_response(
+                    buyer_seller_listing_closure,
+                    request,
+                    outer_model_obj_id,
+                    inner_model_obj_id,
+                    third_model_obj_id,
+                )
+            user, buyer_or_seller_account, listing = await asyncio.gather(
+                run_in_db_thread(cached_model_obj, User, outer_model_obj_id),
+                run_in_db_thread(
+                    cached_model_obj, buyer_or_seller_class, inner_model_obj_id
+                ),
+                run_in_db_thread(fetch_listing, third_model_obj_id),
+            )
+            if user is None:
+                return user_404_response(outer_model_obj_id)
+            if buyer_or_seller_account is None:
+                return account_404_response(
+                    buyer_or_seller_id_col_name, inner_model_obj_id
+                )
+            if listing is None:
+                return JsonResponse(
+                    {
+                        "message": f"no {kind_of_listing} with "
+                        + f"{to_buy_or_to_sell_listing_id_col_name}="
+                        + str(third_model_obj_id)
+                    },
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            response = JsonResponse(
+                listing.serialize(), status=status.HTTP_200_OK, safe=False
+            )
+            response["ETag"] = make_etag(listing.row_version)
+            return response
+
+        return await async_func_dispatch(
+            (_buyer_seller_listing_get,),
+            request,
+            buyer_seller_listing_closure,
+            outer_model_obj_id,
+            inner_model_obj_id,
+            third_model_obj_id,
+        )
+
+    # END closure
+
+    return async_buyer_seller_listing_closure
+
+
+ASYNC_DEFCLOS = {
+    "index_defclo": async_index_defclo,
+    "single_model_defclo": async_single_model_defclo,
+    "outer_id_inner_list_defclo": async_outer_id_inner_list_defclo,
+    "buyer_seller_acct_defclo": async_buyer_seller_acct_defclo,
+    "single_buyer_seller_defclo": async_single_buyer_seller_defclo,
+    "buyer_seller_all_defclo": async_buyer_seller_all_defclo,
+    "buyer_seller_listing_defclo": async_buyer_seller_listing_defclo,
+}
+
+
+# Wraps an endpoint function that has no async counterpart. As in the
+# async counterparts, a GET is run on a database thread and any other
+# method on django's thread for synchronous code, and a streamed
+# response is read to the end before it's sent.
+def wrapped_sync_view(view):
+    @functools.wraps(view)
+    async def async_wrapped_view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await run_in_db_thread(
+                functools.partial(buffered_view_response, view, **kwargs),
+                request,
+                *args,
+            )
+        return await sync_to_async(buffered_view_response)(
+            view, request, *args, **kwargs
+        )
+
+    return async_wrapped_view
+
+
+# Returns the async counterpart of an endpoint function, or the function
+# wrapped by wrapped_sync_view() if it has none. It's exempt from CSRF
+# checks if the endpoint function is, as @api_view makes them all.
+# (django 3.2's csrf_exempt() can't decorate an async view.)
+def async_view(view):
+    async_defclo = ASYNC_DEFCLOS.get(getattr(view, "defclo_name", None))
+    if async_defclo is None:
+        async_closure = wrapped_sync_view(view)
+    else:
+        async_closure = async_defclo(view, *view.defclo_args, **view.defclo_kwargs)
+    async_closure.csrf_exempt = getattr(view, "csrf_exempt", False)
+    return async_closure
@@ -0,0 +1,1153 @@
+#!/usr/bin/python3
+
+import functools
+import hashlib
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    close_old_connections,
+    connection,
+    connections,
+    models,
+    transaction,
+)
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+
+from moundmusic.dbrouters import primary_reads
+
+
+# The response cache. The GET endpoints of the closures returned by
+# index_defclo(), single_model_defclo() and the association
+# higher-order functions in moundmusic.viewutils serve their responses
+# through it (see moundmusic.viewutils.cached_get_response()). A cached
+# response is the rendered body plus the ETag and Link headers, keyed by
+# the request's full URL.
+#
+# Invalidation is by tag. Each cached response is stored with the tags
+# naming the rows and tables it was built from (see the *_tag()
+# functions below) and the version each tag had just before it was
+# built. The write paths of the same closures bump the versions of the
+# tags for what they changed, and a cached response whose tags' versions
+# no longer all match is treated as a miss. That way nothing needs to
+# keep track of which responses carry which tag.
+#
+# Two backends are available, chosen with settings.RESPONSE_CACHE: an
+# in-process LRU, and any django cache backend. Both keep the same
+# counters, reported by the /cache_stats endpoint.
+#
+# A miss is filled by one request at a time. Identical requests that
+# miss while it's being built wait for it and share its rendered bytes
+# (see ResponseCache.coalesce()), rather than each running the same
+# queries. With the django backend, a lock in the shared cache can
+# extend that across processes.
+#
+# Each family of endpoints ("index", "single", "association") can also
+# give its responses a freshness window and a stale window, in seconds
+# since they were stored. A response past its freshness window but
+# within its stale window is served as it is, and rebuilt in the
+# background. If postgres is slow, a response that a write has made
+# stale is served the same way, as long as it's within those windows,
+# rather than having the request wait on the database.
+#
+# A response built from a read replica (see moundmusic.dbrouters) may
+# be behind the primary by the replica's lag, so it's marked as such,
+# and isn't served to a request that has to read from the primary.
+
+
+# A tag for one row, named by its model class and primary key value.
+def row_tag(model_class, model_obj_id):
+    return f"{model_class._meta.db_table}:{model_obj_id}"
+
+
+# A tag for a whole table. Every write to the table bumps it, so it's
+# carried by responses that a new, changed or deleted row anywhere in
+# the table can affect, like a page of the index.
+def table_tag(model_class):
+    return model_class._meta.db_table
+
+
+# A tag for the set of bridge table rows where `id_attr_name` has the
+# value `model_obj_id`, ie. the links from one object to objects of
+# another model class.
+def link_tag(bridge_class, id_attr_name, model_obj_id):
+    return f"{bridge_class._meta.db_table}:{id_attr_name}={model_obj_id}"
+
+
+# The tags to bump when the rows of `model_class` with the given ids
+# were inserted, changed or deleted. A deleted row's bridge table rows
+# go with it, but every response that lists the linked objects also
+# carries their table's tag, so that's covered.
+def model_write_tags(model_class, model_obj_ids=()):
+    return [table_tag(model_class)] + [
+        row_tag(model_class, model_obj_id) for model_obj_id in model_obj_ids
+    ]
+
+
+# The tags to bump when bridge table rows linking the object with
+# `outer_model_obj_id` to the objects with `inner_model_obj_ids` were
+# added or deleted. Both directions are covered, so that eg. linking a
+# genre to an album invalidates GET /genres/<genre_id>/albums as well
+# as GET /albums/<album_id>/genres.
+def link_write_tags(
+    bridge_class,
+    outer_model_id_attr_name,
+    outer_model_obj_id,
+    inner_model_id_attr_name,
+    inner_model_obj_ids,
+):
+    return [link_tag(bridge_class, outer_model_id_attr_name, outer_model_obj_id)] + [
+        link_tag(bridge_class, inner_model_id_attr_name, inner_model_obj_id)
+        for inner_model_obj_id in inner_model_obj_ids
+    ]
+
+
+# Bumps the versions of `tags`, invalidating every cached response that
+# carries any of them. If a transaction is open, they're bumped again
+# once it commits: a GET running in between would still read the rows
+# as they were before the write, and might cache that.
+def invalidate_tags(tags):
+    response_cache = get_response_cache()
+    if response_cache is None or not tags:
+        return
+    response_cache.bump_tags(tags)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: response_cache.bump_tags(tags))
+
+
+# Invalidates what a write to the rows of `model_class` with the given
+# ids makes stale, in both the response cache and the row cache (see
+# below). If the rows were deleted, `deleted` must be set, so the rows
+# deleted along with them by an ON DELETE CASCADE are invalidated too.
+def invalidate_model_objs(model_class, model_obj_ids=(), deleted=False):
+    invalidate_tags(model_write_tags(model_class, model_obj_ids))
+    if deleted and model_obj_ids:
+        # A deleted row's bit is only cleared once the delete commits;
+        # until then the row may still be there.
+        transaction.on_commit(
+            lambda: discard_from_pk_filter(model_class, model_obj_ids)
+        )
+    row_cache = get_row_cache()
+    if row_cache is None or not model_obj_ids:
+        return
+    row_cache.invalidate(model_class, model_obj_ids, deleted)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(
+            lambda: row_cache.invalidate(model_class, model_obj_ids, deleted)
+        )
+
+
+# Hashes a key for the django cache, since memcached doesn't accept long
+# keys or ones with spaces.
+def hashed_cache_key(kind, key):
+    return f"moundmusic:{kind}:" + hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+# Reads the version tokens stored in `cache` under `token_keys`. A key
+# that's missing (never set, or evicted) gets a new random token. add()
+# won't overwrite a token another process set in the meantime, so
+# whichever token is stored is read back.
+def read_version_tokens(cache, token_keys):
+    tokens = cache.get_many(token_keys)
+    for token_key in token_keys:
+        if token_key not in tokens:
+            cache.add(token_key, uuid.uuid4().hex, timeout=None)
+            tokens[token_key] = cache.get(token_key)
+    return tuple(tokens[token_key] for token_key in token_keys)
+
+
+# One in-flight build of a response, which the requests coalesced onto
+# it wait for. `shared` is what the request building it left for them,
+# or None if they have to build their own.
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.shared = None
+
+
+# The behavior common to both backends: the hit/miss bookkeeping, the
+# tag version comparison and the coalescing of identical misses. A
+# subclass supplies get_entry(), set_entry(), tag_versions(), bump_tags()
+# and clear_entries(), and may supply a cross-process fill lock.
+class ResponseCache:
+    backend_name = None
+
+    def __init__(self, coalesce_timeout=None, families=None, refresh_workers=2):
+        self.coalesce_timeout = coalesce_timeout
+        self.families = families or dict()
+        self.refresh_workers = refresh_workers
+        self._stats_lock = threading.Lock()
+        self._flights_lock = threading.Lock()
+        self._flights = dict()
+        self._refreshes = dict()
+        self._refresh_executor = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                "hits": 0,
+                "misses": 0,
+                "stale": 0,
+                "stores": 0,
+                "evictions": 0,
+                "invalidations": 0,
+                "expired": 0,
+                "stale_serves": 0,
+                "slow_db_stale_serves": 0,
+                "refreshes": 0,
+                "coalesced": 0,
+                "fill_lock_waits": 0,
+            }
+
+    def count(self, stat_name, amount=1):
+        with self._stats_lock:
+            self._stats[stat_name] += amount
+
+    # Returns the freshness window, stale window and slow query
+    # threshold, in seconds, that settings.RESPONSE_CACHE['FAMILIES']
+    # gives endpoint family `family`. A family with no freshness window
+    # serves its responses until a write makes them stale.
+    def family_windows(self, family):
+        family_settings = self.families.get(family, {})
+        return (
+            family_settings.get("FRESH"),
+            family_settings.get("STALE", 0),
+            family_settings.get("SLOW_QUERY_SECONDS"),
+        )
+
+    # Returns the cached (content, headers, is_stale) for `cache_key`,
+    # or None if there isn't one that can be served. A response is stale
+    # if it's past its family's freshness window, or if a write changed
+    # what it was built from but `db_is_slow` (called with the family's
+    # slow query threshold) says the database is slow; either way, it's
+    # only served within the stale window. A stale response should be
+    # rebuilt with refresh_in_background(). Unless `from_replica` is set,
+    # a response built from a read replica isn't served.
+    def lookup(self, cache_key, tags, family=None, db_is_slow=None, from_replica=True):
+        entry = self.get_entry(cache_key)
+        if entry is None or entry[4] and not from_replica:
+            self.count("misses")
+            return None
+        tag_versions, stored_at, content, headers, _ = entry
+        is_current = tag_versions == self.tag_versions(tags)
+        fresh_seconds, stale_seconds, slow_query_seconds = self.family_windows(family)
+        age = time.time() - stored_at
+        if is_current and (fresh_seconds is None or age <= fresh_seconds):
+            self.count("hits")
+            return content, headers, False
+        if (
+            fresh_seconds is not None
+            and age <= fresh_seconds + stale_seconds
+            and (
+                is_current
+                or slow_query_seconds is not None
+                and db_is_slow is not None
+                and db_is_slow(slow_query_seconds)
+            )
+        ):
+            self.count("hits")
+            self.count("stale_serves")
+            if not is_current:
+                self.count("slow_db_stale_serves")
+            return content, headers, True
+        self.count("misses")
+        self.count("expired" if is_current else "stale")
+        return None
+
+    # `tag_versions` must have been read with tag_versions() before the
+    # response was built, so that a write landing while it was being
+    # built leaves it stale rather than cached as current. `from_replica`
+    # marks a response built from a read replica, which is only stored
+    # for a family with a freshness window.
+    def store(
+        self, cache_key, tag_versions, content, headers, family=None, from_replica=False
+    ):
+        fresh_seconds, stale_seconds, _ = self.family_windows(family)
+        if from_replica and fresh_seconds is None:
+            return
+        self.set_entry(
+            cache_key,
+            (tag_versions, time.time(), content, headers, from_replica),
+            None if fresh_seconds is None else fresh_seconds + stale_seconds,
+        )
+        self.count("stores")
+
+    # Runs `fill` for the first request to miss with the given
+    # `flight_key`, and has every identical request that misses while
+    # it's running wait for it instead. `fill` must return a pair of the
+    # response it built (or None) and what the waiting requests are to
+    # share, or None if they can't share it. Returns the pair for the
+    # request that ran `fill`, and (None, shared) for one that waited.
+    # A request that waits longer than `coalesce_timeout` seconds gets
+    # (None, None), and builds its own response.
+    #
+    # The key includes the tag versions read after the miss, so a
+    # request arriving after a write doesn't wait for a build that
+    # started before it.
+    def coalesce(self, flight_key, fill):
+        with self._flights_lock:
+            flight = self._flights.get(flight_key)
+            filling = flight is None
+            if filling:
+                flight = self._flights[flight_key] = Flight()
+        if not filling:
+            self.count("coalesced")
+            if not flight.done.wait(self.coalesce_timeout):
+                return None, None
+            return None, flight.shared
+        try:
+            response, flight.shared = fill()
+        finally:
+            with self._flights_lock:
+                del self._flights[flight_key]
+            flight.done.set()
+        return response, flight.shared
+
+    # Runs coalesce(flight_key, fill) on a background thread, to rebuild
+    # a stale response while it's served, unless it's being rebuilt
+    # already. At most `refresh_workers` run at once; the rest queue.
+    def refresh_in_background(self, flight_key, fill):
+        with self._flights_lock:
+            if flight_key in self._flights or flight_key in self._refreshes:
+                return
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    self.refresh_workers, thread_name_prefix="response-refresh"
+                )
+            self._refreshes[flight_key] = self._refresh_executor.submit(
+                self._refresh, flight_key, fill
+            )
+        self.count("refreshes")
+
+    def _refresh(self, flight_key, fill):
+        try:
+            self.coalesce(flight_key, fill)
+        finally:
+            with self._flights_lock:
+                del self._refreshes[flight_key]
+
+    # Waits for the background refreshes under way to finish.
+    def join_refreshes(self):
+        with self._flights_lock:
+            refreshes = list(self._refreshes.values())
+        for refresh in refreshes:
+            refresh.result()
+
+    # The cross-process fill lock. A backend whose entries only its own
+    # process sees has no use for one, so by default every request gets
+    # it; see DjangoResponseCache for the real one.
+    def acquire_fill_lock(self, flight_key):
+        return True
+
+    def release_fill_lock(self, flight_key):
+        pass
+
+    def wait_for_fill(self, cache_key, tag_versions, from_replica=False):
+        return None
+
+    def clear(self):
+        self.clear_entries()
+        self.reset_stats()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else None
+        stats["backend"] = self.backend_name
+        return stats
+
+
+# An in-process LRU of up to `max_entries` responses. Tag versions are
+# plain counters in a dict. Since its invalidations aren't seen by other
+# processes, this backend only suits a single-process deployment;
+# otherwise use the django backend with a shared cache.
+class LRUResponseCache(ResponseCache):
+    backend_name = "lru"
+
+    def __init__(self, max_entries, **options):
+        super().__init__(**options)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tag_versions = dict()
+
+    def get_entry(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+            return entry
+
+    def set_entry(self, cache_key, entry, timeout=None):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            evictions = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evictions += 1
+        if evictions:
+            self.count("evictions", evictions)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+        self.count("invalidations", len(tags))
+
+    def clear_entries(self):
+        with self._lock:
+            self._entries.clear()
+            self._tag_versions.clear()
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["entries"] = len(self._entries)
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+# Keeps the responses and tag versions in the django cache named by
+# `cache_alias`, so with a shared cache (memcached, redis) every process
+# sees every other's invalidations. A tag version is a random token
+# rather than a counter: if the cache evicts a tag's key, it gets a new
+# token the next time it's read, which makes the responses stored under
+# the old one stale, where a counter restarting from 0 could make an old
+# response look current again. Evictions are up to the cache server, so
+# they aren't counted.
+#
+# If `fill_lock_timeout` is set, a miss is filled by one process at a
+# time, as well as by one thread. The process that add()s the flight's
+# lock key builds the response; the others poll for the entry it stores
+# until the lock is released or `fill_lock_timeout` seconds have
+# passed, and then build it themselves if it still isn't there. The lock
+# key expires after the same time, in case its holder dies.
+#
+# The django cache may hold other things than responses, so clear()
+# doesn't clear it. The tag versions begin with a generation token, read
+# along with the tags' tokens, and clear() replaces it, which makes
+# every response stored before stale; the cache server evicts them in
+# time.
+class DjangoResponseCache(ResponseCache):
+    backend_name = "django"
+    fill_poll_interval = 0.02
+    generation_key = hashed_cache_key("generation", "response")
+
+    def __init__(self, cache_alias, timeout, fill_lock_timeout=None, **options):
+        super().__init__(**options)
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.fill_lock_timeout = fill_lock_timeout
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_entry(self, cache_key):
+        return self.cache.get(hashed_cache_key("response", cache_key))
+
+    # An entry is kept for TIMEOUT seconds, or to the end of its stale
+    # window if that's later.
+    def set_entry(self, cache_key, entry, timeout=None):
+        self.cache.set(
+            hashed_cache_key("response", cache_key),
+            entry,
+            timeout=max(self.timeout, timeout or 0),
+        )
+
+    def tag_versions(self, tags):
+        return read_version_tokens(
+            self.cache,
+            [self.generation_key] + [hashed_cache_key("tag", tag) for tag in tags],
+        )
+
+    def bump_tags(self, tags):
+        self.cache.set_many(
+            {hashed_cache_key("tag", tag): uuid.uuid4().hex for tag in tags},
+            timeout=None,
+        )
+        self.count("invalidations", len(tags))
+
+    # A flight key is the cache key, the tag versions and, for a fill
+    # from a read replica, True; fills from the primary and from a
+    # replica have locks of their own.
+    def fill_lock_key(self, cache_key, tag_versions, from_replica=False):
+        return hashed_cache_key(
+            "fill",
+            cache_key
+            + ":"
+            + ":".join(tag_versions)
+            + (":replica" if from_replica else ""),
+        )
+
+    def acquire_fill_lock(self, flight_key):
+        if not self.fill_lock_timeout:
+            return True
+        return self.cache.add(
+            self.fill_lock_key(*flight_key), 1, timeout=self.fill_lock_timeout
+        )
+
+    def release_fill_lock(self, flight_key):
+        if self.fill_lock_timeout:
+            self.cache.delete(self.fill_lock_key(*flight_key))
+
+    # Polls for the entry another process holding the fill lock is
+    # building. Returns its (content, headers), or None if the lock was
+    # released or timed out without one being stored under the same tag
+    # versions (eg. because the response wasn't a 200), or only one
+    # built from a read replica was and `from_replica` isn't set.
+    def wait_for_fill(self, cache_key, tag_versions, from_replica=False):
+        self.count("fill_lock_waits")
+        lock_key = self.fill_lock_key(cache_key, tag_versions, from_replica)
+        deadline = time.monotonic() + self.fill_lock_timeout
+        while True:
+            entry = self.get_entry(cache_key)
+            if (
+                entry is not None
+                and entry[0] == tag_versions
+                and (from_replica or not entry[4])
+            ):
+                return entry[2:4]
+            if self.cache.get(lock_key) is None or time.monotonic() > deadline:
+                return None
+            time.sleep(self.fill_poll_interval)
+
+    def clear_entries(self):
+        self.cache.set(self.generation_key, uuid.uuid4().hex, timeout=None)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+# Returns the response cache configured by settings.RESPONSE_CACHE, or
+# None if it's turned off. It's built on first use.
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = build_response_cache(settings.RESPONSE_CACHE)
+    return _response_cache or None
+
+
+def build_response_cache(cache_settings):
+    backend = cache_settings.get("BACKEND") if cache_settings else None
+    if backend is None:
+        # False (rather than None) records that the cache was looked up
+        # and is turned off, so it isn't looked up again.
+        return False
+    options = {
+        "coalesce_timeout": cache_settings.get("COALESCE_TIMEOUT", 30),
+        "families": cache_settings.get("FAMILIES"),
+        "refresh_workers": cache_settings.get("REFRESH_WORKERS", 2),
+    }
+    if backend == "lru":
+        return LRUResponseCache(cache_settings.get("MAX_ENTRIES", 10000), **options)
+    elif backend == "django":
+        return DjangoResponseCache(
+            cache_settings.get("CACHE_ALIAS", "default"),
+            cache_settings.get("TIMEOUT", 300),
+            cache_settings.get("FILL_LOCK_TIMEOUT"),
+            **options,
+        )
+    else:
+        raise ValueError(
+            f"settings.RESPONSE_CACHE['BACKEND'] isn't 'lru', 'django' or None: "
+            + repr(backend)
+        )
+
+
+# The row cache. Many endpoints look a row up by its primary key only to
+# test that it exists (eg. the user in every /users/<user_id>/... URL) or
+# to read a column or two of it. cached_model_obj() answers those
+# lookups from a cache of rows, so they stop costing a database round
+# trip.
+#
+# It has two tiers. The shared tier is the django cache named by
+# settings.ROW_CACHE['CACHE_ALIAS']; with memcached or redis, every
+# process shares it. In front of it, each process keeps an LRU of up to
+# MAX_ENTRIES rows, which saves fetching and unpickling a row from the
+# shared tier each time it's looked up.
+#
+# A row is keyed by its table, its primary key value and its version: a
+# pair of tokens, one for the row and one for its table, kept in the
+# shared tier. A write to the row (see invalidate_model_objs()) replaces
+# the row's token, and a delete of rows that other tables' rows are
+# deleted along with by an ON DELETE CASCADE replaces those tables'
+# tokens, so every copy of the row stored under the old version, in any
+# process, is never looked up again. The tokens are read on every
+# lookup, which costs one get_many() from the shared tier but keeps the
+# LRU tier from serving a row another process has changed.
+#
+# A row's entries expire after its model's TTL, from TIMEOUTS, or
+# TIMEOUT if it isn't listed. That bounds how long a write that didn't
+# go through this package's endpoints (eg. from psql) goes unseen.
+#
+# A row's version also begins with a generation token, read along with
+# the other two. clear() replaces it rather than clearing the shared
+# tier, which may hold other things than rows.
+
+
+# Returns the model classes whose rows a delete of `model_class` rows
+# deletes along with them, following ON DELETE CASCADE foreign keys
+# through any number of tables.
+@functools.lru_cache(maxsize=None)
+def cascaded_model_classes(model_class):
+    found = []
+    pending = [model_class]
+    while pending:
+        for related_object in pending.pop()._meta.related_objects:
+            related_model = related_object.related_model
+            if (
+                related_object.on_delete is models.CASCADE
+                and related_model is not model_class
+                and related_model not in found
+            ):
+                found.append(related_model)
+                pending.append(related_model)
+    return tuple(found)
+
+
+# Fetches the row of `model_class` with the primary key value
+# `model_obj_id`, as a tuple of its concrete fields' values followed by
+# its row_version (see moundmusic.viewutils.row_version_annotation()),
+# or None if there's no such row.
+def fetch_model_row(model_class, model_obj_id):
+    quote_name = connection.ops.quote_name
+    return (
+        model_class.objects.filter(pk=model_obj_id)
+        .annotate(
+            row_version=RawSQL(
+                f"{quote_name(model_class._meta.db_table)}.row_version", ()
+            )
+        )
+        .values_list(
+            *(field.attname for field in model_class._meta.concrete_fields),
+            "row_version",
+        )
+        .first()
+    )
+
+
+# Builds a model object from a row fetch_model_row() returned, with its
+# row_version set as an attribute.
+def model_obj_from_row(model_class, row):
+    model_obj = model_class.from_db(
+        None, [field.attname for field in model_class._meta.concrete_fields], row[:-1]
+    )
+    model_obj.row_version = row[-1]
+    return model_obj
+
+
+class RowCache:
+    generation_key = hashed_cache_key("generation", "row")
+
+    def __init__(self, cache_alias, max_entries, timeout, timeouts):
+        self.cache_alias = cache_alias
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.timeouts = timeouts
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                "local_hits": 0,
+                "shared_hits": 0,
+                "misses": 0,
+                "stores": 0,
+                "evictions": 0,
+                "invalidations": 0,
+            }
+
+    # Must be called with self._lock held.
+    def _count(self, stat_name, amount=1):
+        self._stats[stat_name] += amount
+
+    def model_timeout(self, model_class):
+        return self.timeouts.get(model_class._meta.db_table, self.timeout)
+
+    # Returns the row of `model_class` with the primary key value
+    # `model_obj_id` (as fetch_model_row() does), from the LRU tier, the
+    # shared tier or the database, in that order. A row found further
+    # down is stored in the tiers above it. A missing row isn't cached.
+    def lookup(self, model_class, model_obj_id):
+        table_name = model_class._meta.db_table
+        row_key = f"{table_name}:{model_obj_id}"
+        version = read_version_tokens(
+            self.cache,
+            [
+                self.generation_key,
+                hashed_cache_key("rowtable", table_name),
+                hashed_cache_key("rowversion", row_key),
+            ],
+        )
+        with self._lock:
+            entry = self._entries.get(row_key)
+            if (
+                entry is not None
+                and entry[0] == version
+                and entry[1] > time.monotonic()
+            ):
+                self._entries.move_to_end(row_key)
+                self._count("local_hits")
+                return entry[2]
+        shared_key = hashed_cache_key("row", f"{row_key}:" + ":".join(version))
+        row = self.cache.get(shared_key)
+        if row is not None:
+            stat_name = "shared_hits"
+        else:
+            stat_name = "misses"
+            with primary_reads():
+                row = fetch_model_row(model_class, model_obj_id)
+            if row is not None:
+                self.cache.set(shared_key, row, timeout=self.model_timeout(model_class))
+        with self._lock:
+            self._count(stat_name)
+            if row is None:
+                return None
+            self._entries[row_key] = (
+                version,
+                time.monotonic() + self.model_timeout(model_class),
+                row,
+            )
+            self._entries.move_to_end(row_key)
+            self._count("stores")
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+        return row
+
+    def invalidate(self, model_class, model_obj_ids, deleted=False):
+        table_name = model_class._meta.db_table
+        row_keys = [f"{table_name}:{model_obj_id}" for model_obj_id in model_obj_ids]
+        token_keys = [hashed_cache_key("rowversion", row_key) for row_key in row_keys]
+        if deleted:
+            token_keys += [
+                hashed_cache_key("rowtable", cascaded_class._meta.db_table)
+                for cascaded_class in cascaded_model_classes(model_class)
+            ]
+        self.cache.set_many(
+            {token_key: uuid.uuid4().hex for token_key in token_keys}, timeout=None
+        )
+        with self._lock:
+            for row_key in row_keys:
+                self._entries.pop(row_key, None)
+            self._count("invalidations", len(token_keys))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.cache.set(self.generation_key, uuid.uuid4().hex, timeout=None)
+        self.reset_stats()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else None
+        )
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+_row_cache = None
+_row_cache_lock = threading.Lock()
+
+
+# Returns the row cache configured by settings.ROW_CACHE, or None if
+# it's turned off. It's built on first use.
+def get_row_cache():
+    global _row_cache
+    if _row_cache is None:
+        with _row_cache_lock:
+            if _row_cache is None:
+                cache_settings = settings.ROW_CACHE
+                _row_cache = (
+                    RowCache(
+                        cache_settings.get("CACHE_ALIAS", "default"),
+                        cache_settings.get("MAX_ENTRIES", 10000),
+                        cache_settings.get("TIMEOUT", 300),
+                        cache_settings.get("TIMEOUTS", {}),
+                    )
+                    if cache_settings
+                    else False
+                )
+    return _row_cache or None
+
+
+# Returns the model object of `model_class` with the primary key value
+# `model_obj_id`, or None if there's no such row, through the row cache
+# if it's turned on. The object has its row_version set as an attribute.
+# It's only for reading: a write must save() an object fetched from the
+# database in the same transaction, not one that may have been cached
+# before some other write. An id the primary key filter knows is absent
+# never gets as far as either cache.
+def cached_model_obj(model_class, model_obj_id):
+    if pk_definitely_absent(model_class, model_obj_id):
+        return None
+    row_cache = get_row_cache()
+    if row_cache is None:
+        row = fetch_model_row(model_class, model_obj_id)
+    else:
+        row = row_cache.lookup(model_class, model_obj_id)
+    return None if row is None else model_obj_from_row(model_class, row)
+
+
+# The primary key filter. Requests for ids that don't exist (from
+# crawlers and broken clients, mostly) would otherwise each cost a query
+# just to find there's no such row. For each model it's asked about, the
+# filter keeps a bitmap of the primary key values in its table, built
+# with one query when a worker starts (see
+# moundmusic.dbutils.warm_pk_filters()), or else the first time it's
+# asked about. It's rebuilt every REBUILD_INTERVAL seconds on a
+# background thread, and requests are answered from the old bitmap until
+# the new one is swapped in. A clear bit means the row is definitely
+# absent and the 404 can be answered without the database; a set bit
+# means it may exist, and the caller goes on to look it up as before.
+#
+# Rows inserted by this process set their bits as they're inserted (see
+# moundmusic.dbutils.insert_model_obj()), and rows deleted by it clear
+# theirs once the delete commits (see invalidate_model_objs()). Rows
+# inserted by other processes are found by a catch-up query for the
+# primary key values above the settled mark (see below), run at most
+# once every CATCH_UP_INTERVAL seconds and only when an unknown id above
+# that mark is asked for. Rows deleted by other processes keep their
+# bits until the next rebuild, which only costs a query.
+#
+# A clear bit is only trusted up to the settled mark. Above it, an id
+# may have been handed out by another process since the last scan, or
+# handed out before it by a transaction that hadn't committed yet, so
+# it's only maybe present and the caller looks it up. Each scan reads
+# the postgres snapshot it ran under along with the ids; the highest id
+# a scan saw becomes the settled mark once every transaction that was
+# in progress during it has ended, which a later scan's snapshot shows
+# (or the scan's own, if none were). A transaction that started after
+# the scan gets ids above any the scan saw, since ids come from the
+# table's sequence, and a later scan rescans from the settled mark, so
+# a row committed late is found before its id is trusted.
+
+
+class PKFilter:
+    def __init__(self, model_class, catch_up_interval, rebuild_interval):
+        self.model_class = model_class
+        self.catch_up_interval = catch_up_interval
+        self.rebuild_interval = rebuild_interval
+        # _lock guards the bitmap and the marks, and is only held to read
+        # or update them; _scan_lock lets one scan run at a time, and is
+        # held while it queries the database.
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._bits = bytearray()
+        self._settled = 0
+        self._unsettled = None
+        self._built_at = None
+        self._caught_up_at = None
+        self._rebuild_future = None
+        self._changes = None
+        self._counters = {"absent": 0, "maybe_present": 0, "catch_ups": 0}
+
+    @staticmethod
+    def _has(bits, pk):
+        return 0 <= pk >> 3 < len(bits) and bool(bits[pk >> 3] & (1 << (pk & 7)))
+
+    @staticmethod
+    def _set(bits, pk):
+        if pk < 0:
+            return
+        if pk >> 3 >= len(bits):
+            # Grown by half again, so a run of inserts doesn't copy the
+            # bitmap each time.
+            bits.extend(bytes(max((pk >> 3) + 1, len(bits) * 3 // 2) - len(bits)))
+        bits[pk >> 3] |= 1 << (pk & 7)
+
+    @staticmethod
+    def _clear(bits, pk):
+        if PKFilter._has(bits, pk):
+            bits[pk >> 3] &= ~(1 << (pk & 7)) & 0xFF
+
+    # Scans the primary, not a read replica (see moundmusic.dbrouters),
+    # so a replica's lag can't leave rows out of the filter. Calls
+    # `found` with each primary key value above `greater_than`, and
+    # returns the highest one and the xmin and xmax of the snapshot the
+    # scan ran under. It doesn't touch the filter itself.
+    def _scan(self, found, greater_than=0):
+        quote_name = connection.ops.quote_name
+        pk_column = quote_name(self.model_class._meta.pk.column)
+        # One statement, so the snapshot is the one the ids were read
+        # under; it comes back as a row with a null id.
+        sql = (
+            "SELECT NULL::bigint, txid_current_snapshot()::text "
+            + f"UNION ALL SELECT {pk_column}, NULL "
+            + f"FROM {quote_name(self.model_class._meta.db_table)} "
+            + f"WHERE {pk_column} > %s;"
+        )
+        high_water = greater_than
+        with connections[DEFAULT_DB_ALIAS].chunked_cursor() as cursor:
+            cursor.execute(sql, (greater_than,))
+            for rows in iter(lambda: cursor.fetchmany(10000), []):
+                for pk, snapshot in rows:
+                    if pk is None:
+                        snapshot_xmin, snapshot_xmax, _ = snapshot.split(":")
+                    else:
+                        found(pk)
+                        high_water = max(high_water, pk)
+        return high_water, int(snapshot_xmin), int(snapshot_xmax)
+
+    # Moves the settled mark up as far as a scan's snapshot allows. A
+    # transaction id below the snapshot's xmin has ended. The ids an
+    # earlier scan saw are settled if every transaction that was in
+    # progress during it (all below its xmax) has ended. Called with
+    # _lock held.
+    def _settle(self, high_water, snapshot_xmin, snapshot_xmax):
+        if self._unsettled is not None and snapshot_xmin >= self._unsettled[1]:
+            self._settled = max(self._settled, self._unsettled[0])
+        if snapshot_xmin >= snapshot_xmax:
+            self._settled = max(self._settled, high_water)
+            self._unsettled = None
+        elif high_water > self._settled:
+            self._unsettled = (high_water, snapshot_xmax)
+
+    # Scans the whole table into a new bitmap, while requests go on being
+    # answered from the old one, and swaps it in. The ids this process
+    # adds or discards meanwhile are recorded and applied to the new
+    # bitmap too, since the scan may have missed them.
+    def _rebuild(self, now):
+        with self._scan_lock:
+            with self._lock:
+                if not self._rebuild_due(now):
+                    return
+                self._changes = dict()
+            bits = bytearray()
+            try:
+                scan_result = self._scan(functools.partial(self._set, bits))
+            except BaseException:
+                with self._lock:
+                    self._changes = None
+                raise
+            with self._lock:
+                for pk, present in self._changes.items():
+                    (self._set if present else self._clear)(bits, pk)
+                self._bits, self._changes = bits, None
+                self._settle(*scan_result)
+                self._built_at = self._caught_up_at = now
+
+    # Runs _rebuild() on the background thread, unless it's under way
+    # already. The background thread doesn't go through django's request
+    # handling, so it closes its database connection itself.
+    def _rebuild_in_background(self, now):
+        def _background_rebuild():
+            close_old_connections()
+            try:
+                self._rebuild(now)
+            finally:
+                with self._lock:
+                    self._rebuild_future = None
+                close_old_connections()
+
+        with self._lock:
+            if self._rebuild_future is None:
+                self._rebuild_future = pk_filter_rebuild_executor().submit(
+                    _background_rebuild
+                )
+
+    # Waits for a background rebuild under way to finish.
+    def join_rebuild(self):
+        with self._lock:
+            rebuild_future = self._rebuild_future
+        if rebuild_future is not None:
+            rebuild_future.result()
+
+    # Scans the ids above the settled mark into the bitmap. A request
+    # that finds a scan already under way doesn't wait for it.
+    def _catch_up(self, now):
+        if not self._scan_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                greater_than = self._settled
+                self._caught_up_at = now
+            found_pks = list()
+            scan_result = self._scan(found_pks.append, greater_than)
+            with self._lock:
+                for pk in found_pks:
+                    self._set(self._bits, pk)
+                self._settle(*scan_result)
+                self._counters["catch_ups"] += 1
+        finally:
+            self._scan_lock.release()
+
+    def _rebuild_due(self, now):
+        return self._built_at is None or now - self._built_at > self.rebuild_interval
+
+    # Builds the filter if it hasn't been built, or rebuilds it if it's
+    # due, so the next request doesn't have to.
+    def warm(self):
+        self._rebuild(time.monotonic())
+
+    # Only the first build is done by the request that asks; after that,
+    # a rebuild that's due runs in the background and a catch-up runs
+    # without blocking the requests for other ids.
+    def definitely_absent(self, pk):
+        now = time.monotonic()
+        with self._lock:
+            built = self._built_at is not None
+            rebuild_due = self._rebuild_due(now)
+            catch_up_due = (
+                built
+                and pk > self._settled
+                and not self._has(self._bits, pk)
+                and now - self._caught_up_at > self.catch_up_interval
+            )
+        if not built:
+            self._rebuild(now)
+        elif rebuild_due:
+            self._rebuild_in_background(now)
+        if catch_up_due:
+            self._catch_up(now)
+        with self._lock:
+            absent = pk <= self._settled and not self._has(self._bits, pk)
+            self._counters["absent" if absent else "maybe_present"] += 1
+            return absent
+
+    def add(self, pks):
+        with self._lock:
+            for pk in pks:
+                self._set(self._bits, pk)
+                if self._changes is not None:
+                    self._changes[pk] = True
+
+    def discard(self, pks):
+        with self._lock:
+            for pk in pks:
+                self._clear(self._bits, pk)
+                if self._changes is not None:
+                    self._changes[pk] = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "present": sum(bin(byte).count("1") for byte in self._bits),
+                "bitmap_bytes": len(self._bits),
+                "settled": self._settled,
+            }
+
+
+_pk_filters = None
+_pk_filters_lock = threading.Lock()
+_pk_filter_rebuild_executor = None
+
+
+# Returns the executor the primary key filters are rebuilt on. It has
+# one thread, so the rebuilds that fall due together queue rather than
+# scan their tables at once. It's made on first use.
+def pk_filter_rebuild_executor():
+    global _pk_filter_rebuild_executor
+    with _pk_filters_lock:
+        if _pk_filter_rebuild_executor is None:
+            _pk_filter_rebuild_executor = ThreadPoolExecutor(
+                1, thread_name_prefix="pk-filter-rebuild"
+            )
+        return _pk_filter_rebuild_executor
+
+
+# Returns the model class's PKFilter, or None if settings.PK_FILTER is
+# None. Filters are only made for the models that are asked about; with
+# `create` false, it doesn't make one, since there's nothing to add to
+# or discard from a filter that hasn't been built yet.
+def get_pk_filter(model_class, create=True):
+    global _pk_filters
+    filter_settings = settings.PK_FILTER
+    if not filter_settings:
+        return None
+    with _pk_filters_lock:
+        if _pk_filters is None:
+            _pk_filters = {}
+        pk_filter = _pk_filters.get(model_class)
+        if pk_filter is None and create:
+            pk_filter = _pk_filters[model_class] = PKFilter(
+                model_class,
+                filter_settings.get("CATCH_UP_INTERVAL", 1),
+                filter_settings.get("REBUILD_INTERVAL", 300),
+            )
+        return pk_filter
+
+
+# Tests whether the model class's table definitely has no row with the
+# primary key value `model_obj_id`. A value that isn't an integer isn't
+# judged, and neither is anything when the filter is turned off; the
+# caller looks those up as it always has.
+def pk_definitely_absent(model_class, model_obj_id):
+    if not isinstance(model_obj_id, int) or isinstance(model_obj_id, bool):
+        return False
+    pk_filter = get_pk_filter(model_class)
+    return pk_filter is not None and pk_filter.definitely_absent(model_obj_id)
+
+
+def add_to_pk_filter(model_class, model_obj_ids):
+    pk_filter = get_pk_filter(model_class, create=False)
+    if pk_filter is not None:
+        pk_filter.add(model_obj_ids)
+
+
+def discard_from_pk_filter(model_class, model_obj_ids):
+    pk_filter = get_pk_filter(model_class, create=False)
+    if pk_filter is not None:
+        pk_filter.discard(model_obj_ids)
+
+
+def clear_pk_filters():
+    global _pk_filters
+    with _pk_filters_lock:
+        _pk_filters = None
+
+
+def pk_filter_stats():
+    with _pk_filters_lock:
+        pk_filters = dict(_pk_filters or {})
+    return {
+        model_class._meta.db_table: pk_filter.stats()
+        for model_class, pk_filter in pk_filters.items()
+    }
+
+
+# The response cache, the row cache and the primary key filters are
+# rebuilt if their settings are changed (as the test suite does with its
+# `settings` fixture).
+@receiver(setting_changed)
+def reset_caches(setting, **kwargs):
+    global _response_cache, _row_cache
+    if setting == "RESPONSE_CACHE":
+        with _response_cache_lock:
+            _response_cache = None
+    elif setting == "ROW_CACHE":
+        with _row_cache_lock:
+            _row_cache = None
+    elif setting == "PK_FILTER":
+        clear_pk_filters()
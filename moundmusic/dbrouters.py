@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+import contextlib
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+# Read-replica routing. The databases listed in
+# settings.DATABASE_REPLICAS['ALIASES'] are streaming replicas of the
+# `default` database, which is the primary. Writes always go to the
+# primary. Reads go to a replica only while replica_reads() is in
+# effect, which moundmusic.viewutils.func_dispatch() (and its async
+# counterpart) puts in effect around the GET branch of an endpoint
+# function; everything else, including a write endpoint's own lookups,
+# reads from the primary.
+#
+# A replica is only read from while its replay lag, which is measured at
+# most once every LAG_CHECK_INTERVAL seconds per process, is no more
+# than MAX_LAG_SECONDS; otherwise, or if it can't be reached, reads fall
+# back to the primary. The replicas that are caught up take turns, a
+# request at a time: the replica is picked at a request's first read,
+# and all its reads go to that one, so they see the same point in the
+# primary's history rather than each replica's.
+#
+# A client that has just written would otherwise be able to GET the row
+# it wrote from a replica that hasn't replayed the write yet. So a write
+# response sets a cookie, and requests that carry it read from the
+# primary for the next STICKY_SECONDS seconds. STICKY_SECONDS should be
+# larger than MAX_LAG_SECONDS.
+#
+# The row cache and the primary key filters of moundmusic.cacheutils
+# are filled from the primary, since they're trusted until a write
+# invalidates them. The response cache is filled from the request's
+# replica for the families with a freshness window, which bounds how
+# long a response built from a lagging replica is served; a request
+# that reads from the primary doesn't serve those (see
+# moundmusic.viewutils.cached_get_response()).
+
+STICKY_COOKIE_NAME = "moundmusic_read_primary_until"
+
+# Returns the replay lag of a replica in seconds: 0 if it has replayed
+# all the WAL it has received (or isn't a replica at all), and otherwise
+# the time since the last transaction it replayed was committed. NULL if
+# it has never replayed one.
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    + "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    + "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END;"
+)
+
+# A request's reads from the replicas: the alias of the replica they go
+# to, once the first one has picked it. It's shared by the threads the
+# request's context is copied to (see moundmusic.asyncviewutils).
+class ReplicaReads:
+    def __init__(self):
+        self.alias = None
+
+
+_replica_reads = contextvars.ContextVar("replica_reads", default=None)
+
+
+# Has reads go to a replica. Inside a replica_reads() already in effect,
+# they go on using its replica.
+@contextlib.contextmanager
+def replica_reads(reads=None):
+    if reads is None:
+        reads = _replica_reads.get() or ReplicaReads()
+    token = _replica_reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextlib.contextmanager
+def primary_reads():
+    token = _replica_reads.set(None)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_active():
+    return _replica_reads.get() is not None
+
+
+# Measures a replica's lag, at most once every `check_interval` seconds;
+# in between, the last measurement is returned. None means the replica
+# couldn't be reached, or has never replayed a transaction.
+class ReplicaLagMonitor:
+    def __init__(self, alias):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._lag = None
+        self._checked_at = None
+
+    def lag(self, check_interval):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < check_interval:
+                return self._lag
+            # Other threads go on using the last measurement while this
+            # one takes a new one.
+            self._checked_at = now
+            last_lag = self._lag
+        try:
+            with connections[self.alias].cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                (lag,) = cursor.fetchone()
+            lag = None if lag is None else float(lag)
+        except DatabaseError:
+            lag = None
+        with self._lock:
+            if self._checked_at == now:
+                self._lag = lag
+            else:
+                lag = last_lag
+        return lag
+
+    def last_lag(self):
+        with self._lock:
+            return self._lag
+
+
+_lag_monitors = dict()
+_routing_lock = threading.Lock()
+_routing_stats = {"replica_reads": dict(), "lag_fallbacks": 0, "sticky_requests": 0}
+_next_replica_index = 0
+
+
+def _count(stat, alias=None):
+    with _routing_lock:
+        if alias is None:
+            _routing_stats[stat] += 1
+        else:
+            _routing_stats[stat][alias] = _routing_stats[stat].get(alias, 0) + 1
+
+
+def get_lag_monitor(alias):
+    with _routing_lock:
+        if alias not in _lag_monitors:
+            _lag_monitors[alias] = ReplicaLagMonitor(alias)
+        return _lag_monitors[alias]
+
+
+def replicas_configured():
+    return bool(settings.DATABASE_REPLICAS) and bool(
+        settings.DATABASE_REPLICAS.get("ALIASES")
+    )
+
+
+# Returns the alias of the database a read should go to: under
+# replica_reads(), the replica it picked, or else the primary.
+def read_db_alias():
+    reads = _replica_reads.get()
+    if reads is None or not replicas_configured():
+        return DEFAULT_DB_ALIAS
+    if reads.alias is None:
+        alias = pick_replica()
+        with _routing_lock:
+            if reads.alias is None:
+                reads.alias = alias
+    return reads.alias
+
+
+# Returns the alias of a caught-up replica, or of the primary if none
+# is.
+def pick_replica():
+    replica_settings = settings.DATABASE_REPLICAS
+    aliases = replica_settings["ALIASES"]
+    global _next_replica_index
+    with _routing_lock:
+        start_index = _next_replica_index
+        _next_replica_index = (_next_replica_index + 1) % len(aliases)
+    max_lag = replica_settings.get("MAX_LAG_SECONDS", 1)
+    check_interval = replica_settings.get("LAG_CHECK_INTERVAL", 1)
+    for offset in range(len(aliases)):
+        alias = aliases[(start_index + offset) % len(aliases)]
+        lag = get_lag_monitor(alias).lag(check_interval)
+        if lag is not None and lag <= max_lag:
+            _count("replica_reads", alias)
+            return alias
+    _count("lag_fallbacks")
+    return DEFAULT_DB_ALIAS
+
+
+# The connection a raw SQL read should use; see read_db_alias().
+def read_connection():
+    return connections[read_db_alias()]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_db_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # The replicas hold the same rows as the primary.
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+# Returns whether a GET may read from the replicas: not if the client
+# wrote within the last STICKY_SECONDS seconds (see stick_to_primary()),
+# or wrote earlier in the same /batch, and not in a ?snapshot=1 batch,
+# whose transaction is on the primary.
+def replica_reads_allowed(request):
+    if not replicas_configured():
+        return False
+    if request.META.get("moundmusic.snapshot") or request.META.get(
+        "moundmusic.read_primary"
+    ):
+        return False
+    try:
+        read_primary_until = float(request.COOKIES.get(STICKY_COOKIE_NAME, 0))
+    except ValueError:
+        read_primary_until = 0
+    if read_primary_until > time.time():
+        _count("sticky_requests")
+        return False
+    return True
+
+
+# Sets the cookie that has the client's next requests read from the
+# primary, on the response to a successful write.
+def stick_to_primary(response):
+    if not replicas_configured():
+        return
+    sticky_seconds = settings.DATABASE_REPLICAS.get("STICKY_SECONDS", 5)
+    response.set_cookie(
+        STICKY_COOKIE_NAME,
+        str(time.time() + sticky_seconds),
+        max_age=sticky_seconds,
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+# Yields a streamed response's chunks under the request's
+# replica_reads(), since the queries behind them only run as it's
+# iterated, after the endpoint function has returned.
+def replica_streaming_content(streaming_content, reads):
+    with replica_reads(reads):
+        yield from streaming_content
+
+
+# The counters behind the "replicas" key of the /db_stats endpoint: the
+# requests whose reads were sent to each replica, the requests that read
+# from the primary because no replica was caught up, the GETs that read
+# from the primary because their client had just written, and each
+# replica's last measured lag in seconds.
+def routing_stats():
+    with _routing_lock:
+        stats = {
+            "replica_reads": dict(_routing_stats["replica_reads"]),
+            "lag_fallbacks": _routing_stats["lag_fallbacks"],
+            "sticky_requests": _routing_stats["sticky_requests"],
+        }
+    aliases = settings.DATABASE_REPLICAS["ALIASES"] if replicas_configured() else ()
+    stats["lag_seconds"] = {
+        alias: get_lag_monitor(alias).last_lag() for alias in aliases
+    }
+    return stats
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+
+import functools
+import statistics
+import threading
+import time
+
+from collections import deque
+
+from django.db import DatabaseError, connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from albums.models import (
+    Album,
+    AlbumGenreBridge,
+    AlbumSongBridge,
+    Artist,
+    ArtistAlbumBridge,
+    ArtistGenreBridge,
+    ArtistSongBridge,
+    BuyerAccount,
+    Genre,
+    SellerAccount,
+    Song,
+    SongGenreBridge,
+    SongLyrics,
+    ToBuyListing,
+    ToSellListing,
+    User,
+    UserPassword,
+)
+from moundmusic.cacheutils import add_to_pk_filter, get_pk_filter
+
+
+# Every table this package serves has a SERIAL primary key column (see
+# postgres/moundmusic_init.sql), so these are the model classes whose
+# tables have a sequence that allocates their primary key values.
+SERIAL_PK_MODEL_CLASSES = (
+    Album,
+    AlbumGenreBridge,
+    AlbumSongBridge,
+    Artist,
+    ArtistAlbumBridge,
+    ArtistGenreBridge,
+    ArtistSongBridge,
+    BuyerAccount,
+    Genre,
+    SellerAccount,
+    Song,
+    SongGenreBridge,
+    SongLyrics,
+    ToBuyListing,
+    ToSellListing,
+    User,
+    UserPassword,
+)
+
+
+# The model classes whose primary key values appear in the URLs this
+# package serves, so whose primary key filters are worth building
+# before the first request asks about them.
+PK_FILTERED_MODEL_CLASSES = (
+    Album,
+    Artist,
+    BuyerAccount,
+    Genre,
+    SellerAccount,
+    Song,
+    ToBuyListing,
+    ToSellListing,
+    User,
+)
+
+
+# Builds the primary key filters (see moundmusic.cacheutils) for the
+# model classes, or rebuilds any that are due. moundmusic.wsgi calls
+# this when a worker starts. If the database can't be reached yet, each
+# filter is built by the first request that needs it instead.
+def warm_pk_filters(model_classes=PK_FILTERED_MODEL_CLASSES):
+    try:
+        for model_class in model_classes:
+            pk_filter = get_pk_filter(model_class)
+            if pk_filter is not None:
+                pk_filter.warm()
+    except DatabaseError:
+        pass
+
+
+# Opens database connections before the first request, so it doesn't
+# wait on one: the pool's MIN_SIZE connections, with a pool, or else the
+# calling thread's own (see moundmusic.pooled_postgresql). moundmusic.wsgi
+# calls this when a worker starts. If the database can't be reached yet,
+# the connections are opened by the requests that need them instead.
+def warm_database_connections():
+    try:
+        connection.warm()
+    except DatabaseError:
+        pass
+
+
+# This function creates a new row in the model class's table and returns
+# the model object for it. No primary key column value is set, so django
+# issues an INSERT ... RETURNING and postgres allocates the value from
+# the column's SERIAL sequence. That costs the same no matter how large
+# the table is, and nextval() never hands the same value to two
+# transactions, so parallel inserts can't collide. (This replaces a
+# workaround that computed max(primary key)+1 over the whole table in
+# python.) The new primary key value is added to the model's primary key
+# filter (see moundmusic.cacheutils), so the row is found by requests
+# made before the next catch-up.
+def insert_model_obj(model_class, **column_values):
+    model_obj = model_class(**column_values)
+    model_obj.save(force_insert=True)
+    add_to_pk_filter(model_class, [model_obj.pk])
+    return model_obj
+
+
+# If rows were ever inserted with explicit primary key values (as the
+# max()+1 workaround did, or as a restored data dump might), a table's
+# sequence can lag behind the primary key values already in use, and
+# insert_model_obj() fails with an IntegrityError when nextval() returns
+# one of them. This function moves each table's sequence past the
+# greatest primary key value in the table. It's idempotent and only
+# needs to be run once per database, via `manage.py resync_sequences`.
+def resync_pk_sequences(model_classes=SERIAL_PK_MODEL_CLASSES):
+    with connection.cursor() as cursor:
+        for model_class in model_classes:
+            table_name = model_class._meta.db_table
+            pk_col_name = model_class._meta.pk.column
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, %s), "
+                + f"COALESCE(MAX({pk_col_name}), 0) + 1, false) "
+                + f"FROM {table_name};",
+                (table_name, pk_col_name),
+            )
+
+
+# Returns a dict of each column in the model class's table to its
+# postgres type, as format_type() spells it (eg. "character
+# varying(256)", "date", "gender_type"). The django field classes can't
+# be relied on for this: the `gender` columns are a postgres ENUM that
+# the models declare as a TextField. Raw SQL that casts values to their
+# columns' types (see moundmusic.viewutils.bulk_update_response()) uses
+# this. The types don't change while the server's running, so each
+# table's are looked up once.
+@functools.lru_cache(maxsize=None)
+def column_pg_types(model_class):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute "
+            + "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped;",
+            (model_class._meta.db_table,),
+        )
+        return dict(cursor.fetchall())
+
+
+# Keeps the durations of the last `window` queries run on any connection
+# in this process, so the response cache can tell when postgres is slow
+# (see moundmusic.viewutils.cached_get_response()). The median is used
+# rather than the mean, so one slow query (a large bulk insert, say)
+# doesn't make the database look slow when it isn't.
+class QueryLatencyMonitor:
+    def __init__(self, window=50):
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=window)
+
+    # Used as a django execute wrapper; see monitor_query_latency().
+    def __call__(self, execute, sql, params, many, context):
+        start_time = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start_time
+            with self._lock:
+                self._durations.append(duration)
+
+    def median(self):
+        with self._lock:
+            durations = list(self._durations)
+        return statistics.median(durations) if durations else None
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+
+
+query_latency_monitor = QueryLatencyMonitor()
+
+
+# Every connection opened after this module is imported (which is before
+# the first request) has its queries timed. A thread's connection object
+# is reused each time it reconnects (with CONN_MAX_AGE=0, that's every
+# request), so the wrapper is only added the first time.
+@receiver(connection_created)
+def monitor_query_latency(sender, connection, **kwargs):
+    if query_latency_monitor not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_latency_monitor)
+
+
+# Tests whether the median duration of recent queries is over
+# `threshold` seconds.
+def db_is_slow(threshold):
+    median = query_latency_monitor.median()
+    return median is not None and median > threshold
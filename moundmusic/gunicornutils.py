@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+from django.conf import settings
+
+# The django cache backends whose entries are private to each process.
+
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+# Returns the names of the settings whose caches keep their entries in
+# each process, where a write through one process can't make another's
+# entries stale: the response cache with its "lru" backend, and the
+# django caches that the response cache and the row cache are kept in.
+def process_local_caches():
+    process_local_caches = []
+    cache_aliases = set()
+    if settings.RESPONSE_CACHE["BACKEND"] == "lru":
+        process_local_caches.append("RESPONSE_CACHE")
+    elif settings.RESPONSE_CACHE["BACKEND"] == "django":
+        cache_aliases.add(settings.RESPONSE_CACHE["CACHE_ALIAS"])
+    if settings.ROW_CACHE:
+        cache_aliases.add(settings.ROW_CACHE["CACHE_ALIAS"])
+    for cache_alias in sorted(cache_aliases):
+        if settings.CACHES[cache_alias]["BACKEND"] in PROCESS_LOCAL_CACHE_BACKENDS:
+            process_local_caches.append(f"CACHES[{cache_alias!r}]")
+    return process_local_caches
+
+
+# The on_starting server hook of both launch profiles (gunicorn.conf.py
+# and gunicorn_asgi.conf.py). It refuses to start more than one worker
+# while any cache is private to each process. The number of workers is
+# gunicorn's, however it was set: with --workers, WEB_CONCURRENCY or
+# the config file.
+def refuse_workers_with_process_local_caches(server):
+    workers = server.cfg.workers
+    caches = process_local_caches()
+    if workers > 1 and caches:
+        raise SystemExit(
+            f"{workers} workers, but these caches are private to each "
+            + f"process: {', '.join(caches)}; use one worker, or point "
+            + "them at a shared cache"
+        )
@@ -0,0 +1,449 @@
+#!/usr/bin/python3
+
+import os
+import threading
+import time
+
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.postgresql import base
+from django.dispatch import receiver
+
+
+# django's postgresql backend, with two additions, configured by extra
+# keys of the DATABASES entry (see moundmusic.settings):
+#
+# * With CONN_MAX_AGE set, each thread keeps its connection between
+#   requests, as django does; django 3.2 only finds out a kept connection
+#   has gone bad (postgres restarted, an idle timeout killed it) when a
+#   query fails. Here a connection that's been idle for more than
+#   HEALTH_CHECK_IDLE seconds is checked with a SELECT 1 when the next
+#   request starts, and replaced if it doesn't answer.
+#
+# * With POOL set, connections are instead drawn from a ConnectionPool
+#   shared by every thread of the process (the request threads, the
+#   database threads of moundmusic.asyncviewutils, the response cache's
+#   background refreshes), and given back at the end of each request
+#   rather than closed. The pool holds at most MAX_SIZE connections; a
+#   checkout waits for one to be given back, for up to CHECKOUT_TIMEOUT
+#   seconds, when they're all in use. It opens MIN_SIZE of them when
+#   warmed (see moundmusic.dbutils.warm_database_connections()), and
+#   replaces any older than MAX_AGE seconds. A checkout of a connection
+#   that's been idle for more than HEALTH_CHECK_IDLE seconds is checked
+#   the same way.
+#
+# The time spent opening connections, the health checks and, for a
+# pool, its checkout waits and saturation are counted for the /db_stats
+# endpoint; see connection_stats().
+
+
+_stats_lock = threading.Lock()
+_stats = {
+    "connects": 0,
+    "connect_seconds": 0.0,
+    "health_checks": 0,
+    "health_check_failures": 0,
+}
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+
+# Runs a SELECT 1 on a psycopg2 connection in autocommit mode, so the
+# check leaves no transaction open, and returns whether it answered.
+def _connection_answers(conn):
+    _count("health_checks")
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except psycopg2.Error:
+        _count("health_check_failures")
+        return False
+    return True
+
+
+# Passed to a checkout in place of an idle connection: a free place in
+# the pool, in which it opens a connection of its own.
+_OPEN_SLOT = object()
+
+
+# A checkout waiting for a connection to be given back. Waiters are
+# served in the order they arrived, and a connection given back goes
+# straight to the first of them, so a thread that gives one back and
+# checks out again at once can't take it from under threads that have
+# been waiting longer.
+class _Waiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        min_size=0,
+        max_size=10,
+        max_age=None,
+        checkout_timeout=30,
+        health_check_idle=None,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_age = max_age
+        self.checkout_timeout = checkout_timeout
+        self.health_check_idle = health_check_idle
+        self._lock = threading.Lock()
+        # Idle connections, as (connection, opened at, given back at)
+        # tuples; the most recently given back is checked out first.
+        self._idle = deque()
+        self._waiters = deque()
+        # The time each checked out connection was opened, by its id().
+        self._in_use = dict()
+        self._open_count = 0
+        self._pid = os.getpid()
+        self._counters = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "max_in_use": 0,
+            "timeouts": 0,
+            "expired": 0,
+            "discarded": 0,
+        }
+
+    # A process forked from the one that opened the connections shares
+    # their sockets, so it forgets them, without closing them, which
+    # would end the sessions for the parent too.
+    def _forget_after_fork(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle.clear()
+                self._waiters.clear()
+                self._in_use.clear()
+                self._open_count = 0
+                self._pid = os.getpid()
+
+    def _expired(self, opened_at, now):
+        return self.max_age is not None and now - opened_at >= self.max_age
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    # Returns whether an idle connection can be checked out: it's open,
+    # not past MAX_AGE, and, if it's been idle for long enough, answers.
+    def _reusable(self, conn, opened_at, given_back_at):
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if self._expired(opened_at, now):
+            with self._lock:
+                self._counters["expired"] += 1
+            return False
+        if (
+            self.health_check_idle is not None
+            and now - given_back_at > self.health_check_idle
+        ):
+            return _connection_answers(conn)
+        return True
+
+    # Hands an idle connection's entry, or _OPEN_SLOT for a connection
+    # that was closed, to the first waiter, or else keeps it. Called
+    # with the lock held.
+    def _hand_over(self, entry):
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.entry = entry
+            waiter.event.set()
+        elif entry is _OPEN_SLOT:
+            self._open_count -= 1
+        else:
+            self._idle.append(entry)
+
+    # Returns an idle connection's entry or _OPEN_SLOT, and whether the
+    # checkout had to wait for it.
+    def _take(self, deadline):
+        with self._lock:
+            if not self._waiters:
+                if self._idle:
+                    return self._idle.pop(), False
+                if self._open_count < self.max_size:
+                    self._open_count += 1
+                    return _OPEN_SLOT, False
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+        if waiter.event.wait(max(deadline - time.monotonic(), 0)):
+            return waiter.entry, True
+        with self._lock:
+            # Handed one just as the wait timed out.
+            if waiter.entry is not None:
+                return waiter.entry, True
+            self._waiters.remove(waiter)
+            self._counters["timeouts"] += 1
+        raise psycopg2.OperationalError(
+            "no database connection was given back within "
+            + f"{self.checkout_timeout} seconds; all "
+            + f"{self.max_size} of the pool's are in use"
+        )
+
+    # Returns a connection, either an idle one or one newly opened with
+    # `connect`, a callable that opens one. Raises psycopg2's
+    # OperationalError, which django reports as its own, if none was
+    # given back within checkout_timeout seconds. An idle connection
+    # that can't be reused is closed and replaced by a new one.
+    def checkout(self, connect):
+        self._forget_after_fork()
+        start_time = time.monotonic()
+        entry, waited = self._take(start_time + self.checkout_timeout)
+        while True:
+            if entry is _OPEN_SLOT:
+                try:
+                    conn = connect()
+                except BaseException:
+                    with self._lock:
+                        self._hand_over(_OPEN_SLOT)
+                    raise
+                opened_at = time.monotonic()
+                break
+            conn, opened_at, given_back_at = entry
+            if self._reusable(conn, opened_at, given_back_at):
+                break
+            self._close_quietly(conn)
+            with self._lock:
+                self._counters["discarded"] += 1
+            entry = _OPEN_SLOT
+        wait_seconds = time.monotonic() - start_time
+        with self._lock:
+            self._in_use[id(conn)] = opened_at
+            self._counters["checkouts"] += 1
+            self._counters["max_in_use"] = max(
+                self._counters["max_in_use"], len(self._in_use)
+            )
+            if waited:
+                self._counters["waits"] += 1
+            self._counters["wait_seconds"] += wait_seconds
+            self._counters["max_wait_seconds"] = max(
+                self._counters["max_wait_seconds"], wait_seconds
+            )
+        return conn
+
+    # Takes a checked out connection back, rolling back whatever
+    # transaction it was left in and putting it back in autocommit mode,
+    # or closes it if that fails or it's past MAX_AGE.
+    def checkin(self, conn):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            opened_at = self._in_use.pop(id(conn), None)
+        if opened_at is None:
+            self._close_quietly(conn)
+            return
+        now = time.monotonic()
+        reusable = not conn.closed and not self._expired(opened_at, now)
+        if reusable:
+            try:
+                transaction_status = conn.get_transaction_status()
+                if transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = True
+            except psycopg2.Error:
+                reusable = False
+        if not reusable:
+            self._close_quietly(conn)
+        with self._lock:
+            if reusable:
+                self._hand_over((conn, opened_at, now))
+            else:
+                self._counters["discarded"] += 1
+                self._hand_over(_OPEN_SLOT)
+
+    # Closes a checked out connection instead of taking it back.
+    def discard(self, conn):
+        with self._lock:
+            if self._in_use.pop(id(conn), None) is None:
+                return
+        self._close_quietly(conn)
+        with self._lock:
+            self._counters["discarded"] += 1
+            self._hand_over(_OPEN_SLOT)
+
+    # Opens connections with `connect` until min_size are open.
+    def warm(self, connect):
+        self._forget_after_fork()
+        while True:
+            with self._lock:
+                if self._open_count >= self.min_size:
+                    return
+                self._open_count += 1
+            try:
+                conn = connect()
+            except BaseException:
+                with self._lock:
+                    self._hand_over(_OPEN_SLOT)
+                raise
+            now = time.monotonic()
+            with self._lock:
+                self._hand_over((conn, now, now))
+
+    # Closes the idle connections.
+    def close_idle(self):
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open_count -= len(idle)
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            in_use = len(self._in_use)
+            stats["open"] = self._open_count
+            stats["in_use"] = in_use
+            stats["idle"] = len(self._idle)
+            stats["waiting"] = len(self._waiters)
+        stats["min_size"] = self.min_size
+        stats["max_size"] = self.max_size
+        stats["saturation"] = in_use / self.max_size
+        stats["mean_wait_seconds"] = (
+            stats["wait_seconds"] / stats["checkouts"] if stats["checkouts"] else None
+        )
+        return stats
+
+
+_pools = dict()
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, pool_settings, health_check_idle=None):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                min_size=pool_settings.get("MIN_SIZE", 0),
+                max_size=pool_settings.get("MAX_SIZE", 10),
+                max_age=pool_settings.get("MAX_AGE"),
+                checkout_timeout=pool_settings.get("CHECKOUT_TIMEOUT", 30),
+                health_check_idle=health_check_idle,
+            )
+        return _pools[alias]
+
+
+# The counters behind the /db_stats endpoint: the connections opened and
+# the mean time it took to open one, the health checks run and failed,
+# and each pool's stats, by database alias.
+def connection_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["mean_connect_seconds"] = (
+        stats["connect_seconds"] / stats["connects"] if stats["connects"] else None
+    )
+    with _pools_lock:
+        pools = dict(_pools)
+    stats["pools"] = {alias: pool.stats() for alias, pool in pools.items()}
+    return stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, settings_dict, alias=DEFAULT_DB_ALIAS):
+        super().__init__(settings_dict, alias)
+        self.health_check_idle = settings_dict.get("HEALTH_CHECK_IDLE")
+        pool_settings = settings_dict.get("POOL")
+        if pool_settings:
+            self.pool = get_pool(alias, pool_settings, self.health_check_idle)
+        else:
+            self.pool = None
+        self.released_at = None
+        self.connected_pid = None
+
+    def _open_connection(self, conn_params):
+        start_time = time.monotonic()
+        conn = super().get_new_connection(conn_params)
+        _count("connects")
+        _count("connect_seconds", time.monotonic() - start_time)
+        return conn
+
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return self._open_connection(conn_params)
+        return self.pool.checkout(lambda: self._open_connection(conn_params))
+
+    # A pooled connection is given back at the end of each request,
+    # whatever CONN_MAX_AGE is; the pool decides how long it lives.
+    def connect(self):
+        super().connect()
+        self.connected_pid = os.getpid()
+        if self.pool is not None:
+            self.close_at = time.monotonic()
+
+    # A connection closed inside an atomic block is kept by django until
+    # the block exits, so a pooled one is closed rather than given back
+    # for another thread to check out in the meantime.
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                self.pool.discard(self.connection)
+            else:
+                self.pool.checkin(self.connection)
+
+    # Opens the pool's MIN_SIZE connections, giving back this thread's
+    # connection first, or, without a pool, opens this thread's.
+    def warm(self):
+        if self.pool is None:
+            self.ensure_connection()
+            return
+        self.close()
+        conn_params = self.get_connection_params()
+        with self.wrap_database_errors:
+            self.pool.warm(lambda: self._open_connection(conn_params))
+
+    # Replaces this thread's kept connection, before a request uses it,
+    # if it's been idle for more than HEALTH_CHECK_IDLE seconds and
+    # doesn't answer. Pooled connections are checked on checkout instead.
+    # A connection opened before the process was forked (by a server
+    # that loads the application before forking its workers) is shared
+    # with the parent, so it's forgotten, not closed, as the pool does.
+    def check_kept_connection(self):
+        if self.connection is not None and self.connected_pid != os.getpid():
+            self.connection = None
+            return
+        if (
+            self.pool is not None
+            or self.connection is None
+            or self.health_check_idle is None
+            or self.released_at is None
+            or self.in_atomic_block
+        ):
+            return
+        if time.monotonic() - self.released_at <= self.health_check_idle:
+            return
+        if self.connection.closed or not _connection_answers(self.connection):
+            self.close()
+
+
+@receiver(request_started)
+def check_kept_connections(**kwargs):
+    for conn in connections.all():
+        if isinstance(conn, DatabaseWrapper):
+            conn.check_kept_connection()
+
+
+@receiver(request_finished)
+def mark_connections_released(**kwargs):
+    now = time.monotonic()
+    for conn in connections.all():
+        if isinstance(conn, DatabaseWrapper):
+            conn.released_at = now
@@ -0,0 +1,30 @@
+#!/usr/bin/python3
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from rest_framework.renderers import BaseRenderer
+
+
+# The django REST framework picks a renderer for every request from its
+# Accept header before the endpoint function is even called, and
+# answers 406 Not Acceptable if no renderer produces that media type.
+# The list endpoints stream newline-delimited JSON on their own (see
+# moundmusic.viewutils.ndjson_streaming_response()), so this renderer
+# mostly exists to let an Accept: application/x-ndjson request through
+# to them. It's only actually used to render the framework's own error
+# responses for such a request.
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        objs = data if isinstance(data, list) else [data]
+        return b"".join(
+            json.dumps(obj, cls=DjangoJSONEncoder).encode("utf8") + b"\n"
+            for obj in objs
+        )
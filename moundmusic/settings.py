@@ -24,6 +24,8 @@ __export__ = (
     "TEMPLATES",
     "WSGI_APPLICATION",
     "DATABASES",
+    "DATABASE_REPLICAS",
+    "DATABASE_ROUTERS",
     "AUTH_PASSWORD_VALIDATORS",
     "LANGUAGE_CODE",
     "TIME_ZONE",
@@ -32,6 +34,21 @@ __export__ = (
     "USE_TZ",
     "STATIC_URL",
     "DEFAULT_AUTO_FIELD",
+    "REST_FRAMEWORK",
+    "PAGE_SIZE_DEFAULT",
+    "PAGE_SIZE_MAX",
+    "MULTI_GET_MAX",
+    "STREAM_CHUNK_SIZE",
+    "BULK_INSERT_MAX",
+    "BULK_INSERT_BATCH_SIZE",
+    "BULK_UPDATE_MAX",
+    "DATA_UPLOAD_MAX_MEMORY_SIZE",
+    "BATCH_MAX",
+    "RESPONSE_CACHE",
+    "CACHES",
+    "ROW_CACHE",
+    "PK_FILTER",
+    "ASYNC_VIEWS",
 )
 
 from pathlib import Path
@@ -119,18 +136,67 @@ with open(
     username = next(postgres_credentials).strip()
     password = next(postgres_credentials).strip()
 
+# The backend is django's postgresql one plus connection health checks
+# and an optional connection pool (see moundmusic.pooled_postgresql).
+# Each worker thread keeps its connection for CONN_MAX_AGE seconds
+# rather than opening one per request, and a connection that's sat idle
+# for more than HEALTH_CHECK_IDLE seconds is checked before it's used.
+# Setting POOL, to something like
+#
+#     {"MIN_SIZE": 2, "MAX_SIZE": 10, "MAX_AGE": 300, "CHECKOUT_TIMEOUT": 10}
+#
+# shares MAX_SIZE connections between all of a worker's threads instead,
+# MIN_SIZE of them opened when the worker starts; CONN_MAX_AGE is then
+# ignored. None leaves the pool off.
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "moundmusic.pooled_postgresql",
         "NAME": "moundmusic",
         "USER": username,
         "PASSWORD": password,
         "HOST": "localhost",
         # 'HOST': 'postgres',
         "PORT": 5432,
+        "CONN_MAX_AGE": 60,
+        "HEALTH_CHECK_IDLE": 5,
+        "POOL": None,
     }
 }
 
+# Read replicas (see moundmusic.dbrouters). Each line of
+# postgres_replicas.dat, if there is one, is the host:port of a
+# streaming replica of the database above, reached with the same
+# credentials and connection settings. GETs read from the replicas
+# whose replay lag is no more than MAX_LAG_SECONDS, measured once every
+# LAG_CHECK_INTERVAL seconds, and from the primary otherwise. A client
+# that writes reads from the primary for STICKY_SECONDS afterwards, so
+# it sees its own writes.
+
+replica_aliases = []
+if os.path.exists(os.path.join(BASE_DIR, "postgres_replicas.dat")):
+    with open(
+        os.path.join(BASE_DIR, "postgres_replicas.dat"), mode="r"
+    ) as postgres_replicas:
+        for replica_line in postgres_replicas:
+            if not replica_line.strip():
+                continue
+            replica_host, replica_port = replica_line.strip().rsplit(":", 1)
+            replica_alias = f"replica_{len(replica_aliases) + 1}"
+            DATABASES[replica_alias] = dict(
+                DATABASES["default"], HOST=replica_host, PORT=int(replica_port)
+            )
+            replica_aliases.append(replica_alias)
+
+DATABASE_REPLICAS = {
+    "ALIASES": replica_aliases,
+    "MAX_LAG_SECONDS": 1,
+    "LAG_CHECK_INTERVAL": 1,
+    "STICKY_SECONDS": 5,
+}
+
+DATABASE_ROUTERS = ["moundmusic.dbrouters.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -177,3 +243,189 @@ STATIC_URL = "/static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 APPEND_SLASH = False
+
+
+# Paging of the index endpoints (GET /albums, /artists, /genres, /songs
+# and /users). A request without ?limit= gets PAGE_SIZE_DEFAULT rows,
+# and no request can ask for more than PAGE_SIZE_MAX rows at once.
+
+PAGE_SIZE_DEFAULT = 100
+
+PAGE_SIZE_MAX = 1000
+
+# The most ids a multi-object GET (eg. GET /songs?ids=1,2,3) may list.
+
+MULTI_GET_MAX = 500
+
+
+# django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+# NDJSONRenderer is listed so that requests with an Accept:
+# application/x-ndjson header aren't refused before they reach the list
+# endpoints that stream that format.
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "rest_framework.renderers.JSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+        "moundmusic.renderers.NDJSONRenderer",
+    ]
+}
+
+
+# When a list endpoint streams its output (?stream=1 or Accept:
+# application/x-ndjson), rows are fetched from the server-side cursor
+# this many at a time.
+
+STREAM_CHUNK_SIZE = 2000
+
+
+# Bulk inserts (a JSON array POSTed to an index endpoint). No more than
+# BULK_INSERT_MAX objects are accepted in one request, and they're
+# INSERTed BULK_INSERT_BATCH_SIZE rows per statement, all in one
+# transaction.
+
+BULK_INSERT_MAX = 100000
+
+BULK_INSERT_BATCH_SIZE = 1000
+
+# Bulk updates and deletes (a JSON array PATCHed to an index endpoint,
+# or a DELETE to one with ?ids=). No more than BULK_UPDATE_MAX objects
+# may be updated or deleted in one request.
+
+BULK_UPDATE_MAX = 10000
+
+# A bulk insert of BULK_INSERT_MAX objects is well past django's default
+# 2.5 MB limit on the size of a request body.
+
+DATA_UPLOAD_MAX_MEMORY_SIZE = 64 * 1024 * 1024
+
+# The most requests a POST /batch may contain.
+
+BATCH_MAX = 100
+
+
+# The django cache that the row cache's shared tier (and the response
+# cache, with its "django" backend) keeps its entries in. Each line of
+# memcached_servers.dat, if there is one, is the host:port of a
+# memcached server, where every process sees the same entries.
+# Otherwise the local memory backend keeps them, privately to each
+# process, and the response cache and the row cache are off (see
+# below).
+
+memcached_servers = []
+if os.path.exists(os.path.join(BASE_DIR, "memcached_servers.dat")):
+    with open(
+        os.path.join(BASE_DIR, "memcached_servers.dat"), mode="r"
+    ) as memcached_servers_file:
+        memcached_servers = [
+            server_line.strip()
+            for server_line in memcached_servers_file
+            if server_line.strip()
+        ]
+
+if memcached_servers:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": memcached_servers,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        }
+    }
+
+
+# The response cache for the GET endpoints of the index, single-object
+# and association closures in moundmusic.viewutils (see
+# moundmusic.cacheutils). BACKEND is one of:
+#
+# "lru": an in-process LRU holding up to MAX_ENTRIES responses. Other
+#     processes don't see its invalidations, so it's only right for a
+#     single-process deployment; the gunicorn launch profiles refuse to
+#     start more than one worker with it (see moundmusic.gunicornutils).
+# "django": the django cache named by CACHE_ALIAS (see CACHES), with
+#     responses kept for up to TIMEOUT seconds. With a shared cache
+#     (memcached, redis) it's right for any number of processes.
+# None: no response cache.
+#
+# It's "django" with memcached servers configured, and None otherwise.
+#
+# Identical requests that miss at the same time wait for the first one
+# to build the response, for up to COALESCE_TIMEOUT seconds (0 turns
+# that off). With the "django" backend and FILL_LOCK_TIMEOUT set, a lock
+# in the shared cache does the same across processes, so a cold URL is
+# built once for the whole deployment; the lock is held for at most
+# FILL_LOCK_TIMEOUT seconds.
+#
+# FAMILIES gives each family of endpoints ("index" for the index
+# endpoints, "single" for the single-object ones, "association" for the
+# ones listing or showing an object's related objects) a freshness
+# window of FRESH seconds and a stale window of STALE seconds more. A
+# response past FRESH is served as it is while it's rebuilt on one of
+# REFRESH_WORKERS background threads. If the median duration of recent
+# queries is over SLOW_QUERY_SECONDS, a response a write has made stale
+# is served and rebuilt the same way, so requests don't queue up on a
+# slow database. Nothing is served past FRESH + STALE. A family that
+# isn't listed, or has no FRESH, serves responses until a write makes
+# them stale. With the "django" backend, responses are kept until the
+# end of their stale window if that's later than TIMEOUT.
+
+RESPONSE_CACHE = {
+    "BACKEND": "django" if memcached_servers else None,
+    "MAX_ENTRIES": 10000,
+    "CACHE_ALIAS": "default",
+    "TIMEOUT": 300,
+    "COALESCE_TIMEOUT": 30,
+    "FILL_LOCK_TIMEOUT": None,
+    "FAMILIES": {
+        "index": {"FRESH": 60, "STALE": 3600, "SLOW_QUERY_SECONDS": 0.25},
+        "single": {"FRESH": 300, "STALE": 3600, "SLOW_QUERY_SECONDS": 0.25},
+        "association": {"FRESH": 300, "STALE": 3600, "SLOW_QUERY_SECONDS": 0.25},
+    },
+    "REFRESH_WORKERS": 2,
+}
+
+# The row cache that existence checks and other lookups of a row by its
+# primary key go through (see moundmusic.cacheutils): an in-process LRU
+# of up to MAX_ENTRIES rows in front of the django cache named by
+# CACHE_ALIAS. Rows are kept for TIMEOUT seconds, or for the number of
+# seconds TIMEOUTS gives for their table; the user and account tables
+# change more often than the catalog tables. None turns it off.
+#
+# A process that writes a row invalidates it for every process through
+# the django cache, which only works if they all share it, so the row
+# cache is only on with memcached servers configured. A single-process
+# deployment may turn it on over the local memory backend too, as the
+# test suite does (see conftest.py); the gunicorn launch profiles refuse
+# to start more than one worker with it so (see
+# moundmusic.gunicornutils).
+
+row_cache_settings = {
+    "CACHE_ALIAS": "default",
+    "MAX_ENTRIES": 10000,
+    "TIMEOUT": 3600,
+    "TIMEOUTS": {"user_": 300, "buyer_account": 300, "seller_account": 300},
+}
+
+ROW_CACHE = row_cache_settings if memcached_servers else None
+
+# The primary key filter that answers 404s for ids that don't exist
+# without querying the database (see moundmusic.cacheutils). Rows
+# inserted by other processes are looked for at most once every
+# CATCH_UP_INTERVAL seconds, and the filter is rebuilt from scratch
+# every REBUILD_INTERVAL seconds. Ids above the highest one it has
+# scanned are always looked up. None turns it off.
+
+PK_FILTER = {"CATCH_UP_INTERVAL": 1, "REBUILD_INTERVAL": 300}
+
+# The async views served under ASGI (see moundmusic.asyncviewutils) run
+# their queries on a pool of DB_THREADS threads, each of which keeps a
+# database connection of its own.
+
+ASYNC_VIEWS = {"DB_THREADS": 8}
@@ -22,6 +22,12 @@ from moundmusic import views
 
 urlpatterns = [
     path("", views.site_index),
+    path("batch", views.batch),
+    path("batch/", views.batch),
+    path("cache_stats", views.cache_stats),
+    path("cache_stats/", views.cache_stats),
+    path("db_stats", views.db_stats),
+    path("db_stats/", views.db_stats),
     # /admin isn't supported because this package shares model classes
     # between apps, which makes it impossible to register them with
     # django.contrib.admin
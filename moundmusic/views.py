@@ -1,6 +1,20 @@
 #!/usr/bin/python3
 
+import io
+import json
+
+from urllib.parse import urlsplit, unquote_to_bytes
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, transaction
 from django.http.response import JsonResponse
+from django.urls import Resolver404, resolve
+
+from moundmusic.cacheutils import get_response_cache, get_row_cache, pk_filter_stats
+from moundmusic.dbrouters import STICKY_COOKIE_NAME, routing_stats, stick_to_primary
+from moundmusic.dbutils import query_latency_monitor
+from moundmusic.pooled_postgresql.base import connection_stats
 
 from rest_framework import status
 from rest_framework.decorators import api_view
@@ -16,16 +30,112 @@ def site_index(_):
     return JsonResponse(endpoints_help, status=status.HTTP_200_OK)
 
 
+# This view is for the /cache_stats endpoint. It returns the response
+# cache's counters (see moundmusic.cacheutils): hits, misses (of which
+# `stale` were entries invalidated by a write), stores, evictions,
+# invalidated tags, misses coalesced onto another request's, waits on
+# another process's fill lock, stale responses served (of which
+# `slow_db_stale_serves` were served because postgres was slow),
+# background refreshes and the hit rate, counted since the process
+# started. The row cache's counters are under "row_cache", or it's null
+# if the row cache is turned off. "query_latency_median" is the median
+# duration, in seconds, of the last queries run, which the response
+# cache compares with each endpoint family's SLOW_QUERY_SECONDS.
+# "pk_filters" has, for each table with a primary key filter, the number
+# of ids it found absent and maybe present, its catch-up queries, the
+# number of primary key values it holds, its bitmap's size and its
+# settled mark, the highest id it trusts a clear bit for.
+
+
+@api_view(["GET"])
+def cache_stats(_):
+    response_cache = get_response_cache()
+    row_cache = get_row_cache()
+    if response_cache is None:
+        stats = {"backend": None}
+    else:
+        stats = response_cache.stats()
+    stats["row_cache"] = None if row_cache is None else row_cache.stats()
+    stats["query_latency_median"] = query_latency_monitor.median()
+    stats["pk_filters"] = pk_filter_stats()
+    return JsonResponse(stats, status=status.HTTP_200_OK)
+
+
+# This view is for the /db_stats endpoint. It returns the database
+# connection counters (see moundmusic.pooled_postgresql): the
+# connections opened and the mean time one took to open, the health
+# checks run and failed and, under "pools", each connection pool's
+# counters by database alias. A pool's are its open, in-use and idle
+# connections, its saturation (the fraction of MAX_SIZE in use), the
+# most connections ever in use at once, the checkouts waiting now, its
+# checkouts, the checkouts that had to wait for a connection to be
+# given back, the total, mean and longest checkout times, the checkouts
+# that timed out, and the connections closed for being past MAX_AGE or
+# failing a health check. "pools" is empty if no pool is configured.
+# "replicas" has the read replica routing counters (see
+# moundmusic.dbrouters.routing_stats()).
+
+
+@api_view(["GET"])
+def db_stats(_):
+    stats = connection_stats()
+    stats["replicas"] = routing_stats()
+    return JsonResponse(stats, status=status.HTTP_200_OK)
+
+
 endpoints_help = {
     "endpoints": {
-        "site": {"/": {"GET": "Returns this help object."}},
+        "site": {
+            "/": {"GET": "Returns this help object."},
+            "/cache_stats": {
+                "GET": (
+                    "Returns the response cache's and the row cache's hit, "
+                    + "miss and eviction counters and their hit rates, and "
+                    + "the primary key filters' counters."
+                )
+            },
+            "/db_stats": {
+                "GET": (
+                    "Returns the database connection counters: connections "
+                    + "opened, health checks, each connection pool's "
+                    + "checkout wait times and saturation, and the "
+                    + "requests routed to each read replica and its lag."
+                )
+            },
+            "/batch": {
+                "POST": (
+                    "Accepts an array of {method, path, body} objects, runs "
+                    + "each as a request to this API, and returns an array of "
+                    + "{status, body} objects in the same order. With "
+                    + "?snapshot=1, a batch of GETs reads from one consistent "
+                    + "snapshot of the database."
+                )
+            },
+        },
         "albums": {
             "/albums": {
-                "GET": "Returns a list of all albums.",
-                "POST": "Adds the submitted object as a new album.",
+                "GET": (
+                    "Returns a page of albums in album id order. Accepts "
+                    + "?limit= and ?after=; the URL of the next page is given "
+                    + 'in the Link header with rel="next". With ?ids=1,2,3, '
+                    + "returns just those objects, plus the ids not found."
+                ),
+                "POST": (
+                    "Adds the submitted object as a new album, or each "
+                    + "object of a submitted array as a new album."
+                ),
+                "PATCH": (
+                    "Accepts an array of objects, each with an album_id and "
+                    + "the properties to change, and updates those albums."
+                ),
+                "DELETE": "Deletes the albums with the ids given by ?ids=.",
             },
             "/albums/{{albumId}}": {
-                "GET": "Returns the album with id {{albumId}}.",
+                "GET": (
+                    "Returns the album with id {{albumId}}. Accepts "
+                    + "?include=songs,artists,genres to embed those "
+                    + "collections in it."
+                ),
                 "PATCH": (
                     "Updates the album with id {{albumId}} according to "
                     + "the data submitted."
@@ -91,11 +201,28 @@ endpoints_help = {
         },
         "artists": {
             "/artists": {
-                "GET": "Returns a list of all artists.",
-                "POST": "Adds the submitted object as a new artist.",
+                "GET": (
+                    "Returns a page of artists in artist id order. Accepts "
+                    + "?limit= and ?after=; the URL of the next page is given "
+                    + 'in the Link header with rel="next". With ?ids=1,2,3, '
+                    + "returns just those objects, plus the ids not found."
+                ),
+                "POST": (
+                    "Adds the submitted object as a new artist, or each "
+                    + "object of a submitted array as a new artist."
+                ),
+                "PATCH": (
+                    "Accepts an array of objects, each with an artist_id and "
+                    + "the properties to change, and updates those artists."
+                ),
+                "DELETE": "Deletes the artists with the ids given by ?ids=.",
             },
             "/artists/{{artistId}}": {
-                "GET": "Returns the artist with id {{artistId}}.",
+                "GET": (
+                    "Returns the artist with id {{artistId}}. Accepts "
+                    + "?include=albums,songs,genres to embed those "
+                    + "collections in it."
+                ),
                 "PATCH": (
                     "Updates the artist with id {{artistId}} according "
                     + "to the data submitted."
@@ -161,11 +288,28 @@ endpoints_help = {
         },
         "genres": {
             "/genres": {
-                "GET": "Returns a list of all genres.",
-                "POST": "Adds the submitted object as a new genre.",
+                "GET": (
+                    "Returns a page of genres in genre id order. Accepts "
+                    + "?limit= and ?after=; the URL of the next page is given "
+                    + 'in the Link header with rel="next". With ?ids=1,2,3, '
+                    + "returns just those objects, plus the ids not found."
+                ),
+                "POST": (
+                    "Adds the submitted object as a new genre, or each "
+                    + "object of a submitted array as a new genre."
+                ),
+                "PATCH": (
+                    "Accepts an array of objects, each with a genre_id and "
+                    + "the properties to change, and updates those genres."
+                ),
+                "DELETE": "Deletes the genres with the ids given by ?ids=.",
             },
             "/genres/{{genreId}}": {
-                "GET": "Returns the genre with id {{genreId}}.",
+                "GET": (
+                    "Returns the genre with id {{genreId}}. Accepts "
+                    + "?include=albums,artists,songs to embed those "
+                    + "collections in it."
+                ),
                 "PATCH": (
                     "Updates the genre with id {{genreId}} according to "
                     + "the data submitted."
@@ -231,11 +375,28 @@ endpoints_help = {
         },
         "songs": {
             "/songs": {
-                "GET": "Returns a list of all songs.",
-                "POST": "Adds the submitted object as a new song.",
+                "GET": (
+                    "Returns a page of songs in song id order. Accepts "
+                    + "?limit= and ?after=; the URL of the next page is given "
+                    + 'in the Link header with rel="next". With ?ids=1,2,3, '
+                    + "returns just those objects, plus the ids not found."
+                ),
+                "POST": (
+                    "Adds the submitted object as a new song, or each "
+                    + "object of a submitted array as a new song."
+                ),
+                "PATCH": (
+                    "Accepts an array of objects, each with a song_id and "
+                    + "the properties to change, and updates those songs."
+                ),
+                "DELETE": "Deletes the songs with the ids given by ?ids=.",
             },
             "/songs/{{songId}}": {
-                "GET": "Returns the song with id {{songId}}.",
+                "GET": (
+                    "Returns the song with id {{songId}}. Accepts "
+                    + "?include=albums,artists,genres to embed those "
+                    + "collections in it."
+                ),
                 "PATCH": (
                     "Updates the song with id {{songId}} according to "
                     + "the data submitted."
@@ -321,8 +482,21 @@ endpoints_help = {
         },
         "users": {
             "/users": {
-                "GET": "Returns a list of all users.",
-                "POST": "Adds the submitted object as a new user.",
+                "GET": (
+                    "Returns a page of users in user id order. Accepts "
+                    + "?limit= and ?after=; the URL of the next page is given "
+                    + 'in the Link header with rel="next". With ?ids=1,2,3, '
+                    + "returns just those objects, plus the ids not found."
+                ),
+                "POST": (
+                    "Adds the submitted object as a new user, or each "
+                    + "object of a submitted array as a new user."
+                ),
+                "PATCH": (
+                    "Accepts an array of objects, each with a user_id and "
+                    + "the properties to change, and updates those users."
+                ),
+                "DELETE": "Deletes the users with the ids given by ?ids=.",
             },
             "/users/{{userId}}": {
                 "GET": "Returns the user with id {{userId}}.",
@@ -464,3 +638,170 @@ endpoints_help = {
         },
     }
 }
+
+
+# The /batch endpoint. Clients on high-latency links that need many
+# small GETs (or other requests) at once can POST them as one array of
+# {method, path, body} objects and get back one array of {status, body}
+# objects, saving a round trip per request.
+#
+# Each entry is resolved through the URLconf and handed straight to its
+# view function in-process, the same way the tests call the views. Since
+# that skips django's request handler, the request_started and
+# request_finished signals that open and close database connections
+# don't fire between entries, and every entry runs over the one
+# connection this request already has checked out.
+#
+# Entries run one after another, and by default each commits or fails
+# on its own, just as separate requests would. With ?snapshot=1, a batch
+# made up only of GETs is run inside one REPEATABLE READ, READ ONLY
+# transaction, so every entry sees the database as of the same moment.
+
+BATCH_METHODS = ("GET", "POST", "PATCH", "DELETE")
+
+
+@api_view(["POST"])
+def batch(request):
+    try:
+        entries = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"message": "JSON did not parse"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    result = validate_batch_entries(entries)
+    if isinstance(result, JsonResponse):
+        return result
+
+    snapshot = request.GET.get("snapshot") in ("1", "true")
+    if not snapshot:
+        response = JsonResponse(
+            [run_batch_entry(request, entry) for entry in entries],
+            status=status.HTTP_200_OK,
+            safe=False,
+        )
+        if request.META.get("moundmusic.read_primary"):
+            stick_to_primary(response)
+        return response
+    if any(entry["method"] != "GET" for entry in entries):
+        return JsonResponse(
+            {"message": "?snapshot=1 is only accepted for batches of GETs"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # SET TRANSACTION has to be the first statement in the transaction,
+    # so it's only issued if this atomic block is the outermost one. If
+    # a transaction is already open (as in the test suite, which wraps
+    # every test in one), the entries run in that instead.
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;"
+                )
+        results = [run_batch_entry(request, entry, snapshot=True) for entry in entries]
+    return JsonResponse(results, status=status.HTTP_200_OK, safe=False)
+
+
+# Checks that the batch is a JSON array of no more than
+# settings.BATCH_MAX objects, each with a `method` that's one of
+# BATCH_METHODS, a `path` string that's an absolute path and an optional
+# `body`. Returns None if it is, or a JsonResponse with a 400 error if
+# it isn't.
+def validate_batch_entries(entries):
+    if not isinstance(entries, list) or not entries:
+        message = "batch must be a non-empty JSON array of request objects"
+    elif len(entries) > settings.BATCH_MAX:
+        message = (
+            f"batch contains {len(entries)} requests; no more than "
+            + f"{settings.BATCH_MAX} are accepted"
+        )
+    else:
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                message = f"batch element {index} isn't a JSON object"
+            elif set(entry) - {"method", "path", "body"}:
+                message = (
+                    f"batch element {index} has unexpected properties: "
+                    + ", ".join(sorted(set(entry) - {"method", "path", "body"}))
+                )
+            elif entry.get("method") not in BATCH_METHODS:
+                message = f"batch element {index} 'method' isn't one of " + ", ".join(
+                    BATCH_METHODS
+                )
+            elif not isinstance(entry.get("path"), str) or not entry["path"].startswith(
+                "/"
+            ):
+                message = f"batch element {index} 'path' isn't an absolute path"
+            else:
+                continue
+            break
+        else:
+            return None
+    return JsonResponse({"message": message}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Runs one batch entry and returns its {status, body} object. The
+# entry's request is built from the batch request's WSGI environ, so it
+# carries the same headers, with the method, path, query string and
+# body swapped out. An If-None-Match header is dropped, since it was
+# sent for the batch, not for any one of its entries. The entries of a
+# ?snapshot=1 batch are marked to bypass the response cache: they read
+# the database as of the snapshot, which a write may since have made
+# stale, so they mustn't be served from the cache or stored in it. Once
+# an entry has written, the batch request is marked so the entries after
+# it read from the primary rather than a read replica, and the batch's
+# response has its client do the same for a while (see
+# moundmusic.dbrouters). The path is resolved against moundmusic.urls
+# even when the batch came in through the ASGI app, whose URLconf routes
+# to the async endpoint functions: the entries are run synchronously.
+def run_batch_entry(request, entry, snapshot=False):
+    method, path, body = entry["method"], entry["path"], entry.get("body")
+    url_parts = urlsplit(path)
+    try:
+        resolver_match = resolve(url_parts.path, urlconf="moundmusic.urls")
+    except Resolver404:
+        return {
+            "status": status.HTTP_404_NOT_FOUND,
+            "body": {"message": f"no endpoint at path {url_parts.path}"},
+        }
+    if resolver_match.func is batch:
+        return {
+            "status": status.HTTP_400_BAD_REQUEST,
+            "body": {"message": "a batch can't contain a request to /batch"},
+        }
+
+    body_bytes = b"" if body is None else json.dumps(body).encode("utf-8")
+    environ = dict(request.META)
+    environ.pop("HTTP_IF_NONE_MATCH", None)
+    environ.update(
+        {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": unquote_to_bytes(url_parts.path).decode("iso-8859-1"),
+            "QUERY_STRING": url_parts.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(body_bytes)),
+            "wsgi.input": io.BytesIO(body_bytes),
+            "moundmusic.snapshot": snapshot,
+        }
+    )
+    response = resolver_match.func(
+        WSGIRequest(environ), *resolver_match.args, **resolver_match.kwargs
+    )
+    if STICKY_COOKIE_NAME in response.cookies:
+        request.META["moundmusic.read_primary"] = True
+
+    # Error responses generated by the REST framework itself (such as a
+    # 405 for a method the endpoint doesn't accept) have to be rendered
+    # before their content can be read. A streamed response is collected
+    # into a list of the objects on its lines.
+    if response.streaming:
+        response_body = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+    else:
+        if hasattr(response, "render"):
+            response.render()
+        response_body = json.loads(response.content) if response.content else None
+    return {"status": response.status_code, "body": response_body}
@@ -1,16 +1,53 @@
 #!/usr/bin/python3
 
+import base64
+import functools
 import json
+import threading
 
 from datetime import date
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models.expressions import RawSQL
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.http.response import JsonResponse
+from django.utils.http import parse_etags
 
 from rest_framework import status
 from rest_framework.decorators import api_view
 
-from users.models import User, BuyerAccount, ToBuyListing
+from albums.models import row_serializer
+from users.models import User, BuyerAccount
+
+from moundmusic.dbrouters import (
+    primary_reads,
+    read_connection,
+    replica_reads,
+    replica_reads_active,
+    replica_reads_allowed,
+    replica_streaming_content,
+    stick_to_primary,
+)
+from moundmusic.dbutils import (
+    SERIAL_PK_MODEL_CLASSES,
+    column_pg_types,
+    db_is_slow,
+    insert_model_obj,
+)
+from moundmusic.cacheutils import (
+    add_to_pk_filter,
+    cached_model_obj,
+    get_response_cache,
+    invalidate_model_objs,
+    invalidate_tags,
+    link_tag,
+    link_write_tags,
+    pk_definitely_absent,
+    row_tag,
+    table_tag,
+)
 
 
 # A word on the endpoint function structure used in most of the endpoint
@@ -25,85 +62,181 @@ from users.models import User, BuyerAccount, ToBuyListing
 # handled.
 
 
-# This function validates input from a POST or PATCH submission of
-# an object intended to create a new row or modify an existing one.
-# It relies on the model class's __columns__ value, which is a dict
-# associating whose keys are all the columns in the table, and whose
-# values are python types to conform the data to. It also uses the model
-# class's __nullable__ value, which is a tuple listing keys whose values
+# This class validates input from a POST or PATCH submission of an
+# object intended to create a new row or modify an existing one. It
+# relies on the model class's __columns__ value, which is a dict whose
+# keys are all the columns in the table, and whose values are python
+# types to conform the data to. It also uses the model class's
+# __nullable_cols__ value, which is a tuple listing keys whose values
 # may be None.
-def validate_input(model_class, input_argd, all_nullable=False):
-    validated_dict = dict()
-    # Checking for property names not germane to this table.
-    diff = set(input_argd.keys()) - set(model_class.__columns__)
-    if diff:
-        diff_expr = ", ".join(f"'{key}'" for key in diff)
-        raise ValueError(
-            f"unexpected propert"
-            + ("ies" if len(diff) > 1 else "y")
-            + f" in input: {diff_expr}"
-        )
+#
+# Everything that depends only on the model class is worked out once,
+# when the validator is built: the set of columns, the set of nullable
+# columns, and a converter function for each column that tests the
+# input value for that column's type and returns the conformed value, or
+# raises a ValueError with the message to return to the client. One
+# validator per model class is built at import time; see
+# input_validators below.
+class InputValidator(object):
+    def __init__(self, model_class):
+        self.columns = frozenset(model_class.__columns__)
+        self.nullable_cols = frozenset(model_class.__nullable_cols__)
+        self.converters = {
+            column: self._build_converter(column, column_type)
+            for column, column_type in model_class.__columns__.items()
+        }
+
+    @staticmethod
+    def _build_converter(column, column_type):
+        if column_type is int:
+
+            def convert_int(value):
+                # Testing whether the value casts to int.
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError(
+                        f"value for '{column}' isn't an integer: " + str(value)
+                    )
+                # Testing whether the value is nonnegative. There's no
+                # use of integers in this package that doesn't require
+                # them to be nonnegative.
+                if value <= 0:
+                    raise ValueError(
+                        f"value for '{column}' isn't greater than 0: " + str(value)
+                    )
+                return value
+
+            return convert_int
+
+        elif column_type is str:
+            zero_length_message = f"value for '{column}' is a string of zero length"
+
+            def convert_str(value):
+                # If the value is a zero-length string, error out.
+                if not len(value):
+                    raise ValueError(zero_length_message)
+                return value
+
+            return convert_str
 
-    # Iterating across __columns__, testing each value in input_argd
-    # according to the python type.
-    for column, value in input_argd.items():
-        column_type = model_class.__columns__[column]
-        if value is None:
-            # If all_nullable=True or the model class accepts None for
-            # that value, error out.
-            if not all_nullable and column not in model_class.__nullable_cols__:
-                raise ValueError(
-                    f"value for '{column}' is null and column not nullable"
-                )
-        elif column_type is int:
-            # Testing whether the value casts to int.
-            try:
-                value = int(value)
-            except ValueError:
-                raise ValueError(
-                    f"value for '{column}' isn't an integer: " + str(value)
-                )
-            # Testing whether the value is nonnegative. There's no use
-            # of integers in this package that doesn't require them to
-            # be nonnegative.
-            if value <= 0:
-                raise ValueError(
-                    f"value for '{column}' isn't greater than 0: " + str(value)
-                )
-        elif column_type is str and not len(value):
-            # If the value is a zero-length string, error out.
-            raise ValueError(f"value for '{column}' is a string of zero length")
         elif column_type is date:
-            # Testing whether the value conforms to the iso 8601 format
-            # (YYYY-MM-DD) that datetime.date can instance a date from.
-            try:
-                value = date.fromisoformat(value)
-            except ValueError:
-                raise ValueError(
-                    f"value for '{column}' isn't in format YYYY-MM-DD and "
-                    + "column is a DATE"
-                )
+            not_a_date_message = (
+                f"value for '{column}' isn't in format YYYY-MM-DD and "
+                + "column is a DATE"
+            )
+
+            def convert_date(value):
+                # Testing whether the value conforms to the iso 8601
+                # format (YYYY-MM-DD) that datetime.date can instance a
+                # date from.
+                try:
+                    return date.fromisoformat(value)
+                except ValueError:
+                    raise ValueError(not_a_date_message)
+
+            return convert_date
+
         elif isinstance(column_type, tuple):
             # If the __columns__ value is a tuple, then this is a
             # postgres enumerated type and the input value must appear
             # in that tuple.
-            if value not in column_type:
-                enum_expr = (
-                    ", ".join(f"'{option}'" for option in column_type[:-1])
-                    + f" or '{column_type[-1]}'"
-                )
-                raise ValueError(
-                    f"value for '{column}' not one of {enum_expr} and column "
-                    + "is an ENUM type"
+            enum_values = frozenset(column_type)
+            enum_expr = (
+                ", ".join(f"'{option}'" for option in column_type[:-1])
+                + f" or '{column_type[-1]}'"
+            )
+            not_in_enum_message = (
+                f"value for '{column}' not one of {enum_expr} and column "
+                + "is an ENUM type"
+            )
+
+            def convert_enum(value):
+                try:
+                    in_enum = value in enum_values
+                except TypeError:
+                    in_enum = False
+                if not in_enum:
+                    raise ValueError(not_in_enum_message)
+                return value
+
+            return convert_enum
+
+        else:
+            return lambda value: value
+
+    # Validates one input object, returning the validated dict, or
+    # raising a ValueError at the first error found.
+    def validate(self, input_argd, all_nullable=False):
+        # Checking for property names not germane to this table.
+        diff = set(input_argd.keys()) - self.columns
+        if diff:
+            diff_expr = ", ".join(f"'{key}'" for key in diff)
+            raise ValueError(
+                f"unexpected propert"
+                + ("ies" if len(diff) > 1 else "y")
+                + f" in input: {diff_expr}"
+            )
+        validated_dict = dict()
+        converters = self.converters
+        for column, value in input_argd.items():
+            if value is None:
+                # If all_nullable=True or the model class accepts None
+                # for that value, error out.
+                if not all_nullable and column not in self.nullable_cols:
+                    raise ValueError(
+                        f"value for '{column}' is null and column not nullable"
+                    )
+                validated_dict[column] = value
+            else:
+                validated_dict[column] = converters[column](value)
+        return validated_dict
+
+    # Validates a list of input objects in one pass, as for a bulk
+    # endpoint. Rather than stopping at the first error, every object
+    # is validated; returns a list of the validated dicts, and a list
+    # of {"index": ..., "message": ...} objects, one for each input
+    # object that failed validation (empty if all of them passed).
+    def validate_many(self, input_list, all_nullable=False):
+        validated_list = list()
+        errors = list()
+        for index, input_argd in enumerate(input_list):
+            if not isinstance(input_argd, dict):
+                errors.append(
+                    {"index": index, "message": "array element isn't a JSON object"}
                 )
-        validated_dict[column] = value
-    return validated_dict
+                continue
+            try:
+                validated_list.append(self.validate(input_argd, all_nullable))
+            except ValueError as exception:
+                errors.append({"index": index, "message": exception.args[0]})
+        return validated_list, errors
+
+
+# One InputValidator per model class with a __columns__ value, built
+# when this module is imported.
+input_validators = {
+    model_class: InputValidator(model_class)
+    for model_class in SERIAL_PK_MODEL_CLASSES
+    if hasattr(model_class, "__columns__")
+}
+
+
+# This function validates input from a POST or PATCH submission using
+# the model class's InputValidator; it raises a ValueError with a
+# message suitable for the client at the first error found.
+def validate_input(model_class, input_argd, all_nullable=False):
+    return input_validators[model_class].validate(input_argd, all_nullable)
 
 
 # This utility function is used by every endpoint function that manages
 # more than one http method. They're written with inline functions for
 # each http method, and then this function is tail-called to dispatch
 # the correct one.
+#
+# A GET reads from the read replicas, if there are any and the client
+# hasn't just written, and a successful write has the client's next
+# requests read from the primary for a while (see moundmusic.dbrouters).
 def func_dispatch(functions, request):
     # Building a dispatch table.
     dispatch_table = dict()
@@ -114,13 +247,53 @@ def func_dispatch(functions, request):
         _, method = func_name.rsplit("_", 1)
         dispatch_table[method] = function
     method = request.method.lower()
-    # Tail calling the inline function for this http method, or erroring
-    # out if it's not defined (ie. this endpoint was accessed using an
+    # Calling the inline function for this http method, or erroring out
+    # if it's not defined (ie. this endpoint was accessed using an
     # unsupported http method).
-    if method in dispatch_table:
-        return dispatch_table[method]()
-    else:
+    if method not in dispatch_table:
         return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+    elif method != "get":
+        response = dispatch_table[method]()
+        if response.status_code < status.HTTP_400_BAD_REQUEST:
+            stick_to_primary(response)
+        return response
+    return replica_get_response(request, dispatch_table[method])
+
+
+# Calls the GET function of an endpoint, reading from one read replica
+# if there are any and the client hasn't just written. The endpoint
+# functions that only handle GET, and so don't go through
+# func_dispatch(), call it directly. Called from an async view that's
+# reading from a replica already (see moundmusic.asyncviewutils), it
+# goes on reading from that one.
+def replica_get_response(request, get_function):
+    if replica_reads_active():
+        return get_function()
+    elif not replica_reads_allowed(request):
+        return get_function()
+    with replica_reads() as reads:
+        response = get_function()
+    if response.streaming:
+        response.streaming_content = replica_streaming_content(
+            response.streaming_content, reads
+        )
+    return response
+
+
+# Records, on each endpoint function a higher-order function returns,
+# which higher-order function made it and with what arguments, so that
+# moundmusic.asyncviewutils can make its async counterpart for the ASGI
+# URLconf (see moundmusic.asgi_urls).
+def recorded_defclo(defclo):
+    @functools.wraps(defclo)
+    def defclo_wrapper(*args, **kwargs):
+        closure = defclo(*args, **kwargs)
+        closure.defclo_name = defclo.__name__
+        closure.defclo_args = args
+        closure.defclo_kwargs = kwargs
+        return closure
+
+    return defclo_wrapper
 
 
 # Refactored out some repeated code validating POST requests.
@@ -150,6 +323,11 @@ def validate_patch_request(request, model_class, model_id_attr_name, model_id_at
     # Trying to find a row in the `model_class._meta.db_table`
     # table where the `model_id_attr_name` column has the value
     # `model_id_attr_val`, or erroring out.
+    response = absent_model_obj_response(
+        model_class, model_id_attr_name, model_id_attr_val
+    )
+    if response is not None:
+        return response
     try:
         model_instance = model_class.objects.get(
             **{model_id_attr_name: model_id_attr_val}
@@ -185,8 +363,505 @@ def validate_patch_request(request, model_class, model_id_attr_name, model_id_at
     return model_instance, validated_input
 
 
+# The index endpoints page through their tables with a keyset cursor
+# rather than an OFFSET. The ?after= cursor handed to the client is
+# opaque, but it's just the urlsafe base64 encoding of the last primary
+# key column value on the previous page, so the next page is a range
+# scan on the primary key index that starts right where the last one
+# left off, no matter how deep into the table it is.
+def encode_page_cursor(model_obj_id):
+    return (
+        base64.urlsafe_b64encode(str(model_obj_id).encode("ascii"))
+        .decode("ascii")
+        .rstrip("=")
+    )
+
+
+def decode_page_cursor(cursor):
+    # The padding is stripped when the cursor is encoded, so it's put
+    # back before decoding. Any malformed cursor raises a ValueError
+    # (binascii.Error and UnicodeError are both subclasses of it).
+    padded_cursor = cursor + "=" * (-len(cursor) % 4)
+    model_obj_id = int(
+        base64.urlsafe_b64decode(padded_cursor.encode("ascii")).decode("ascii")
+    )
+    if model_obj_id < 0:
+        raise ValueError(f"negative id in cursor: {model_obj_id}")
+    return model_obj_id
+
+
+# Refactored out the code validating the ?limit= and ?after= query
+# parameters of a paged GET request. Returns a (limit, after) tuple,
+# where `after` is None if the first page was requested, or a
+# JsonResponse if either parameter doesn't validate.
+def validate_page_params(request):
+    limit_param = request.GET.get("limit")
+    if limit_param is None:
+        limit = settings.PAGE_SIZE_DEFAULT
+    else:
+        # The limit has to be an integer from 1 to the hard maximum page
+        # size, or error out.
+        try:
+            limit = int(limit_param)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= settings.PAGE_SIZE_MAX:
+            return JsonResponse(
+                {
+                    "message": "value for 'limit' isn't an integer between 1 "
+                    + f"and {settings.PAGE_SIZE_MAX}: {limit_param}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    after_param = request.GET.get("after")
+    if after_param is None:
+        after = None
+    else:
+        # The cursor has to decode to a primary key column value, or
+        # error out.
+        try:
+            after = decode_page_cursor(after_param)
+        except ValueError:
+            return JsonResponse(
+                {"message": f"value for 'after' isn't a valid cursor: {after_param}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    return limit, after
+
+
+# Builds the URL for the page following the current one. All the
+# other query parameters of the current request are carried over, so
+# only ?after= changes from page to page.
+def next_page_url(request, last_model_obj_id):
+    query_dict = request.GET.copy()
+    query_dict["after"] = encode_page_cursor(last_model_obj_id)
+    return request.build_absolute_uri(f"{request.path}?{query_dict.urlencode()}")
+
+
+# Validates an ?ids=1,2,3 query parameter, as used by the index
+# endpoints' multi-object GET and bulk DELETE. Returns the list of ids
+# with duplicates dropped, in the order given, or a JsonResponse if the
+# parameter is missing or malformed, or lists more than `max_ids` ids.
+def validate_ids_param(request, max_ids):
+    param = request.GET.get("ids", "")
+    try:
+        model_obj_ids = list(dict.fromkeys(int(obj_id) for obj_id in param.split(",")))
+        if any(obj_id <= 0 for obj_id in model_obj_ids):
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {
+                "message": "value for 'ids' isn't a comma-separated list of "
+                + f"integers greater than 0: {param}"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(model_obj_ids) > max_ids:
+        return JsonResponse(
+            {
+                "message": f"value for 'ids' has {len(model_obj_ids)} ids; no "
+                + f"more than {max_ids} are accepted at once"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return model_obj_ids
+
+
+# Returns a queryset of the `inner_model_class._meta.db_table` rows
+# that the bridge table associates with `outer_model_obj_id`. It's a
+# single query, using the bridge table lookup as a subquery, ordered by
+# primary key so the order is stable; it costs the same one query
+# whether 1 or 40,000 objects are associated.
+def associated_queryset(
+    outer_model_id_attr_name,
+    outer_model_obj_id,
+    inner_model_class,
+    inner_model_id_attr_name,
+    bridge_class,
+):
+    return inner_model_class.objects.filter(
+        **{
+            f"{inner_model_id_attr_name}__in": bridge_class.objects.filter(
+                **{outer_model_id_attr_name: outer_model_obj_id}
+            ).values(inner_model_id_attr_name)
+        }
+    ).order_by(inner_model_id_attr_name)
+
+
+# A GET of a single object can embed related collections in the
+# response with ?include=a,b, saving the client a round trip per
+# relation. Each relation a single_model_defclo() endpoint supports
+# is given by a loader function, which takes the object's id and returns
+# the serialized collection, costing one query. This builds the loader
+# for a relation kept in a bridge table; its output is the same as that
+# of the matching GET /<outer_model>/<outer_id>/<inner_model>.
+def bridge_include_loader(
+    outer_model_id_attr_name, inner_model_class, inner_model_id_attr_name, bridge_class
+):
+    serialize_row = row_serializer(inner_model_class)
+
+    def load_include(outer_model_obj_id):
+        rows, _ = serializable_rows(
+            associated_queryset(
+                outer_model_id_attr_name,
+                outer_model_obj_id,
+                inner_model_class,
+                inner_model_id_attr_name,
+                bridge_class,
+            ),
+            inner_model_class,
+        )
+        return [serialize_row(row) for row in rows]
+
+    return load_include
+
+
+# Validates an ?include= query parameter against the relations a
+# single_model_defclo() endpoint supports. Returns a tuple of the
+# relation names (empty if the parameter is absent), or a JsonResponse
+# if it names a relation the endpoint doesn't have.
+def validate_include_param(request, model_class, includes):
+    if "include" not in request.GET:
+        return ()
+    param = request.GET["include"]
+    relations = tuple(
+        dict.fromkeys(
+            relation.strip() for relation in param.split(",") if relation.strip()
+        )
+    )
+    if not relations or any(relation not in includes for relation in relations):
+        model_name = model_class.__name__.lower()
+        if includes:
+            message = (
+                "value for 'include' isn't a comma-separated list of "
+                + f"{model_name} relations ("
+                + ", ".join(sorted(includes))
+                + f"): {param}"
+            )
+        else:
+            message = f"{model_name} objects have no relations to include: {param}"
+        return JsonResponse({"message": message}, status=status.HTTP_400_BAD_REQUEST)
+    return relations
+
+
+# A GET request can narrow the columns it gets back with ?fields=a,b,c,
+# naming keys of the model class's __columns__. This validates that
+# parameter. Returns a tuple of the column names, None if the parameter
+# is absent (meaning all columns), or a JsonResponse if it names a
+# column the model class doesn't have. The tuple is in the order of
+# __columns__, however the parameter orders them, so every ordering gets
+# the same body and ETag, and the same compiled serializer (see
+# albums.models.row_serializer()).
+def validate_fields_param(request, model_class):
+    if "fields" not in request.GET:
+        return None
+    param = request.GET["fields"]
+    requested_fields = {field.strip() for field in param.split(",") if field.strip()}
+    unknown_fields = requested_fields - model_class.__columns__.keys()
+    if not requested_fields or unknown_fields:
+        return JsonResponse(
+            {
+                "message": "value for 'fields' isn't a comma-separated list of "
+                + f"{model_class.__name__.lower()} properties: {param}"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return tuple(
+        field for field in model_class.__columns__ if field in requested_fields
+    )
+
+
+# Narrows the SELECT of a queryset to the columns named by ?fields=, so
+# unrequested columns aren't read from the database. (The primary key
+# is always selected; django requires it.) If `related_name` is given,
+# the columns are those of the model joined in by select_related() under
+# that name, and `keep_fields` are the queryset's own columns to keep.
+def narrow_queryset(queryset, fields, related_name=None, keep_fields=()):
+    if fields is None:
+        return queryset
+    if related_name is None:
+        return queryset.only(*fields)
+    return queryset.only(
+        *keep_fields, related_name, *(f"{related_name}__{field}" for field in fields)
+    )
+
+
+# The read path for the list endpoints. Rather than building a model
+# object per row, the rows are fetched as tuples with values_list(), to
+# be passed to the model class's compiled serializer (see
+# albums.models.row_serializer()). If ?fields= left out the primary key
+# it's appended as the last column, since paging needs it; the
+# serializer ignores it. Any `extra_columns` (such as an annotated
+# row_version) come last, and are ignored by the serializer as well.
+# Returns the values_list queryset and the index of the primary key in
+# its rows.
+def serializable_rows(queryset, model_class, fields=None, extra_columns=()):
+    columns = tuple(model_class.__columns__.keys()) if fields is None else fields
+    pk_attname = model_class._meta.pk.attname
+    if pk_attname not in columns:
+        columns += (pk_attname,)
+    return queryset.values_list(*columns, *extra_columns), columns.index(pk_attname)
+
+
+# The list endpoints can stream their output instead of building the
+# whole JSON list in memory. A client opts in with ?stream=1 or with
+# an Accept: application/x-ndjson header. The response is then newline-
+# delimited JSON, one object per line, generated as the rows are read.
+def stream_requested(request):
+    return request.GET.get("stream") in ("1", "true") or (
+        "application/x-ndjson" in request.META.get("HTTP_ACCEPT", "")
+    )
+
+
+# Wraps an iterable of serialized objects in a StreamingHttpResponse.
+# The iterable is expected to be lazy, and to be reading its rows with
+# QuerySet.iterator(), which uses a server-side cursor on postgres;
+# that way only STREAM_CHUNK_SIZE rows are held in memory at a time,
+# however many rows are being returned.
+def ndjson_streaming_response(serialized_objs):
+    return StreamingHttpResponse(
+        (
+            json.dumps(serialized_obj, cls=DjangoJSONEncoder) + "\n"
+            for serialized_obj in serialized_objs
+        ),
+        content_type="application/x-ndjson",
+        status=status.HTTP_200_OK,
+    )
+
+
+# ETAGS
+#
+# Every table has a row_version column (see postgres/moundmusic_init.sql).
+# It's filled from one sequence that all the tables share when a row is
+# inserted, and a trigger gives the row a new value from it whenever an
+# UPDATE changes the row. Since the sequence only counts up, a row's
+# version changes whenever its content does, and no two rows anywhere
+# ever have the same version.
+#
+# The GET endpoints derive an ETag from the versions of the rows they
+# return. A client that sends the ETag back in an If-None-Match header
+# is answered with a 304 after one narrow query that reads only the
+# versions, and nothing is serialized. For a collection the ETag is
+# built from the greatest version among its rows and the number of rows
+# (an added or changed row raises the greatest version, and a removed
+# row lowers the count), plus whatever else decides which rows are in
+# it. The models don't declare the column (django would try to INSERT
+# it), so it's read with a RawSQL annotation or in raw SQL.
+
+
+# Returns an expression that annotate() can use to read the
+# `model_class._meta.db_table` table's row_version column.
+def row_version_annotation(model_class):
+    quote_name = connection.ops.quote_name
+    return RawSQL(f"{quote_name(model_class._meta.db_table)}.row_version", ())
+
+
+# Builds an ETag from the version values it's given. A representation
+# narrowed by ?fields= is a different body from the same rows' full one,
+# so the field list (as validate_fields_param() returns it, in the order
+# the properties are output) goes into the ETag too.
+def make_etag(*version_parts, fields=None):
+    if fields is not None:
+        version_parts += (".".join(fields),)
+    return '"' + "-".join(str(version_part) for version_part in version_parts) + '"'
+
+
+# Tests whether the request's If-None-Match header lists `etag` (or is
+# `*`). Like django's own conditional GET handling, this uses the weak
+# comparison, so a W/ prefix on a listed ETag is ignored.
+def etag_matches(request, etag):
+    if "HTTP_IF_NONE_MATCH" not in request.META:
+        return False
+    listed_etags = parse_etags(request.META["HTTP_IF_NONE_MATCH"])
+    return "*" in listed_etags or etag in (
+        listed_etag.removeprefix("W/") for listed_etag in listed_etags
+    )
+
+
+def not_modified_response(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+# If the request has an If-None-Match header, runs `version_sql`, which
+# must return a single row of the version values that the endpoint
+# builds its ETag from, and `fields` is its ?fields= list. If the ETag
+# they make is listed in the header, returns a 304 response; otherwise
+# returns None, and the endpoint handles the request in full. That
+# includes the case where the version query returns no row or a NULL,
+# which is left to the endpoint to answer with a 404 or an ETag-less
+# response as it would anyway.
+#
+# A response being rebuilt in the background (see cached_get_response())
+# is always built in full, since the header has already been answered.
+def conditional_get_response(request, version_sql, params, fields=None):
+    if "HTTP_IF_NONE_MATCH" not in request.META or getattr(
+        background_refresh, "active", False
+    ):
+        return None
+    with read_connection().cursor() as cursor:
+        cursor.execute(version_sql, params)
+        version_row = cursor.fetchone()
+    if version_row is None or None in version_row:
+        return None
+    etag = make_etag(*version_row, fields=fields)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    return None
+
+
+# Set on a thread while it rebuilds a stale response in the background.
+background_refresh = threading.local()
+
+
+# Serves a GET through the response cache (see moundmusic.cacheutils),
+# keyed by the request's full URL. `family` names the endpoint family
+# whose freshness and stale windows apply (see
+# settings.RESPONSE_CACHE['FAMILIES']), `tags` name the rows and tables
+# the response is built from, and `build_response` builds it on a miss.
+# Only a 200 is cached, and a streamed response is never looked up or
+# cached. A hit doesn't touch the database at all; if its ETag is listed
+# in the request's If-None-Match header, it's answered with a 304. A
+# stale hit is answered the same way, and the response is rebuilt on a
+# background thread. Identical requests that miss at the same time are
+# coalesced: one builds the response and the others are answered with
+# its bytes. Entries of a ?snapshot=1 batch (see moundmusic.views.batch())
+# bypass the cache.
+#
+# A GET reading from a read replica (see moundmusic.dbrouters) builds
+# the response to be cached from its replica too, if the family has a
+# freshness window to bound how long it's served; otherwise from the
+# primary. A GET reading from the primary, such as one from a client
+# that has just written, doesn't serve a response built from a replica,
+# which may not have its write yet, and builds one from the primary.
+def cached_get_response(request, family, tags, build_response):
+    response_cache = get_response_cache()
+    if (
+        response_cache is None
+        or stream_requested(request)
+        or request.META.get("moundmusic.snapshot")
+    ):
+        return build_response()
+    cache_key = request.build_absolute_uri()
+    reading_replica = replica_reads_active()
+    cached = response_cache.lookup(
+        cache_key, tags, family, db_is_slow, from_replica=reading_replica
+    )
+    if cached is not None and not cached[2]:
+        content, headers, _ = cached
+        return rendered_response(request, status.HTTP_200_OK, content, headers)
+    tag_versions = response_cache.tag_versions(tags)
+    from_replica = (
+        reading_replica and response_cache.family_windows(family)[0] is not None
+    )
+    flight_key = (cache_key, tag_versions, from_replica)
+
+    def _fill_cache_entry():
+        locked = response_cache.acquire_fill_lock(flight_key)
+        if not locked:
+            # Another process is building it; if that works out, this
+            # process shares what it stored.
+            cached = response_cache.wait_for_fill(*flight_key)
+            if cached is not None:
+                content, headers = cached
+                return None, (status.HTTP_200_OK, content, headers)
+        try:
+            with replica_reads() if from_replica else primary_reads():
+                response = build_response()
+            if (
+                response.streaming
+                or response.status_code == status.HTTP_304_NOT_MODIFIED
+            ):
+                # A 304 answers the If-None-Match header of the request
+                # that built it, so it can't be shared.
+                return response, None
+            headers = {
+                header_name: response[header_name]
+                for header_name in ("ETag", "Link")
+                if response.has_header(header_name)
+            }
+            if response.status_code == status.HTTP_200_OK:
+                response_cache.store(
+                    cache_key,
+                    tag_versions,
+                    response.content,
+                    headers,
+                    family,
+                    from_replica,
+                )
+            return response, (response.status_code, response.content, headers)
+        finally:
+            if locked:
+                response_cache.release_fill_lock(flight_key)
+
+    # The background thread doesn't go through django's request
+    # handling, so it closes its database connection itself.
+    def _refresh_cache_entry():
+        background_refresh.active = True
+        close_old_connections()
+        try:
+            return _fill_cache_entry()
+        finally:
+            background_refresh.active = False
+            close_old_connections()
+
+    if cached is not None:
+        content, headers, _ = cached
+        response_cache.refresh_in_background(flight_key, _refresh_cache_entry)
+        return rendered_response(request, status.HTTP_200_OK, content, headers)
+    response, shared = response_cache.coalesce(flight_key, _fill_cache_entry)
+    if response is not None:
+        return response
+    elif shared is None:
+        return build_response()
+    return rendered_response(request, *shared)
+
+
+# Builds a response from the rendered bytes and headers of one that's
+# been cached or built by another request. A 200 whose ETag is listed in
+# the request's If-None-Match header is answered with a 304.
+def rendered_response(request, status_code, content, headers):
+    if (
+        status_code == status.HTTP_200_OK
+        and "ETag" in headers
+        and etag_matches(request, headers["ETag"])
+    ):
+        return not_modified_response(headers["ETag"])
+    response = HttpResponse(
+        content, content_type="application/json", status=status_code
+    )
+    for header_name, header_value in headers.items():
+        response[header_name] = header_value
+    return response
+
+
+# Returns a 404 response if the primary key filter (see
+# moundmusic.cacheutils) knows there's no row in the model class's table
+# where the `model_id_attr_name` column has the value `model_obj_id`, or
+# None if there may be one and the caller has to look it up.
+def absent_model_obj_response(model_class, model_id_attr_name, model_obj_id):
+    if model_id_attr_name != model_class._meta.pk.name or not pk_definitely_absent(
+        model_class, model_obj_id
+    ):
+        return None
+    return JsonResponse(
+        {
+            "message": f"no {model_class.__name__.lower()} with "
+            + f"{model_id_attr_name}={model_obj_id}"
+        },
+        status=status.HTTP_404_NOT_FOUND,
+    )
+
+
 # A utility function used to validate two model classes with id values
-# and the model class for the bridge table that connects them.
+# and the model class for the bridge table that connects them. All three
+# rows are fetched in a single query: each table is LEFT JOINed onto a
+# one-row SELECT by its own condition, so every table's columns are NULL
+# in the result row if its row doesn't exist. That way one round trip
+# tells which of the three rows is missing, if any. Each model object
+# returned has its row's row_version set as an attribute. If the primary
+# key filter knows either id is absent, there's no query at all.
 def validate_bridgetab_models(
     left_model_class,
     left_model_attr_name,
@@ -196,14 +871,69 @@ def validate_bridgetab_models(
     right_model_attr_value,
     bridge_model_class,
 ):
-    # Trying to find a row in the `left_model_class._meta.db_table`
-    # table where the `left_model_attr_name` column has the value
-    # `left_model_attr_value`, or erroring out.
-    try:
-        left_model_obj = left_model_class.objects.get(
-            **{left_model_attr_name: left_model_attr_value}
+    for model_class, model_attr_name, model_attr_value in (
+        (left_model_class, left_model_attr_name, left_model_attr_value),
+        (right_model_class, right_model_attr_name, right_model_attr_value),
+    ):
+        response = absent_model_obj_response(
+            model_class, model_attr_name, model_attr_value
+        )
+        if response is not None:
+            return response
+    quote_name = connection.ops.quote_name
+    left_model_fields = left_model_class._meta.concrete_fields
+    right_model_fields = right_model_class._meta.concrete_fields
+    bridge_model_fields = bridge_model_class._meta.concrete_fields
+    select_cols_expr = ", ".join(
+        f"{table_alias}.{quote_name(field.column)}"
+        for table_alias, model_fields in (
+            ("left_tab", left_model_fields),
+            ("right_tab", right_model_fields),
+            ("bridge_tab", bridge_model_fields),
+        )
+        for field in model_fields
+    )
+    select_cols_expr += (
+        ", left_tab.row_version, right_tab.row_version, bridge_tab.row_version"
+    )
+    left_model_id_col = left_model_class._meta.get_field(left_model_attr_name).column
+    right_model_id_col = right_model_class._meta.get_field(right_model_attr_name).column
+    sql = (
+        f"SELECT {select_cols_expr} FROM (SELECT 1) AS one_row "
+        + f"LEFT JOIN {quote_name(left_model_class._meta.db_table)} AS left_tab "
+        + f"ON left_tab.{quote_name(left_model_id_col)} = %s "
+        + f"LEFT JOIN {quote_name(right_model_class._meta.db_table)} AS right_tab "
+        + f"ON right_tab.{quote_name(right_model_id_col)} = %s "
+        + f"LEFT JOIN {quote_name(bridge_model_class._meta.db_table)} AS bridge_tab "
+        + f"ON bridge_tab.{quote_name(left_model_id_col)} = %s "
+        + f"AND bridge_tab.{quote_name(right_model_id_col)} = %s "
+        + "LIMIT 1;"
+    )
+    with read_connection().cursor() as cursor:
+        cursor.execute(
+            sql,
+            (
+                left_model_attr_value,
+                right_model_attr_value,
+                left_model_attr_value,
+                right_model_attr_value,
+            ),
         )
-    except left_model_class.DoesNotExist:
+        result_row = cursor.fetchone()
+    left_model_values = result_row[: len(left_model_fields)]
+    right_model_values = result_row[
+        len(left_model_fields) : len(left_model_fields) + len(right_model_fields)
+    ]
+    bridge_model_values = result_row[
+        len(left_model_fields) + len(right_model_fields) : -3
+    ]
+    row_versions = result_row[-3:]
+
+    # If there's no row in the `left_model_class._meta.db_table` table
+    # where the `left_model_attr_name` column has the value
+    # `left_model_attr_value` (ie. its primary key came back NULL),
+    # error out.
+    if left_model_values[left_model_fields.index(left_model_class._meta.pk)] is None:
         return JsonResponse(
             {
                 "message": f"no {left_model_class.__name__.lower()} with "
@@ -211,14 +941,10 @@ def validate_bridgetab_models(
             },
             status=status.HTTP_404_NOT_FOUND,
         )
-    # Trying to find a row in the `right_model_class._meta.db_table`
-    # table where the `right_model_attr_name` column has the value
-    # `right_model_attr_value`, or erroring out.
-    try:
-        right_model_obj = right_model_class.objects.get(
-            **{right_model_attr_name: right_model_attr_value}
-        )
-    except right_model_class.DoesNotExist:
+    # If there's no row in the `right_model_class._meta.db_table` table
+    # where the `right_model_attr_name` column has the value
+    # `right_model_attr_value`, error out.
+    if right_model_values[right_model_fields.index(right_model_class._meta.pk)] is None:
         return JsonResponse(
             {
                 "message": f"no {right_model_class.__name__.lower()} with "
@@ -226,18 +952,14 @@ def validate_bridgetab_models(
             },
             status=status.HTTP_404_NOT_FOUND,
         )
-    # Trying to find a row in the `bridge_model_class._meta.db_table`
+    # If there's no row in the `bridge_model_class._meta.db_table`
     # table where the `left_model_attr_name` column value is
     # `left_model_attr_value` and the `right_model_attr_name` column
-    # value is `right_model_attr_value`, or erroring out.
-    try:
-        bridge_row = bridge_model_class.objects.get(
-            **{
-                left_model_attr_name: left_model_attr_value,
-                right_model_attr_name: right_model_attr_value,
-            }
-        )
-    except bridge_model_class.DoesNotExist:
+    # value is `right_model_attr_value`, error out.
+    if (
+        bridge_model_values[bridge_model_fields.index(bridge_model_class._meta.pk)]
+        is None
+    ):
         return JsonResponse(
             {
                 "message": f"{left_model_class.__name__.lower()} with "
@@ -247,10 +969,356 @@ def validate_bridgetab_models(
             },
             status=status.HTTP_404_NOT_FOUND,
         )
-    # Input is valid, returning.
+    # Input is valid, building the model objects and returning.
+    left_model_obj, right_model_obj, bridge_row = (
+        model_class.from_db(
+            connection.alias, [field.attname for field in model_fields], model_values
+        )
+        for model_class, model_fields, model_values in (
+            (left_model_class, left_model_fields, left_model_values),
+            (right_model_class, right_model_fields, right_model_values),
+            (bridge_model_class, bridge_model_fields, bridge_model_values),
+        )
+    )
+    for model_obj, row_version in zip(
+        (left_model_obj, right_model_obj, bridge_row), row_versions
+    ):
+        model_obj.row_version = row_version
     return left_model_obj, right_model_obj, bridge_row
 
 
+# Handles a GET to an index endpoint with ?ids=1,2,3, as a client
+# assembling a playlist or a cart makes instead of one GET per object.
+# The objects are fetched with one query (django renders the __in
+# lookup as IN (...), which postgres plans the same as = ANY(...)),
+# honoring ?fields=, and returned in the order their ids were given;
+# ids with no row in the table are listed separately.
+def multi_get_response(model_class, model_id_attr_name, request):
+    result = validate_ids_param(request, settings.MULTI_GET_MAX)
+    if isinstance(result, JsonResponse):
+        return result
+    else:
+        model_obj_ids = result
+    result = validate_fields_param(request, model_class)
+    if isinstance(result, JsonResponse):
+        return result
+    else:
+        fields = result
+    rows, pk_index = serializable_rows(
+        model_class.objects.filter(**{f"{model_id_attr_name}__in": model_obj_ids}),
+        model_class,
+        fields,
+    )
+    serialize_row = row_serializer(model_class, fields)
+    serializations_by_id = {row[pk_index]: serialize_row(row) for row in rows}
+    return JsonResponse(
+        {
+            "results": [
+                serializations_by_id[obj_id]
+                for obj_id in model_obj_ids
+                if obj_id in serializations_by_id
+            ],
+            "missing": [
+                obj_id for obj_id in model_obj_ids if obj_id not in serializations_by_id
+            ],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+# Handles a bulk insert: a JSON array of objects POSTed to an index
+# endpoint. Every object is validated in one pass, and if any of them
+# fail (or try to set the primary key), nothing is inserted and the
+# response lists each failed object's index in the array with its error
+# message. Otherwise all the rows are inserted with bulk_create() in one
+# transaction, as multi-row INSERT ... RETURNING statements that get the
+# new primary key values back from postgres, and the created objects
+# are returned in the order they were submitted.
+def bulk_insert_response(model_class, model_id_attr_name, posted_json):
+    if not posted_json:
+        return JsonResponse(
+            {"message": "empty JSON array"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(posted_json) > settings.BULK_INSERT_MAX:
+        return JsonResponse(
+            {
+                "message": f"JSON array has {len(posted_json)} objects; no more "
+                + f"than {settings.BULK_INSERT_MAX} may be inserted at once"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    validated_list, errors = input_validators[model_class].validate_many(posted_json)
+    errors.extend(
+        {
+            "index": index,
+            "message": f"a new {model_class.__name__.lower()} "
+            + f"object must not have a {model_id_attr_name} value",
+        }
+        for index, input_argd in enumerate(posted_json)
+        if isinstance(input_argd, dict) and model_id_attr_name in input_argd
+    )
+    if errors:
+        errors.sort(key=lambda error: error["index"])
+        return JsonResponse(
+            {
+                "message": f"{len(errors)} of {len(posted_json)} objects "
+                + "failed validation; none were inserted",
+                "errors": errors,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    with transaction.atomic():
+        new_model_objs = model_class.objects.bulk_create(
+            [model_class(**validated_args) for validated_args in validated_list],
+            batch_size=settings.BULK_INSERT_BATCH_SIZE,
+        )
+    add_to_pk_filter(
+        model_class, [new_model_obj.pk for new_model_obj in new_model_objs]
+    )
+    invalidate_model_objs(model_class)
+    return JsonResponse(
+        [new_model_obj.serialize() for new_model_obj in new_model_objs],
+        status=status.HTTP_201_CREATED,
+        safe=False,
+    )
+
+
+# Handles a POST to /<outer_model>/<outer_id>/<inner_model> whose id
+# property is a JSON array of ids, associating all of them with the
+# outer object. The ids are validated, then tested for existence with
+# one `__in` query, and the bridge rows for the ones that exist are
+# created with a single INSERT ... ON CONFLICT DO NOTHING; the bridge
+# tables' UNIQUE (a_id, b_id) constraints make postgres skip the pairs
+# that are already associated, and RETURNING reports which ones it
+# actually inserted. The response sorts the ids into those that were
+# newly linked, those that were already linked, and those with no row in
+# the inner model's table.
+def link_many_response(
+    outer_model_id_attr_name,
+    outer_model_obj_id,
+    inner_model_class,
+    inner_model_id_attr_name,
+    inner_model_obj_ids,
+    bridge_class,
+):
+    if not inner_model_obj_ids:
+        return JsonResponse(
+            {"message": f"value for '{inner_model_id_attr_name}' is an empty array"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(inner_model_obj_ids) > settings.BULK_INSERT_MAX:
+        return JsonResponse(
+            {
+                "message": f"value for '{inner_model_id_attr_name}' has "
+                + f"{len(inner_model_obj_ids)} ids; no more than "
+                + f"{settings.BULK_INSERT_MAX} may be linked at once"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    convert_id = input_validators[inner_model_class].converters[
+        inner_model_id_attr_name
+    ]
+    try:
+        inner_model_obj_ids = list(
+            dict.fromkeys(convert_id(obj_id) for obj_id in inner_model_obj_ids)
+        )
+    except ValueError as exception:
+        return JsonResponse(
+            {"message": exception.args[0]}, status=status.HTTP_400_BAD_REQUEST
+        )
+    extant_ids = set(
+        inner_model_class.objects.filter(
+            **{f"{inner_model_id_attr_name}__in": inner_model_obj_ids}
+        ).values_list(inner_model_id_attr_name, flat=True)
+    )
+    linked_ids = set()
+    if extant_ids:
+        quote_name = connection.ops.quote_name
+        bridge_outer_col = bridge_class._meta.get_field(outer_model_id_attr_name).column
+        bridge_inner_col = bridge_class._meta.get_field(inner_model_id_attr_name).column
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote_name(bridge_class._meta.db_table)} "
+                + f"({quote_name(bridge_outer_col)}, {quote_name(bridge_inner_col)}) "
+                + "SELECT %s, inner_id FROM unnest(%s::integer[]) AS inner_id "
+                + f"ON CONFLICT DO NOTHING RETURNING {quote_name(bridge_inner_col)};",
+                (outer_model_obj_id, sorted(extant_ids)),
+            )
+            linked_ids = {row[0] for row in cursor.fetchall()}
+        invalidate_tags(
+            link_write_tags(
+                bridge_class,
+                outer_model_id_attr_name,
+                outer_model_obj_id,
+                inner_model_id_attr_name,
+                linked_ids,
+            )
+        )
+    return JsonResponse(
+        {
+            "linked": [
+                obj_id for obj_id in inner_model_obj_ids if obj_id in linked_ids
+            ],
+            "already_linked": [
+                obj_id
+                for obj_id in inner_model_obj_ids
+                if obj_id in extant_ids and obj_id not in linked_ids
+            ],
+            "missing": [
+                obj_id for obj_id in inner_model_obj_ids if obj_id not in extant_ids
+            ],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+# Handles a bulk update: a JSON array of objects PATCHed to an index
+# endpoint, each with the primary key of the row to update plus the
+# columns to change. The objects are validated with the same rules as a
+# single PATCH, and if any of them fail, nothing is updated and the
+# response lists each failed object's index in the array with its error
+# message. Otherwise every row is updated by one UPDATE ... FROM (VALUES
+# ...) statement. Each VALUES row carries, for every column that any of
+# the objects changes, a flag saying whether this object changes it and
+# the new value; the SET clause keeps the existing value where the flag
+# is false. Values are cast to their columns' actual postgres types,
+# since some of them (the ENUM columns) aren't what the models declare.
+# The response lists the ids that were updated and the ids that have no
+# row in the table.
+def bulk_update_response(model_class, model_id_attr_name, posted_json):
+    if not isinstance(posted_json, list):
+        return JsonResponse(
+            {"message": "JSON isn't an array of objects"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not posted_json:
+        return JsonResponse(
+            {"message": "empty JSON array"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(posted_json) > settings.BULK_UPDATE_MAX:
+        return JsonResponse(
+            {
+                "message": f"JSON array has {len(posted_json)} objects; no more "
+                + f"than {settings.BULK_UPDATE_MAX} may be updated at once"
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    input_validator = input_validators[model_class]
+    convert_id = input_validator.converters[model_id_attr_name]
+    updates = list()
+    seen_ids = set()
+    errors = list()
+    for index, input_argd in enumerate(posted_json):
+        try:
+            if not isinstance(input_argd, dict):
+                raise ValueError("array element isn't a JSON object")
+            changes = dict(input_argd)
+            model_obj_id = changes.pop(model_id_attr_name, None)
+            if model_obj_id is None:
+                raise ValueError(f"object has no {model_id_attr_name} value")
+            model_obj_id = convert_id(model_obj_id)
+            if not changes:
+                raise ValueError("object has no properties to update")
+            changes = input_validator.validate(changes, all_nullable=True)
+            if model_obj_id in seen_ids:
+                raise ValueError(
+                    f"duplicate {model_id_attr_name} value: {model_obj_id}"
+                )
+        except ValueError as exception:
+            errors.append({"index": index, "message": exception.args[0]})
+        else:
+            updates.append((model_obj_id, changes))
+            seen_ids.add(model_obj_id)
+    if errors:
+        return JsonResponse(
+            {
+                "message": f"{len(errors)} of {len(posted_json)} objects "
+                + "failed validation; none were updated",
+                "errors": errors,
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    quote_name = connection.ops.quote_name
+    pg_types = column_pg_types(model_class)
+    pk_col = model_class._meta.get_field(model_id_attr_name).column
+    columns = list(
+        dict.fromkeys(column for _, changes in updates for column in changes)
+    )
+    table_cols = [model_class._meta.get_field(column).column for column in columns]
+    values_row_expr = (
+        f"(%s::{pg_types[pk_col]}, "
+        + ", ".join(
+            f"%s::boolean, %s::{pg_types[table_col]}" for table_col in table_cols
+        )
+        + ")"
+    )
+    values_col_names = ", ".join(
+        ["obj_id"]
+        + [f"set_{col_no}, val_{col_no}" for col_no in range(len(table_cols))]
+    )
+    set_clause = ", ".join(
+        f"{quote_name(table_col)} = CASE WHEN changes.set_{col_no} "
+        + f"THEN changes.val_{col_no} ELSE target.{quote_name(table_col)} END"
+        for col_no, table_col in enumerate(table_cols)
+    )
+    params = list()
+    for model_obj_id, changes in updates:
+        params.append(model_obj_id)
+        for column in columns:
+            params.extend((column in changes, changes.get(column)))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {quote_name(model_class._meta.db_table)} AS target "
+            + f"SET {set_clause} FROM (VALUES "
+            + ", ".join([values_row_expr] * len(updates))
+            + f") AS changes ({values_col_names}) "
+            + f"WHERE target.{quote_name(pk_col)} = changes.obj_id "
+            + f"RETURNING target.{quote_name(pk_col)};",
+            params,
+        )
+        updated_ids = {row[0] for row in cursor.fetchall()}
+    invalidate_model_objs(model_class, updated_ids)
+    return JsonResponse(
+        {
+            "updated": [obj_id for obj_id, _ in updates if obj_id in updated_ids],
+            "missing": [obj_id for obj_id, _ in updates if obj_id not in updated_ids],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+# Handles a bulk delete: a DELETE to an index endpoint with
+# ?ids=1,2,3. The rows are deleted with one set-based DELETE ... WHERE
+# <primary key> IN (...) statement. django's collector runs first and
+# deletes the rows that reference them (bridge table rows, listings
+# and so on) just as deleting a single object does, likewise one
+# statement per referencing table rather than per row. The response
+# lists the ids that were deleted and the ids that have no row in the
+# table.
+def bulk_delete_response(model_class, model_id_attr_name, request):
+    result = validate_ids_param(request, settings.BULK_UPDATE_MAX)
+    if isinstance(result, JsonResponse):
+        return result
+    else:
+        model_obj_ids = result
+    with transaction.atomic():
+        extant_ids = set(
+            model_class.objects.filter(
+                **{f"{model_id_attr_name}__in": model_obj_ids}
+            ).values_list(model_id_attr_name, flat=True)
+        )
+        model_class.objects.filter(**{f"{model_id_attr_name}__in": extant_ids}).delete()
+    invalidate_model_objs(model_class, extant_ids, deleted=True)
+    return JsonResponse(
+        {
+            "deleted": [obj_id for obj_id in model_obj_ids if obj_id in extant_ids],
+            "missing": [obj_id for obj_id in model_obj_ids if obj_id not in extant_ids],
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
 # BEGIN higher-order functions
 #
 # Each function from this point forward defines and returns a closure
@@ -258,24 +1326,127 @@ def validate_bridgetab_models(
 
 
 # Handles index endpoints.
+@recorded_defclo
 def index_defclo(model_class, model_id_attr_name):
+    quote_name = connection.ops.quote_name
+    table_name = quote_name(model_class._meta.db_table)
+    pk_col_name = quote_name(model_class._meta.pk.column)
+
+    # A page's ETag is built from the rows on the page plus the one past
+    # its end (which decides whether there's a Link header): their
+    # greatest version, their number, and the greatest primary key among
+    # them. The last covers a row deleted from the page being replaced
+    # by the next one along, whose version may well be lower. (The
+    # primary keys are SERIAL values, so the first page is the one
+    # after 0.)
+    page_version_sql = (
+        f"SELECT MAX(row_version), COUNT(*), MAX({pk_col_name}) FROM "
+        + f"(SELECT {pk_col_name}, row_version FROM {table_name} "
+        + f"WHERE {pk_col_name} > %s ORDER BY {pk_col_name} LIMIT %s) AS page;"
+    )
 
     # BEGIN closure
-    @api_view(["GET", "POST"])
+    @api_view(["GET", "POST", "PATCH", "DELETE"])
     def index_closure(request):
+        # Served through the response cache. Any write to the table can
+        # change a page, so the table's tag is the only one needed.
         def _index_get():
-            return JsonResponse(
-                [model_obj.serialize() for model_obj in model_class.objects.all()],
-                status=status.HTTP_200_OK,
-                safe=False,
+            return cached_get_response(
+                request, "index", [table_tag(model_class)], _index_get_response
             )
 
-        def _index_post():
-            result = validate_post_request(request, model_class)
+        # Returns one page of the `model_class._meta.db_table` table,
+        # in primary key order. The body is a JSON list; if there's a
+        # following page, its URL is given in the Link header with
+        # rel="next".
+        def _index_get_response():
+            # ?ids=1,2,3 fetches just those objects instead of a page.
+            if "ids" in request.GET:
+                return multi_get_response(model_class, model_id_attr_name, request)
+            result = validate_page_params(request)
             if isinstance(result, JsonResponse):
                 return result
             else:
-                validated_args = result
+                limit, after = result
+            result = validate_fields_param(request, model_class)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                fields = result
+            if not stream_requested(request):
+                response = conditional_get_response(
+                    request,
+                    page_version_sql,
+                    (0 if after is None else after, limit + 1),
+                    fields,
+                )
+                if response is not None:
+                    return response
+            # The rows are read as tuples and serialized by the model
+            # class's compiled serializer; no model objects are built.
+            rows, pk_index = serializable_rows(
+                model_class.objects.annotate(
+                    row_version=row_version_annotation(model_class)
+                ).order_by(model_id_attr_name),
+                model_class,
+                fields,
+                extra_columns=("row_version",),
+            )
+            serialize_row = row_serializer(model_class, fields)
+            if after is not None:
+                rows = rows.filter(**{f"{model_id_attr_name}__gt": after})
+            # A streamed response isn't held in memory, so the default
+            # page size doesn't apply to it; it runs from the cursor (if
+            # any) to the end of the table, or to an explicit ?limit=.
+            if stream_requested(request):
+                if "limit" in request.GET:
+                    rows = rows[:limit]
+                return ndjson_streaming_response(
+                    serialize_row(row)
+                    for row in rows.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+                )
+            # One row past the end of the page is fetched, so that it's
+            # known whether there's a next page without a COUNT(*).
+            rows = list(rows[: limit + 1])
+            response = JsonResponse(
+                [serialize_row(row) for row in rows[:limit]],
+                status=status.HTTP_200_OK,
+                safe=False,
+            )
+            if len(rows) > limit:
+                next_url = next_page_url(request, rows[limit - 1][pk_index])
+                response["Link"] = f'<{next_url}>; rel="next"'
+            if rows:
+                response["ETag"] = make_etag(
+                    max(row[-1] for row in rows),
+                    len(rows),
+                    rows[-1][pk_index],
+                    fields=fields,
+                )
+            return response
+
+        def _index_post():
+            # Testing for valid JSON or erroring out.
+            try:
+                posted_json = json.loads(request.body)
+            except json.JSONDecodeError:
+                return JsonResponse(
+                    {"message": "JSON did not parse"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            # A JSON array of objects is a bulk insert.
+            if isinstance(posted_json, list):
+                return bulk_insert_response(
+                    model_class, model_id_attr_name, posted_json
+                )
+            # Testing for valid arguments (in the JSON object) or
+            # erroring out.
+            try:
+                validated_args = validate_input(model_class, posted_json)
+            except ValueError as exception:
+                return JsonResponse(
+                    {"message": exception.args[0]}, status=status.HTTP_400_BAD_REQUEST
+                )
             # If the input attempts to set the primary key column of the
             # `model_class._meta.db_table` table, error out.
             if model_id_attr_name in validated_args:
@@ -286,43 +1457,99 @@ def index_defclo(model_class, model_id_attr_name):
                     },
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            # This handles a bug where attempting to save a new model
-            # class object yields an IntegrityError that claims a
-            # pre-existing primary key column value was used. This
-            # when no primary key column value was set. (This bug is
-            # likely in pytest-django, not psycopg2.) This workaround
-            # pre-determines the next primary key column value.
-            max_id_attr_value = max(
-                getattr(row_obj, model_id_attr_name)
-                for row_obj in model_class.objects.filter()
-            )
-            new_args = validated_args.copy()
-            new_args[model_id_attr_name] = max_id_attr_value + 1
-            new_model_obj = model_class(**new_args)
-            new_model_obj.save()
+            new_model_obj = insert_model_obj(model_class, **validated_args)
+            invalidate_model_objs(model_class)
             return JsonResponse(
                 new_model_obj.serialize(), status=status.HTTP_201_CREATED
             )
 
-        return func_dispatch((_index_get, _index_post), request)
+        # Updates many rows in one statement; see bulk_update_response().
+        def _index_patch():
+            # Testing for valid JSON or erroring out.
+            try:
+                posted_json = json.loads(request.body)
+            except json.JSONDecodeError:
+                return JsonResponse(
+                    {"message": "JSON did not parse"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return bulk_update_response(model_class, model_id_attr_name, posted_json)
+
+        # Deletes the rows listed by ?ids= in one statement; see
+        # bulk_delete_response().
+        def _index_delete():
+            return bulk_delete_response(model_class, model_id_attr_name, request)
+
+        return func_dispatch(
+            (_index_get, _index_post, _index_patch, _index_delete), request
+        )
 
     # END closure
 
     return index_closure
 
 
-# Handles endpoints of the form "GET,PATCH,DELETE /<model_class>"
-def single_model_defclo(model_class, model_id_attr_name):
+# Handles endpoints of the form "GET,PATCH,DELETE /<model_class>". If
+# `includes` is given, it's a dict of relation names to loader functions
+# (see bridge_include_loader()), and a GET can embed those relations in
+# the object with ?include=.
+@recorded_defclo
+def single_model_defclo(model_class, model_id_attr_name, includes=None):
+    includes = dict() if includes is None else includes
+    quote_name = connection.ops.quote_name
+    version_sql = (
+        f"SELECT row_version FROM {quote_name(model_class._meta.db_table)} "
+        + f"WHERE {quote_name(model_class._meta.pk.column)} = %s;"
+    )
+
     # BEGIN closure
     @api_view(["GET", "PATCH", "DELETE"])
     def single_model_closure(request, model_obj_id):
+        # Served through the response cache, unless ?include= embeds
+        # related collections, which would need their tags as well.
         def _single_model_get():
+            if "include" in request.GET:
+                return _single_model_get_response()
+            return cached_get_response(
+                request,
+                "single",
+                [row_tag(model_class, model_obj_id)],
+                _single_model_get_response,
+            )
+
+        def _single_model_get_response():
+            result = validate_fields_param(request, model_class)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                fields = result
+            result = validate_include_param(request, model_class, includes)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                relations = result
+            response = absent_model_obj_response(
+                model_class, model_id_attr_name, model_obj_id
+            )
+            if response is not None:
+                return response
+            # The object's ETag is its row's version. An object with
+            # ?include= relations embedded gets none, since the version
+            # doesn't cover the related rows.
+            if not relations:
+                response = conditional_get_response(
+                    request, version_sql, (model_obj_id,), fields
+                )
+                if response is not None:
+                    return response
             # If the `model_class._meta.db_table` table doesn't have a
             # row where the `model_id_attr_name` column (ie. the primary
             # key) has the value `model_obj_id`, error out.
             try:
-                model_obj = model_class.objects.get(
-                    **{model_id_attr_name: model_obj_id}
+                model_obj = (
+                    narrow_queryset(model_class.objects, fields)
+                    .annotate(row_version=row_version_annotation(model_class))
+                    .get(**{model_id_attr_name: model_obj_id})
                 )
             except model_class.DoesNotExist:
                 return JsonResponse(
@@ -332,7 +1559,13 @@ def single_model_defclo(model_class, model_id_attr_name):
                     },
                     status=status.HTTP_404_NOT_FOUND,
                 )
-            return JsonResponse(model_obj.serialize(), status=status.HTTP_200_OK)
+            serialization = model_obj.serialize(fields)
+            for relation in relations:
+                serialization[relation] = includes[relation](model_obj_id)
+            response = JsonResponse(serialization, status=status.HTTP_200_OK)
+            if not relations:
+                response["ETag"] = make_etag(model_obj.row_version, fields=fields)
+            return response
 
         def _single_model_patch():
 
@@ -361,12 +1594,18 @@ def single_model_defclo(model_class, model_id_attr_name):
             for column, column_value in validated_input.items():
                 setattr(model_obj, column, column_value)
             model_obj.save()
+            invalidate_model_objs(model_class, [model_obj_id])
             return JsonResponse(model_obj.serialize(), status=status.HTTP_200_OK)
 
         def _single_model_delete():
             # If the `model_class._meta.db_table` table doesn't have a
             # row where the `model_id_attr_name` column (ie. the primary
             # key) has the value `model_obj_id`, error out.
+            response = absent_model_obj_response(
+                model_class, model_id_attr_name, model_obj_id
+            )
+            if response is not None:
+                return response
             try:
                 model_obj = model_class.objects.get(
                     **{model_id_attr_name: model_obj_id}
@@ -382,6 +1621,7 @@ def single_model_defclo(model_class, model_id_attr_name):
 
             # Delete the object from storage.
             model_obj.delete()
+            invalidate_model_objs(model_class, [model_obj_id], deleted=True)
             return JsonResponse(
                 {
                     "message": f"{model_class.__name__.lower()} with "
@@ -401,6 +1641,7 @@ def single_model_defclo(model_class, model_id_attr_name):
 
 # Handle endpoints of the form
 # "GET,POST /<outer_model>/<outer_id>/<inner_model>"
+@recorded_defclo
 def outer_id_inner_list_defclo(
     outer_model_class,
     outer_model_id_attr_name,
@@ -408,6 +1649,45 @@ def outer_id_inner_list_defclo(
     inner_model_id_attr_name,
     bridge_class,
 ):
+    quote_name = connection.ops.quote_name
+    outer_table_name = quote_name(outer_model_class._meta.db_table)
+    inner_table_name = quote_name(inner_model_class._meta.db_table)
+    bridge_table_name = quote_name(bridge_class._meta.db_table)
+    outer_id_col_name = quote_name(
+        outer_model_class._meta.get_field(outer_model_id_attr_name).column
+    )
+    inner_id_col_name = quote_name(
+        inner_model_class._meta.get_field(inner_model_id_attr_name).column
+    )
+
+    # The list's ETag is built from the outer row's version and, over
+    # the bridge rows and the `inner_model_class._meta.db_table` rows
+    # they link to, the greatest version and the number of pairs. A
+    # linked, unlinked or changed inner row changes one or the other.
+    # The outer row's version is included so that a list that's empty
+    # still gets an ETag (and one for an outer row that doesn't exist
+    # isn't made up).
+    collection_version_sql = (
+        "SELECT outer_tab.row_version, COALESCE(MAX(GREATEST("
+        + "bridge_tab.row_version, inner_tab.row_version)), 0), "
+        + f"COUNT(inner_tab.{inner_id_col_name}) "
+        + f"FROM {outer_table_name} AS outer_tab "
+        + f"LEFT JOIN {bridge_table_name} AS bridge_tab "
+        + f"ON bridge_tab.{outer_id_col_name} = outer_tab.{outer_id_col_name} "
+        + f"LEFT JOIN {inner_table_name} AS inner_tab "
+        + f"ON inner_tab.{inner_id_col_name} = bridge_tab.{inner_id_col_name} "
+        + f"WHERE outer_tab.{outer_id_col_name} = %s "
+        + "GROUP BY outer_tab.row_version;"
+    )
+    # Reads the same GREATEST() of the two rows' versions for each inner
+    # row that the list's rows are fetched with.
+    pair_version_expr = (
+        f"GREATEST({inner_table_name}.row_version, "
+        + f"(SELECT bridge_tab.row_version FROM {bridge_table_name} AS bridge_tab "
+        + f"WHERE bridge_tab.{outer_id_col_name} = %s AND "
+        + f"bridge_tab.{inner_id_col_name} = {inner_table_name}.{inner_id_col_name}))"
+    )
+
     # BEGIN closure
     @api_view(["GET", "POST"])
     def outer_id_inner_list_closure(request, outer_model_obj_id):
@@ -416,17 +1696,41 @@ def outer_id_inner_list_defclo(
         # with the member of the outer class mentioned. For example,
         # GET /albums/<albumId>/songs would return all songs with rows
         # in the albums_songs_bridge table associating them with that
-        # albumId.
+        # albumId. It's served through the response cache; the list
+        # changes with the outer object, with its links, and with any
+        # of the inner objects.
         def _outer_id_inner_list_get():
+            return cached_get_response(
+                request,
+                "association",
+                [
+                    row_tag(outer_model_class, outer_model_obj_id),
+                    link_tag(
+                        bridge_class, outer_model_id_attr_name, outer_model_obj_id
+                    ),
+                    table_tag(inner_model_class),
+                ],
+                _outer_id_inner_list_get_response,
+            )
+
+        def _outer_id_inner_list_get_response():
+            result = validate_fields_param(request, inner_model_class)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                fields = result
+            if not stream_requested(request):
+                response = conditional_get_response(
+                    request, collection_version_sql, (outer_model_obj_id,), fields
+                )
+                if response is not None:
+                    return response
             # If the `outer_model_class._meta.db_table` table doesn't
             # have a row where the `outer_model_id_attr_name` column
             # (ie. the primary key) has the value `outer_model_obj_id`,
             # error out.
-            try:
-                outer_model_class.objects.get(
-                    **{outer_model_id_attr_name: outer_model_obj_id}
-                )
-            except outer_model_class.DoesNotExist:
+            outer_model_obj = cached_model_obj(outer_model_class, outer_model_obj_id)
+            if outer_model_obj is None:
                 return JsonResponse(
                     {
                         "message": f"no {outer_model_class.__name__.lower()} "
@@ -435,24 +1739,40 @@ def outer_id_inner_list_defclo(
                     },
                     status=status.HTTP_404_NOT_FOUND,
                 )
-            # Uses the bridge table to fetch primary key values for the
-            # `inner_model_id_attr_name._meta.db_table`, then fetches
-            # the object with that id from that model class, for each
-            # id, and serializes the object so it can be jsonified.
-            bridge_rows = bridge_class.objects.filter(
-                **{outer_model_id_attr_name: outer_model_obj_id}
+            # Fetches the `inner_model_class._meta.db_table` rows that
+            # the bridge table associates with `outer_model_obj_id` in a
+            # single query; see associated_queryset().
+            rows, _ = serializable_rows(
+                associated_queryset(
+                    outer_model_id_attr_name,
+                    outer_model_obj_id,
+                    inner_model_class,
+                    inner_model_id_attr_name,
+                    bridge_class,
+                ),
+                inner_model_class,
+                fields,
             )
-            return_list = [
-                inner_model_class.objects.get(
-                    **{
-                        inner_model_id_attr_name: getattr(
-                            bridge_row, inner_model_id_attr_name
-                        )
-                    }
-                ).serialize()
-                for bridge_row in bridge_rows
-            ]
-            return JsonResponse(return_list, status=status.HTTP_200_OK, safe=False)
+            serialize_row = row_serializer(inner_model_class, fields)
+            if stream_requested(request):
+                return ndjson_streaming_response(
+                    serialize_row(row)
+                    for row in rows.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+                )
+            rows = list(
+                rows.annotate(
+                    row_version=RawSQL(pair_version_expr, (outer_model_obj_id,))
+                )
+            )
+            return_list = [serialize_row(row) for row in rows]
+            response = JsonResponse(return_list, status=status.HTTP_200_OK, safe=False)
+            response["ETag"] = make_etag(
+                outer_model_obj.row_version,
+                max((row[-1] for row in rows), default=0),
+                len(rows),
+                fields=fields,
+            )
+            return response
 
         # This method attempts to associate the member of the 2nd
         # class with the member of the 1st class. For example, POST
@@ -464,11 +1784,7 @@ def outer_id_inner_list_defclo(
             # have a row where the `outer_model_id_attr_name` column
             # (ie. the primary key) has the value `outer_model_obj_id`,
             # error out.
-            try:
-                outer_model_class.objects.get(
-                    **{outer_model_id_attr_name: outer_model_obj_id}
-                )
-            except outer_model_class.DoesNotExist:
+            if cached_model_obj(outer_model_class, outer_model_obj_id) is None:
                 return JsonResponse(
                     {
                         "message": f"no {outer_model_class.__name__.lower()} "
@@ -502,15 +1818,23 @@ def outer_id_inner_list_defclo(
                 )
             inner_model_obj_id = posted_json[inner_model_id_attr_name]
 
+            # A JSON array of ids links them all in one go.
+            if isinstance(inner_model_obj_id, list):
+                return link_many_response(
+                    outer_model_id_attr_name,
+                    outer_model_obj_id,
+                    inner_model_class,
+                    inner_model_id_attr_name,
+                    inner_model_obj_id,
+                    bridge_class,
+                )
+
             # Testing whether a row in the
             # `inner_model_class._meta.db_table` table with the column
             # `inner_model_id_attr_name` (ie. the primary key) having
             # the value `inner_model_obj_id` exists, or erroring out.
-            try:
-                inner_model_obj = inner_model_class.objects.get(
-                    **{inner_model_id_attr_name: inner_model_obj_id}
-                )
-            except inner_model_class.DoesNotExist:
+            inner_model_obj = cached_model_obj(inner_model_class, inner_model_obj_id)
+            if inner_model_obj is None:
                 return JsonResponse(
                     {
                         "message": f"no {inner_model_class.__name__.lower()} "
@@ -550,27 +1874,22 @@ def outer_id_inner_list_defclo(
                 )
             # Creating the association in the bridge table and saving
             # it.
-            bridge_table_name = bridge_class._meta.db_table
-            bridge_table_id_col = f"{bridge_table_name}_id"
-
-            # This handles a bug where attempting to save a new model
-            # class object yields an IntegrityError that claims a
-            # pre-existing primary key column value was used. This
-            # when no primary key column value was set. (This bug is
-            # likely in pytest-django, not psycopg2.) This workaround
-            # pre-determines the next primary key column value.
-            max_bridge_row_id = max(
-                getattr(bridge_row, bridge_table_id_col)
-                for bridge_row in bridge_class.objects.filter()
-            )
-            bridge_row = bridge_class(
+            insert_model_obj(
+                bridge_class,
                 **{
-                    bridge_table_id_col: max_bridge_row_id + 1,
                     outer_model_id_attr_name: outer_model_obj_id,
                     inner_model_id_attr_name: inner_model_obj_id,
-                }
+                },
+            )
+            invalidate_tags(
+                link_write_tags(
+                    bridge_class,
+                    outer_model_id_attr_name,
+                    outer_model_obj_id,
+                    inner_model_id_attr_name,
+                    [inner_model_obj_id],
+                )
             )
-            bridge_row.save()
             return JsonResponse(inner_model_obj.serialize(), status=status.HTTP_200_OK)
 
         return func_dispatch(
@@ -594,6 +1913,26 @@ def outer_id_inner_id_defclo(
     inner_model_id_attr_name,
     bridge_class,
 ):
+    quote_name = connection.ops.quote_name
+    outer_id_col_name = quote_name(
+        outer_model_class._meta.get_field(outer_model_id_attr_name).column
+    )
+    inner_id_col_name = quote_name(
+        inner_model_class._meta.get_field(inner_model_id_attr_name).column
+    )
+
+    # The object's ETag is the greater of its row's version and that of
+    # the bridge row linking it to the outer object. (The outer row
+    # can't be deleted while the bridge row exists.)
+    pair_version_sql = (
+        "SELECT GREATEST(inner_tab.row_version, bridge_tab.row_version) "
+        + f"FROM {quote_name(bridge_class._meta.db_table)} AS bridge_tab "
+        + f"JOIN {quote_name(inner_model_class._meta.db_table)} AS inner_tab "
+        + f"ON inner_tab.{inner_id_col_name} = bridge_tab.{inner_id_col_name} "
+        + f"WHERE bridge_tab.{outer_id_col_name} = %s "
+        + f"AND bridge_tab.{inner_id_col_name} = %s;"
+    )
+
     # BEGIN closure
     @api_view(["GET", "DELETE"])
     def outer_id_inner_id_closure(request, outer_model_obj_id, inner_model_obj_id):
@@ -602,8 +1941,36 @@ def outer_id_inner_id_defclo(
         # class by ID, and a single member of the inner class by
         # ID, where the 2nd member is returned. For example, a GET
         # /albums/<albumId>/songs/<songId> would return a JSON object of
-        # the song with that songId.
+        # the song with that songId. It's served through the response
+        # cache.
         def _outer_id_inner_id_get():
+            return cached_get_response(
+                request,
+                "association",
+                [
+                    row_tag(outer_model_class, outer_model_obj_id),
+                    row_tag(inner_model_class, inner_model_obj_id),
+                    link_tag(
+                        bridge_class, outer_model_id_attr_name, outer_model_obj_id
+                    ),
+                ],
+                _outer_id_inner_id_get_response,
+            )
+
+        def _outer_id_inner_id_get_response():
+            result = validate_fields_param(request, inner_model_class)
+            if isinstance(result, JsonResponse):
+                return result
+            else:
+                fields = result
+            response = conditional_get_response(
+                request,
+                pair_version_sql,
+                (outer_model_obj_id, inner_model_obj_id),
+                fields,
+            )
+            if response is not None:
+                return response
             result = validate_bridgetab_models(
                 outer_model_class,
                 outer_model_id_attr_name,
@@ -616,8 +1983,14 @@ def outer_id_inner_id_defclo(
             if isinstance(result, JsonResponse):
                 return result
             else:
-                _, inner_model, _ = result
-            return JsonResponse(inner_model.serialize(), status=status.HTTP_200_OK)
+                _, inner_model, bridge_row = result
+            response = JsonResponse(
+                inner_model.serialize(fields), status=status.HTTP_200_OK
+            )
+            response["ETag"] = make_etag(
+                max(inner_model.row_version, bridge_row.row_version), fields=fields
+            )
+            return response
 
         # Handles a DELETE request for a single member of the outer
         # class by ID, and a single member of the inner class by ID,
@@ -641,6 +2014,15 @@ def outer_id_inner_id_defclo(
             else:
                 _, _, bridge_row = result
             bridge_row.delete()
+            invalidate_tags(
+                link_write_tags(
+                    bridge_class,
+                    outer_model_id_attr_name,
+                    outer_model_obj_id,
+                    inner_model_id_attr_name,
+                    [inner_model_obj_id],
+                )
+            )
             return JsonResponse(
                 {
                     "message": f"association between "
@@ -676,6 +2058,7 @@ def outer_id_inner_id_defclo(
 
 # Handles requests of the form
 # "GET,POST /users/<user_id>/(buyer|seller)_account"
+@recorded_defclo
 def buyer_seller_acct_defclo(
     buyer_or_seller_account_class, buyer_or_seller_id_col_name
 ):
@@ -690,9 +2073,8 @@ def buyer_seller_acct_defclo(
         def _buyer_seller_acct_get():
             # Tests whether a User with user_id=<outer_model_obj_id>
             # exists, or errors out.
-            try:
-                user = User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            user = cached_model_obj(User, outer_model_obj_id)
+            if user is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -710,11 +2092,11 @@ def buyer_seller_acct_defclo(
                 )
             # Tests whether a buyer/seller account exists with that id,
             # or erros out.
-            try:
-                buyer_account = buyer_or_seller_account_class.objects.get(
-                    user_id=outer_model_obj_id
-                )
-            except buyer_or_seller_account_class.DoesNotExist:
+            buyer_account = cached_model_obj(
+                buyer_or_seller_account_class,
+                getattr(user, buyer_or_seller_id_col_name),
+            )
+            if buyer_account is None:
                 return JsonResponse(
                     {
                         "message": f"user with user_id={outer_model_obj_id} "
@@ -788,27 +2170,16 @@ def buyer_seller_acct_defclo(
             json_content["date_created"] = date.today()
             json_content["user_id"] = user.user_id
 
-            # This handles a bug where attempting to save a new model
-            # class object yields an IntegrityError that claims a
-            # pre-existing primary key column value was used. This
-            # when no primary key column value was set. (This bug is
-            # likely in pytest-django, not psycopg2.) This workaround
-            # pre-determines the next primary key column value.
-            max_buyer_or_seller_account_id = max(
-                getattr(buyer_or_seller_account, buyer_or_seller_id_col_name)
-                for buyer_or_seller_account in buyer_or_seller_account_class.objects.filter()
+            buyer_or_seller_account = insert_model_obj(
+                buyer_or_seller_account_class, **json_content
             )
-            new_args = json_content.copy()
-            new_args[buyer_or_seller_id_col_name] = max_buyer_or_seller_account_id + 1
-            buyer_or_seller_account = buyer_or_seller_account_class(**new_args)
-            buyer_or_seller_account.user_id = user.user_id
-            buyer_or_seller_account.save()
             setattr(
                 user,
                 buyer_or_seller_id_col_name,
                 getattr(buyer_or_seller_account, buyer_or_seller_id_col_name),
             )
             user.save()
+            invalidate_model_objs(User, [user.user_id])
             return JsonResponse(
                 buyer_or_seller_account.serialize(), status=status.HTTP_200_OK
             )
@@ -828,6 +2199,7 @@ def buyer_seller_acct_defclo(
 
 # Handles requests of the form "GET,DELETE
 # /users/<user_id>/(buyer|seller)_account/<(buyer|seller)_id>"
+@recorded_defclo
 def single_buyer_seller_defclo(
     buyer_or_seller_account_class, buyer_or_seller_id_col_name
 ):
@@ -845,9 +2217,7 @@ def single_buyer_seller_defclo(
         def _single_buyer_seller_get():
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -856,11 +2226,10 @@ def single_buyer_seller_defclo(
             # `buyer_or_seller_account_class._meta.db_table` row with
             # the column `buyer_or_seller_id_col_name` value (ie. the
             # primary key) equal to `inner_model_obj_id`, or errors out.
-            try:
-                buyer_or_seller_account = buyer_or_seller_account_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_account_class.DoesNotExist:
+            buyer_or_seller_account = cached_model_obj(
+                buyer_or_seller_account_class, inner_model_obj_id
+            )
+            if buyer_or_seller_account is None:
                 return JsonResponse(
                     {
                         "message": f"no buyer account with "
@@ -910,8 +2279,12 @@ def single_buyer_seller_defclo(
             # deletes the account.
             setattr(user, buyer_or_seller_id_col_name, None)
             user.save()
+            invalidate_model_objs(User, [user.user_id])
             kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
             buyer_or_seller_account.delete()
+            invalidate_model_objs(
+                buyer_or_seller_account_class, [inner_model_obj_id], deleted=True
+            )
             return JsonResponse(
                 {
                     "message": f"{kind_of_account} account with "
@@ -937,6 +2310,7 @@ def single_buyer_seller_defclo(
 
 # Handles requests of the form "GET,POST
 # /users/<user_id>/(buyer|seller)_account/<(buyer|seller)_id>/listings"
+@recorded_defclo
 def buyer_seller_all_defclo(
     buyer_or_seller_class, buyer_or_seller_id_col_name, to_buy_or_to_sell_listing_class
 ):
@@ -952,9 +2326,7 @@ def buyer_seller_all_defclo(
         def _buyer_seller_all_get():
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -964,11 +2336,7 @@ def buyer_seller_all_defclo(
             # the column `buyer_or_seller_id_col_name` value (ie. the
             # primary key) equal to `inner_model_obj_id`, or errors out.
             kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
-            try:
-                buyer_or_seller_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_class.DoesNotExist:
+            if cached_model_obj(buyer_or_seller_class, inner_model_obj_id) is None:
                 return JsonResponse(
                     {
                         "message": f"no {kind_of_account} account with "
@@ -984,6 +2352,13 @@ def buyer_seller_all_defclo(
             listings = to_buy_or_to_sell_listing_class.objects.filter(
                 **{buyer_or_seller_id_col_name: inner_model_obj_id}
             )
+            if stream_requested(request):
+                return ndjson_streaming_response(
+                    listing.serialize()
+                    for listing in listings.iterator(
+                        chunk_size=settings.STREAM_CHUNK_SIZE
+                    )
+                )
             listings_serialized = [listing.serialize() for listing in listings]
             return JsonResponse(
                 listings_serialized, status=status.HTTP_200_OK, safe=False
@@ -998,9 +2373,7 @@ def buyer_seller_all_defclo(
 
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -1011,11 +2384,10 @@ def buyer_seller_all_defclo(
             # `buyer_or_seller_account_class._meta.db_table` row with
             # the column `buyer_or_seller_id_col_name` value (ie. the
             # primary key) equal to `inner_model_obj_id`, or errors out.
-            try:
-                buyer_or_seller_account = buyer_or_seller_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_class.DoesNotExist:
+            buyer_or_seller_account = cached_model_obj(
+                buyer_or_seller_class, inner_model_obj_id
+            )
+            if buyer_or_seller_account is None:
                 return JsonResponse(
                     {
                         "message": f"no {kind_of_account} account with "
@@ -1097,33 +2469,13 @@ def buyer_seller_all_defclo(
                     status=status.HTTP_400_BAD_REQUEST,
                 )
             new_args = json_content.copy()
-
-            # This handles a bug where attempting to save a new model
-            # class object yields an IntegrityError that claims a
-            # pre-existing primary key column value was used. This
-            # when no primary key column value was set. (This bug is
-            # likely in pytest-django, not psycopg2.) This workaround
-            # pre-determines the next primary key column value.
-            if to_buy_or_to_sell_listing_class is ToBuyListing:
-                listing_id_col_name = "to_buy_listing_id"
-            else:
-                listing_id_col_name = "to_sell_listing_id"
-
-            max_listing_id = max(
-                getattr(listing, listing_id_col_name)
-                for listing in to_buy_or_to_sell_listing_class.objects.filter()
-            )
-            new_args[listing_id_col_name] = max_listing_id + 1
             new_args["date_posted"] = date.today()
+            new_args[buyer_or_seller_id_col_name] = getattr(
+                buyer_or_seller_account, buyer_or_seller_id_col_name
+            )
 
             # Create the listing and save it.
-            listing = to_buy_or_to_sell_listing_class(**new_args)
-            setattr(
-                listing,
-                buyer_or_seller_id_col_name,
-                getattr(buyer_or_seller_account, buyer_or_seller_id_col_name),
-            )
-            listing.save()
+            listing = insert_model_obj(to_buy_or_to_sell_listing_class, **new_args)
             return JsonResponse(listing.serialize(), status=status.HTTP_200_OK)
 
         return func_dispatch(
@@ -1142,12 +2494,28 @@ def buyer_seller_all_defclo(
 # Handles requests of the form "GET,PATCH,DELETE
 # /users/<user_id>/(buyer|seller)_account/<(buyer|seller)_id>/listings/<
 # listing_id>"
+@recorded_defclo
 def buyer_seller_listing_defclo(
     buyer_or_seller_class,
     buyer_or_seller_id_col_name,
     to_buy_or_to_sell_listing_class,
     to_buy_or_to_sell_listing_id_col_name,
 ):
+    quote_name = connection.ops.quote_name
+
+    # The listing's ETag is its row's version. The query also tests that
+    # the user and the account exist, so that the 404 for a missing one
+    # isn't answered with a 304.
+    listing_version_sql = (
+        "SELECT row_version FROM "
+        + quote_name(to_buy_or_to_sell_listing_class._meta.db_table)
+        + f" WHERE {quote_name(to_buy_or_to_sell_listing_id_col_name)} = %s "
+        + f"AND EXISTS (SELECT 1 FROM {quote_name(User._meta.db_table)} "
+        + "WHERE user_id = %s) "
+        + "AND EXISTS (SELECT 1 FROM "
+        + quote_name(buyer_or_seller_class._meta.db_table)
+        + f" WHERE {quote_name(buyer_or_seller_id_col_name)} = %s);"
+    )
 
     # BEGIN closure
     @api_view(["GET", "PATCH", "DELETE"])
@@ -1160,12 +2528,17 @@ def buyer_seller_listing_defclo(
         # /users/<user_id>/buyer_account/<buyer_id>/listings/<to_buy_lis
         # ting_id> would return the listing.
         def _buyer_seller_listing_get():
+            response = conditional_get_response(
+                request,
+                listing_version_sql,
+                (third_model_obj_id, outer_model_obj_id, inner_model_obj_id),
+            )
+            if response is not None:
+                return response
 
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -1177,11 +2550,7 @@ def buyer_seller_listing_defclo(
             # primary key) equal to `inner_model_obj_id` exists, or
             # errors out.
             kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
-            try:
-                buyer_or_seller_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_class.DoesNotExist:
+            if cached_model_obj(buyer_or_seller_class, inner_model_obj_id) is None:
                 return JsonResponse(
                     {
                         "message": f"no {kind_of_account} account with "
@@ -1201,9 +2570,9 @@ def buyer_seller_listing_defclo(
                 else "to-sell listing"
             )
             try:
-                listing = to_buy_or_to_sell_listing_class.objects.get(
-                    **{to_buy_or_to_sell_listing_id_col_name: third_model_obj_id}
-                )
+                listing = to_buy_or_to_sell_listing_class.objects.annotate(
+                    row_version=row_version_annotation(to_buy_or_to_sell_listing_class)
+                ).get(**{to_buy_or_to_sell_listing_id_col_name: third_model_obj_id})
             except to_buy_or_to_sell_listing_class.DoesNotExist:
                 return JsonResponse(
                     {
@@ -1215,9 +2584,11 @@ def buyer_seller_listing_defclo(
                 )
 
             # Return the listing object, serialized.
-            return JsonResponse(
+            response = JsonResponse(
                 listing.serialize(), status=status.HTTP_200_OK, safe=False
             )
+            response["ETag"] = make_etag(listing.row_version)
+            return response
 
         # Handles PATCH requests specifying a user id, a buyer or
         # seller id, and a listing id. For example, PATCH {json}
@@ -1227,9 +2598,7 @@ def buyer_seller_listing_defclo(
 
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -1240,11 +2609,7 @@ def buyer_seller_listing_defclo(
             # the column `buyer_or_seller_id_col_name` value (ie. the
             # primary key) equal to `inner_model_obj_id`, or errors out.
             kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
-            try:
-                buyer_or_seller_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_class.DoesNotExist:
+            if cached_model_obj(buyer_or_seller_class, inner_model_obj_id) is None:
                 return JsonResponse(
                     {
                         "message": f"no {kind_of_account} account with "
@@ -1303,9 +2668,7 @@ def buyer_seller_listing_defclo(
 
             # Tests whether a matching user with
             # user_id=`outer_model_obj_id` exists, or errors out.
-            try:
-                User.objects.get(user_id=outer_model_obj_id)
-            except User.DoesNotExist:
+            if cached_model_obj(User, outer_model_obj_id) is None:
                 return JsonResponse(
                     {"message": f"no user with user_id={outer_model_obj_id}"},
                     status=status.HTTP_404_NOT_FOUND,
@@ -1316,11 +2679,7 @@ def buyer_seller_listing_defclo(
             # the column `buyer_or_seller_id_col_name` value (ie. the
             # primary key) equal to `inner_model_obj_id`, or errors out.
             kind_of_account = buyer_or_seller_id_col_name.split("_")[0]
-            try:
-                buyer_or_seller_class.objects.get(
-                    **{buyer_or_seller_id_col_name: inner_model_obj_id}
-                )
-            except buyer_or_seller_class.DoesNotExist:
+            if cached_model_obj(buyer_or_seller_class, inner_model_obj_id) is None:
                 return JsonResponse(
                     {
                         "message": f"no {kind_of_account} account with "
@@ -16,3 +16,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moundmusic.settings")
 
 application = get_wsgi_application()
+
+from moundmusic.dbutils import warm_database_connections, warm_pk_filters  # noqa: E402
+
+# The primary key filters are built, and the database connections the
+# first requests will use are opened, before the first request. A server
+# that loads the application before forking its workers hands them all
+# the same connections, which each worker forgets and replaces (see
+# moundmusic.pooled_postgresql).
+warm_pk_filters()
+warm_database_connections()
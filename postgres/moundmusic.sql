@@ -74,6 +74,8 @@ DROP INDEX IF EXISTS idx_album_song_bridge_album_id;
 
 DROP INDEX IF EXISTS idx_album_song_bridge_song_id;
 
+DROP INDEX IF EXISTS idx_album_song_bridge_album_id_disc_number_track_number;
+
 
 DROP TABLE IF EXISTS album;
 
@@ -110,18 +112,35 @@ DROP TABLE IF EXISTS song_genre_bridge;
 DROP TABLE IF EXISTS album_song_bridge;
 
 
+DROP FUNCTION IF EXISTS bump_row_version;
+
+DROP SEQUENCE IF EXISTS row_version_seq;
+
+
 DROP TYPE IF EXISTS gender_type;
 
 
 CREATE TYPE gender_type AS ENUM('male', 'female', 'nonbinary');
 
 
+CREATE SEQUENCE row_version_seq;
+
+CREATE FUNCTION bump_row_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW IS DISTINCT FROM OLD THEN
+        NEW.row_version := nextval('row_version_seq');
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TABLE album (
     album_id SERIAL PRIMARY KEY,
     title VARCHAR(256) NOT NULL,
     number_of_discs SMALLINT NOT NULL DEFAULT 1,
     number_of_tracks SMALLINT NOT NULL,
-    release_date DATE NOT NULL
+    release_date DATE NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -130,7 +149,8 @@ CREATE TABLE artist (
     first_name VARCHAR(64) NOT NULL,
     last_name VARCHAR(64) NOT NULL,
     gender gender_type NOT NULL,
-    birth_date DATE NOT NULL
+    birth_date DATE NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -138,27 +158,31 @@ CREATE TABLE buyer_account (
     buyer_id SERIAL PRIMARY KEY,
     postboard_name VARCHAR(64),
     date_created DATE NOT NULL,
-    user_id INTEGER
+    user_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
 CREATE TABLE genre (
     genre_id SERIAL PRIMARY KEY,
-    genre_name VARCHAR(64) NOT NULL
+    genre_name VARCHAR(64) NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
 CREATE TABLE song_lyrics (
     song_lyrics_id SERIAL PRIMARY KEY,
     lyrics TEXT NOT NULL,
-    song_id INTEGER
+    song_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
 CREATE TABLE user_password (
     password_id SERIAL PRIMARY KEY,
     encrypted_password BYTEA NOT NULL,
-    user_id INTEGER
+    user_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -166,7 +190,8 @@ CREATE TABLE seller_account (
     seller_id SERIAL PRIMARY KEY,
     storefront_name VARCHAR(64),
     date_created DATE NOT NULL,
-    user_id INTEGER
+    user_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -175,7 +200,8 @@ CREATE TABLE song (
     title VARCHAR(256) NOT NULL,
     length_minutes SMALLINT NOT NULL,
     length_seconds SMALLINT NOT NULL,
-    song_lyrics_id INTEGER
+    song_lyrics_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -184,7 +210,8 @@ CREATE TABLE to_buy_listing (
     max_accepting_price DECIMAL NOT NULL,
     date_posted DATE NOT NULL,
     album_id INTEGER,
-    buyer_id INTEGER
+    buyer_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -193,7 +220,8 @@ CREATE TABLE to_sell_listing (
     asking_price DECIMAL NOT NULL,
     date_posted DATE NOT NULL,
     album_id INTEGER,
-    seller_id INTEGER
+    seller_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -205,7 +233,8 @@ CREATE TABLE user_ (
     gender gender_type NOT NULL,
     date_joined DATE NOT NULL,
     buyer_id INTEGER,
-    seller_id INTEGER
+    seller_id INTEGER,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq')
 );
 
 
@@ -213,6 +242,7 @@ CREATE TABLE album_genre_bridge (
     album_genre_bridge_id SERIAL PRIMARY KEY,
     album_id INTEGER NOT NULL,
     genre_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (album_id, genre_id)
 );
 
@@ -220,6 +250,7 @@ CREATE TABLE artist_genre_bridge (
     artist_genre_bridge_id SERIAL PRIMARY KEY,
     artist_id INTEGER NOT NULL,
     genre_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (artist_id, genre_id)
 );
 
@@ -227,6 +258,7 @@ CREATE TABLE song_genre_bridge (
     song_genre_bridge_id SERIAL PRIMARY KEY,
     song_id INTEGER NOT NULL,
     genre_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (song_id, genre_id)
 );
 
@@ -236,6 +268,7 @@ CREATE TABLE album_song_bridge (
     disc_number SMALLINT NOT NULL,
     track_number SMALLINT NOT NULL,
     song_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (album_id, song_id)
 );
 
@@ -243,6 +276,7 @@ CREATE TABLE artist_album_bridge (
     artist_album_bridge_id SERIAL PRIMARY KEY,
     album_id INTEGER NOT NULL,
     artist_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (album_id, artist_id)
 );
 
@@ -250,6 +284,7 @@ CREATE TABLE artist_song_bridge (
     artist_song_bridge_id SERIAL PRIMARY KEY,
     song_id INTEGER NOT NULL,
     artist_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq'),
     UNIQUE (song_id, artist_id)
 );
 
@@ -425,3 +460,39 @@ CREATE INDEX idx_album_song_bridge_album_id ON album_song_bridge USING HASH(albu
 
 CREATE INDEX idx_album_song_bridge_song_id ON album_song_bridge USING HASH(song_id);
 
+CREATE INDEX idx_album_song_bridge_album_id_disc_number_track_number ON album_song_bridge USING BTREE(album_id, disc_number, track_number);
+
+CREATE TRIGGER trg_album_row_version BEFORE UPDATE ON album FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_row_version BEFORE UPDATE ON artist FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_buyer_account_row_version BEFORE UPDATE ON buyer_account FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_genre_row_version BEFORE UPDATE ON genre FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_lyrics_row_version BEFORE UPDATE ON song_lyrics FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_user_password_row_version BEFORE UPDATE ON user_password FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_seller_account_row_version BEFORE UPDATE ON seller_account FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_row_version BEFORE UPDATE ON song FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_to_buy_listing_row_version BEFORE UPDATE ON to_buy_listing FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_to_sell_listing_row_version BEFORE UPDATE ON to_sell_listing FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_user__row_version BEFORE UPDATE ON user_ FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_album_genre_bridge_row_version BEFORE UPDATE ON album_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_genre_bridge_row_version BEFORE UPDATE ON artist_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_genre_bridge_row_version BEFORE UPDATE ON song_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_album_song_bridge_row_version BEFORE UPDATE ON album_song_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_album_bridge_row_version BEFORE UPDATE ON artist_album_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_song_bridge_row_version BEFORE UPDATE ON artist_song_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
@@ -93,6 +93,8 @@ DROP INDEX IF EXISTS idx_album_song_bridge_album_id;
 
 DROP INDEX IF EXISTS idx_album_song_bridge_song_id;
 
+DROP INDEX IF EXISTS idx_album_song_bridge_album_id_disc_number_track_number;
+
 
 DROP INDEX IF EXISTS auth_group_name_a6ea08ec_like;
 
@@ -177,4 +179,9 @@ DROP TABLE IF EXISTS django_migrations;
 DROP TABLE IF EXISTS django_session;
 
 
+DROP FUNCTION IF EXISTS bump_row_version;
+
+DROP SEQUENCE IF EXISTS row_version_seq;
+
+
 DROP TYPE IF EXISTS gender_type;
@@ -0,0 +1,84 @@
+\c moundmusic;
+
+-- Adds the row_version columns and triggers that moundmusic_init.sql
+-- creates to a database that was set up before they existed. Every
+-- existing row is given its own version as the column is added.
+
+CREATE SEQUENCE row_version_seq;
+
+CREATE FUNCTION bump_row_version() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW IS DISTINCT FROM OLD THEN
+        NEW.row_version := nextval('row_version_seq');
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE album ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE artist ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE buyer_account ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE genre ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE song_lyrics ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE user_password ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE seller_account ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE song ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE to_buy_listing ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE to_sell_listing ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE user_ ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE album_genre_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE artist_genre_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE song_genre_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE album_song_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE artist_album_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+ALTER TABLE artist_song_bridge ADD COLUMN row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+CREATE TRIGGER trg_album_row_version BEFORE UPDATE ON album FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_row_version BEFORE UPDATE ON artist FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_buyer_account_row_version BEFORE UPDATE ON buyer_account FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_genre_row_version BEFORE UPDATE ON genre FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_lyrics_row_version BEFORE UPDATE ON song_lyrics FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_user_password_row_version BEFORE UPDATE ON user_password FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_seller_account_row_version BEFORE UPDATE ON seller_account FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_row_version BEFORE UPDATE ON song FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_to_buy_listing_row_version BEFORE UPDATE ON to_buy_listing FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_to_sell_listing_row_version BEFORE UPDATE ON to_sell_listing FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_user__row_version BEFORE UPDATE ON user_ FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_album_genre_bridge_row_version BEFORE UPDATE ON album_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_genre_bridge_row_version BEFORE UPDATE ON artist_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_song_genre_bridge_row_version BEFORE UPDATE ON song_genre_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_album_song_bridge_row_version BEFORE UPDATE ON album_song_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_album_bridge_row_version BEFORE UPDATE ON artist_album_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
+
+CREATE TRIGGER trg_artist_song_bridge_row_version BEFORE UPDATE ON artist_song_bridge FOR EACH ROW EXECUTE FUNCTION bump_row_version();
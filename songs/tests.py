@@ -4,13 +4,22 @@ import pytest
 import re
 import random
 import json
+import threading
 
+from django.db import connection
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.http.response import JsonResponse
 
+from moundmusic.cacheutils import get_response_cache
+from moundmusic.dbutils import insert_model_obj
+from moundmusic.views import batch
+
 from .models import Album, Song, SongLyrics, AlbumSongBridge
 
 from .views import (
+    index,
+    single_song,
     single_song_albums,
     single_song_single_album,
     single_song_lyrics,
@@ -24,6 +33,36 @@ def matches_date_isoformat(strval):
     return bool(re.match(r"^\d{4}-\d{2}-\d{2}$", strval))
 
 
+@pytest.mark.django_db
+def test_index_get_ids():
+    song_ids = [song.song_id for song in Song.objects.order_by("?")[:3]]
+    nonext_song_id = Song.objects.order_by("-song_id")[0].song_id + 1000
+    ids_param = ",".join(map(str, [song_ids[2], nonext_song_id, *song_ids[:2]]))
+    request = request_factory.get("/songs", {"ids": ids_param})
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = index(request)
+    assert len(captured_queries) == 1
+    assert response.status_code == 200
+    json_content = json.loads(response.content)
+    assert [song_dict["song_id"] for song_dict in json_content["results"]] == [
+        song_ids[2],
+        *song_ids[:2],
+    ]
+    assert json_content["missing"] == [nonext_song_id]
+
+
+@pytest.mark.django_db
+def test_index_get_ids_too_many(settings):
+    settings.MULTI_GET_MAX = 2
+    request = request_factory.get("/songs", {"ids": "1,2,3"})
+    response = index(request)
+    assert response.status_code == 400
+    json_content = json.loads(response.content)
+    assert json_content["message"] == (
+        "value for 'ids' has 3 ids; no more than 2 are accepted at once"
+    )
+
+
 @pytest.mark.django_db
 def test_song_albums_get():
     songs = Song.objects.filter()
@@ -57,6 +96,46 @@ def test_song_albums_get():
     )
 
 
+@pytest.mark.django_db
+def test_song_albums_get_query_count():
+    bridge_row = random.choice(AlbumSongBridge.objects.filter())
+    song_id = bridge_row.song_id
+    request = request_factory.get(f"/songs/{song_id}/albums")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_song_albums(request, song_id)
+    assert len(captured_queries) == 1
+    json_content = json.loads(response.content)
+    assert len(json_content) == AlbumSongBridge.objects.filter(song_id=song_id).count()
+
+
+@pytest.mark.django_db
+def test_song_albums_get_no_albums():
+    song = insert_model_obj(Song, title="Some Song", length_minutes=3, length_seconds=0)
+    request = request_factory.get(f"/songs/{song.song_id}/albums")
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_song_albums(request, song.song_id)
+    assert len(captured_queries) == 2
+    assert response.status_code == 200
+    assert json.loads(response.content) == []
+
+
+@pytest.mark.django_db
+def test_song_get_include():
+    song = random.choice(Song.objects.filter())
+    song_id = song.song_id
+    request = request_factory.get(f"/songs/{song_id}", {"include": "albums"})
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_song(request, song_id)
+    assert len(captured_queries) == 2
+    json_content = json.loads(response.content)
+    assert json_content["song_id"] == song_id
+    assert "artists" not in json_content and "genres" not in json_content
+    albums_response = single_song_albums(
+        request_factory.get(f"/songs/{song_id}/albums"), song_id
+    )
+    assert json_content["albums"] == json.loads(albums_response.content)
+
+
 @pytest.mark.django_db
 def test_song_albums_get_nonext_id():
     songs = Song.objects.filter()
@@ -372,3 +451,108 @@ def test_song_lyrics_delete_nonext_lyrics_id():
         json_content["message"]
         == f"no song lyrics with song_lyrics_id={song_lyrics_id}"
     )
+
+
+@pytest.mark.django_db
+def test_batch():
+    song = random.choice(Song.objects.filter())
+    song_id = song.song_id
+    nonext_song_id = Song.objects.order_by("-song_id")[0].song_id + 1000
+    batch_entries = [
+        {"method": "GET", "path": f"/songs/{song_id}"},
+        {"method": "GET", "path": f"/songs/{song_id}/albums?fields=title"},
+        {"method": "PATCH", "path": f"/songs/{song_id}", "body": {"title": "New"}},
+        {"method": "GET", "path": f"/songs/{nonext_song_id}"},
+        {"method": "POST", "path": f"/songs/{song_id}/albums"},
+        {"method": "GET", "path": "/no_such_endpoint"},
+    ]
+    request = request_factory.post(
+        "/batch", data=batch_entries, content_type="application/json"
+    )
+    response = batch(request)
+    assert response.status_code == 200
+    results = json.loads(response.content)
+    assert [result["status"] for result in results] == [200, 200, 200, 404, 405, 404]
+    assert results[0]["body"] == song.serialize()
+    albums_response = single_song_albums(
+        request_factory.get(f"/songs/{song_id}/albums", {"fields": "title"}),
+        song_id,
+    )
+    assert results[1]["body"] == json.loads(albums_response.content)
+    assert results[2]["body"]["title"] == "New"
+    assert Song.objects.get(song_id=song_id).title == "New"
+    assert results[3]["body"] == {"message": f"no song with song_id={nonext_song_id}"}
+    assert results[5]["body"] == {"message": "no endpoint at path /no_such_endpoint"}
+
+
+@pytest.mark.django_db
+def test_batch_inval_entries():
+    for batch_entries, message in (
+        ([], "batch must be a non-empty JSON array of request objects"),
+        (
+            [{"method": "PUT", "path": "/songs"}],
+            "batch element 0 'method' isn't one " + "of GET, POST, PATCH, DELETE",
+        ),
+        (
+            [{"method": "GET", "path": "/songs"}, {"method": "GET", "path": "songs"}],
+            "batch element 1 'path' isn't an absolute path",
+        ),
+        (
+            [{"method": "GET", "path": "/songs", "headers": {}}],
+            "batch element 0 has unexpected properties: headers",
+        ),
+    ):
+        request = request_factory.post(
+            "/batch", data=batch_entries, content_type="application/json"
+        )
+        response = batch(request)
+        assert response.status_code == 400
+        assert json.loads(response.content) == {"message": message}
+    request = request_factory.post(
+        "/batch",
+        data=[{"method": "POST", "path": "/songs", "body": {}}],
+        content_type="application/json",
+        QUERY_STRING="snapshot=1",
+    )
+    response = batch(request)
+    assert response.status_code == 400
+    assert json.loads(response.content) == {
+        "message": "?snapshot=1 is only accepted for batches of GETs"
+    }
+
+
+# The test transaction that django_db wraps every test in would keep the
+# batch's own transaction from being the outermost one, so this runs the
+# batch in a thread with its own connection. The batch is read-only, so
+# nothing needs cleaning up afterwards.
+def test_batch_snapshot(django_db_setup, django_db_blocker):
+    outcome = dict()
+
+    def post_batch():
+        try:
+            song_ids = [song.song_id for song in Song.objects.order_by("?")[:3]]
+            batch_entries = [
+                {"method": "GET", "path": f"/songs/{song_id}"} for song_id in song_ids
+            ]
+            request = request_factory.post(
+                "/batch?snapshot=1", data=batch_entries, content_type="application/json"
+            )
+            with CaptureQueriesContext(connection) as captured_queries:
+                outcome["response"] = batch(request)
+            outcome["queries"] = [query["sql"] for query in captured_queries]
+            outcome["song_ids"] = song_ids
+        finally:
+            connection.close()
+
+    with django_db_blocker.unblock():
+        thread = threading.Thread(target=post_batch)
+        thread.start()
+        thread.join()
+    response = outcome["response"]
+    assert response.status_code == 200
+    results = json.loads(response.content)
+    assert [result["body"]["song_id"] for result in results] == outcome["song_ids"]
+    assert outcome["queries"][0].startswith(
+        "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ"
+    )
+    assert get_response_cache().stats()["stores"] == 0
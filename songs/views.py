@@ -5,16 +5,27 @@ from django.http.response import JsonResponse
 from rest_framework.decorators import api_view
 from rest_framework import status
 
-from moundmusic.viewutils import (
-    func_dispatch,
-    validate_post_request,
-    validate_bridgetab_models,
+from moundmusic.cacheutils import (
+    cached_model_obj,
+    invalidate_model_objs,
+    link_tag,
+    row_tag,
+    table_tag,
 )
+from moundmusic.dbutils import insert_model_obj
 from moundmusic.viewutils import (
     index_defclo,
     single_model_defclo,
     outer_id_inner_list_defclo,
     outer_id_inner_id_defclo,
+    cached_get_response,
+    replica_get_response,
+    func_dispatch,
+    validate_post_request,
+    validate_bridgetab_models,
+    validate_fields_param,
+    narrow_queryset,
+    bridge_include_loader,
 )
 
 from .models import (
@@ -50,36 +61,97 @@ from .models import (
 index = index_defclo(Song, "song_id")
 
 
+# Returns the album_song_bridge rows for a song, each with its album
+# object, in one query that joins album_song_bridge to album.
+def song_albums_queryset(song_id, fields=None):
+    return narrow_queryset(
+        AlbumSongBridge.objects.filter(song_id=song_id)
+        .select_related("album")
+        .order_by("album_id", "disc_number", "track_number"),
+        fields,
+        related_name="album",
+        keep_fields=("disc_number", "track_number"),
+    )
+
+
+# The album_song_bridge table contains the disc and track number for
+# each song. With that info available, the return object is constructed
+# as a list of objects with disc_number and track_number properties for
+# the disc # & track # the song has on that album, plus an album
+# property that points to the album.
+def serialize_song_albums(bridge_rows, fields=None):
+    return [
+        {
+            "disc_number": bridge_row.disc_number,
+            "track_number": bridge_row.track_number,
+            "album": bridge_row.album.serialize(fields),
+        }
+        for bridge_row in bridge_rows
+    ]
+
+
 # GET,PATCH,DELETE /songs/<song_id>
-single_song = single_model_defclo(Song, "song_id")
+#
+# GET accepts ?include=albums,artists,genres to embed those collections
+# in the song object, in the same form the matching
+# /songs/<song_id>/<relation> endpoints return them.
+single_song = single_model_defclo(
+    Song,
+    "song_id",
+    includes={
+        "albums": lambda song_id: serialize_song_albums(song_albums_queryset(song_id)),
+        "artists": bridge_include_loader(
+            "song_id", Artist, "artist_id", ArtistSongBridge
+        ),
+        "genres": bridge_include_loader("song_id", Genre, "genre_id", SongGenreBridge),
+    },
+)
 
 
 # GET /songs/<song_id>/albums
+#
+# It's served through the response cache; the list changes with the
+# song, with its album_song_bridge rows, and with any of the albums.
+# Like the other GETs, it reads from the read replicas if there are any.
 @api_view(["GET"])
-def single_song_albums(_, outer_model_obj_id):
-    try:
-        Song.objects.get(song_id=outer_model_obj_id)
-    except Song.DoesNotExist:
+def single_song_albums(request, outer_model_obj_id):
+    return replica_get_response(
+        request,
+        lambda: cached_get_response(
+            request,
+            "association",
+            [
+                row_tag(Song, outer_model_obj_id),
+                link_tag(AlbumSongBridge, "song_id", outer_model_obj_id),
+                table_tag(Album),
+            ],
+            lambda: single_song_albums_response(request, outer_model_obj_id),
+        ),
+    )
+
+
+def single_song_albums_response(request, outer_model_obj_id):
+    # ?fields= narrows the album objects in the output.
+    result = validate_fields_param(request, Album)
+    if isinstance(result, JsonResponse):
+        return result
+    else:
+        fields = result
+
+    # The bridge rows and their albums are fetched with one query. Only
+    # if that comes back empty is a second query needed, to tell a song
+    # that's on no albums from a song that doesn't exist.
+    bridge_rows = list(song_albums_queryset(outer_model_obj_id, fields))
+    if not bridge_rows and not Song.objects.filter(song_id=outer_model_obj_id).exists():
         return JsonResponse(
             {"message": f"no song with song_id={outer_model_obj_id}"},
             status=status.HTTP_404_NOT_FOUND,
         )
-    bridge_rows = AlbumSongBridge.objects.filter(song_id=outer_model_obj_id)
-
-    # The album_song_bridge table contains the disc and track number
-    # for each song. With that info available, the return object is
-    # constructed as a list of objects with disc_number and track_number
-    # properties for the disc # & track # the song has on that album,
-    # plus an album property that points to the album.
-    return_list = [
-        {
-            "disc_number": bridge_row.disc_number,
-            "track_number": bridge_row.track_number,
-            "album": Album.objects.get(album_id=bridge_row.album_id).serialize(),
-        }
-        for bridge_row in bridge_rows
-    ]
-    return JsonResponse(return_list, status=status.HTTP_200_OK, safe=False)
+    return JsonResponse(
+        serialize_song_albums(bridge_rows, fields),
+        status=status.HTTP_200_OK,
+        safe=False,
+    )
 
 
 # GET /songs/<song_id>/albums/<album_id>
@@ -97,10 +169,7 @@ def single_song_single_album(_, outer_model_obj_id, inner_model_obj_id):
     if isinstance(result, JsonResponse):
         return result
     else:
-        _, inner_model, _ = result
-    bridge_row = AlbumSongBridge.objects.get(
-        song_id=outer_model_obj_id, album_id=inner_model_obj_id
-    )
+        _, inner_model, bridge_row = result
 
     # The album_song_bridge table contains the disc and track number
     # for each song. The return object has disc_number and track_number
@@ -142,9 +211,7 @@ single_song_single_genre = outer_id_inner_id_defclo(
 @api_view(["GET", "POST"])
 def single_song_lyrics(request, outer_model_obj_id):
     def _single_song_lyrics_get():
-        try:
-            Song.objects.get(song_id=outer_model_obj_id)
-        except Song.DoesNotExist:
+        if cached_model_obj(Song, outer_model_obj_id) is None:
             return JsonResponse(
                 {"message": f"no song with song_id={outer_model_obj_id}"},
                 status=status.HTTP_404_NOT_FOUND,
@@ -190,21 +257,12 @@ def single_song_lyrics(request, outer_model_obj_id):
         if isinstance(result, JsonResponse):
             return result
         validated_input = result
-        song_lyrics = SongLyrics(**validated_input)
-        # This handles a bug where attempting to save a new model class
-        # object yields an IntegrityError that claims a pre-existing
-        # primary key column value was used. This when no primary key
-        # column value was set. (This bug is likely in pytest-django,
-        # not psycopg2.) This workaround pre-determines the next primary
-        # key column value.
-        max_song_lyrics_id = max(
-            song_lyrics.song_lyrics_id for song_lyrics in SongLyrics.objects.filter()
-        )
-        song_lyrics.song_lyrics_id = max_song_lyrics_id + 1
-        song_lyrics.song_id = song.song_id
-        song_lyrics.save()
+        validated_input.pop("song_lyrics_id", None)
+        validated_input["song_id"] = song.song_id
+        song_lyrics = insert_model_obj(SongLyrics, **validated_input)
         song.song_lyrics_id = song_lyrics.song_lyrics_id
         song.save()
+        invalidate_model_objs(Song, [song.song_id])
         return JsonResponse(song_lyrics.serialize(), status=status.HTTP_200_OK)
 
     return func_dispatch((_single_song_lyrics_get, _single_song_lyrics_post), request)
@@ -214,9 +272,7 @@ def single_song_lyrics(request, outer_model_obj_id):
 @api_view(["GET", "DELETE"])
 def single_song_single_lyrics(request, outer_model_obj_id, inner_model_obj_id):
     def _single_song_lyrics_get():
-        try:
-            Song.objects.get(song_id=outer_model_obj_id)
-        except Song.DoesNotExist:
+        if cached_model_obj(Song, outer_model_obj_id) is None:
             return JsonResponse(
                 {"message": f"no song with song_id={outer_model_obj_id}"},
                 status=status.HTTP_404_NOT_FOUND,
@@ -253,6 +309,7 @@ def single_song_single_lyrics(request, outer_model_obj_id, inner_model_obj_id):
             )
         song.song_lyrics_id = None
         song.save()
+        invalidate_model_objs(Song, [song.song_id])
         song_lyrics.delete()
         return JsonResponse(
             {
@@ -8,12 +8,19 @@ import json
 
 from datetime import date
 
+from asgiref.sync import async_to_sync
+from django.db import connection
 from django.test.client import RequestFactory
-from django.http.response import JsonResponse
+from django.test.utils import CaptureQueriesContext
+from django.http.response import JsonResponse, StreamingHttpResponse
+
+from moundmusic.asyncviewutils import async_view
+from moundmusic.cacheutils import RowCache
 
 from .models import User, UserPassword, BuyerAccount, Album, ToBuyListing
 
 from .views import (
+    index,
     single_user_password_set_password,
     single_user_password_authenticate,
     single_user_single_buyer_account,
@@ -33,6 +40,30 @@ def matches_2plc_decimal_format(strval):
     return bool(re.match(r"^\d+\.\d{1,2}$", strval))
 
 
+@pytest.mark.django_db
+def test_index_patch_bulk():
+    users = list(User.objects.order_by("user_id")[:2])
+    patch_list = [
+        {"user_id": users[0].user_id, "gender": "nonbinary"},
+        {"user_id": users[1].user_id, "first_name": "Somename", "gender": "female"},
+    ]
+    request = request_factory.patch(
+        "/users", data=patch_list, content_type="application/json"
+    )
+    response = index(request)
+    assert response.status_code == 200
+    assert json.loads(response.content) == {
+        "updated": [users[0].user_id, users[1].user_id],
+        "missing": [],
+    }
+    first_user = User.objects.get(user_id=users[0].user_id)
+    assert first_user.gender == "nonbinary"
+    assert first_user.first_name == users[0].first_name
+    second_user = User.objects.get(user_id=users[1].user_id)
+    assert second_user.gender == "female"
+    assert second_user.first_name == "Somename"
+
+
 @pytest.mark.django_db
 def test_user_passwd_set_post():
     users = User.objects.filter()
@@ -447,6 +478,62 @@ def test_user_buyer_acct_delete_nonext_buy_id():
     )
 
 
+@pytest.mark.django_db
+def test_user_buyer_acct_get_row_cached():
+    user = random.choice(User.objects.filter(buyer_id__isnull=False))
+    user_id, buyer_id = user.user_id, user.buyer_id
+    url = f"/users/{user_id}/buyer_account/{buyer_id}"
+    response = single_user_single_buyer_account(
+        request_factory.get(url), user_id, buyer_id
+    )
+    assert response.status_code == 200
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_user_single_buyer_account(
+            request_factory.get(url), user_id, buyer_id
+        )
+    assert len(captured_queries) == 0
+    assert response.status_code == 200
+    assert json.loads(response.content)["buyer_id"] == buyer_id
+    response = single_user_single_buyer_account(
+        request_factory.delete(url), user_id, buyer_id
+    )
+    assert response.status_code == 200
+    response = single_user_single_buyer_account(
+        request_factory.get(url), user_id, buyer_id
+    )
+    assert response.status_code == 404
+
+
+# Two RowCache objects on the same django cache stand in for two
+# processes sharing a memcached server.
+@pytest.mark.django_db
+def test_row_cache():
+    user = random.choice(User.objects.filter(buyer_id__isnull=False))
+    user_id, buyer_id = user.user_id, user.buyer_id
+    row_cache = RowCache("default", 2, 300, {"user_": 60})
+    other_row_cache = RowCache("default", 2, 300, {"user_": 60})
+    assert row_cache.model_timeout(User) == 60
+    assert row_cache.model_timeout(BuyerAccount) == 300
+    with CaptureQueriesContext(connection) as captured_queries:
+        row = row_cache.lookup(BuyerAccount, buyer_id)
+        assert row_cache.lookup(BuyerAccount, buyer_id) == row
+        assert other_row_cache.lookup(BuyerAccount, buyer_id) == row
+    assert len(captured_queries) == 1
+    assert row_cache.stats()["misses"] == 1
+    assert row_cache.stats()["local_hits"] == 1
+    assert other_row_cache.stats()["shared_hits"] == 1
+    # Deleting the user deletes its buyer account, so that invalidates
+    # every cached buyer_account row, in both processes.
+    other_row_cache.invalidate(User, [user_id], deleted=True)
+    with CaptureQueriesContext(connection) as captured_queries:
+        row_cache.lookup(BuyerAccount, buyer_id)
+    assert len(captured_queries) == 1
+    row_cache.lookup(User, user_id)
+    row_cache.lookup(User, random.choice(User.objects.exclude(user_id=user_id)).pk)
+    assert row_cache.stats()["evictions"] == 1
+    assert row_cache.stats()["entries"] == 2
+
+
 # TEST single_user_single_buyer_account_any_listing()
 @pytest.mark.django_db
 def test_user_buyer_acct_any_listing_get():
@@ -476,6 +563,28 @@ def test_user_buyer_acct_any_listing_get():
     assert "buyer_id" in listing_dict and isinstance(listing_dict["buyer_id"], int)
 
 
+# TEST single_user_single_buyer_account_any_listing()
+@pytest.mark.django_db
+def test_user_buyer_acct_any_listing_get_stream():
+    users = User.objects.filter(buyer_id__isnull=False)
+    user = random.choice(users)
+    user_id, buyer_id = user.user_id, user.buyer_id
+    request = request_factory.get(
+        f"/users/{user_id}/buyer_account/{buyer_id}/listings",
+        HTTP_ACCEPT="application/x-ndjson",
+    )
+    response = single_user_single_buyer_account_any_listing(request, user_id, buyer_id)
+    assert isinstance(response, StreamingHttpResponse)
+    assert response.status_code == 200
+    listing_dicts = [
+        json.loads(line) for line in b"".join(response.streaming_content).splitlines()
+    ]
+    assert len(listing_dicts) == ToBuyListing.objects.filter(buyer_id=buyer_id).count()
+    for listing_dict in listing_dicts:
+        assert listing_dict["buyer_id"] == buyer_id
+        assert matches_2plc_decimal_format(listing_dict["max_accepting_price"])
+
+
 # TEST single_user_single_buyer_account_any_listing()
 @pytest.mark.django_db
 def test_user_buyer_acct_any_listing_get_nonext_user_id():
@@ -743,6 +852,32 @@ def test_user_buyer_acct_listing_get():
     assert "buyer_id" in json_content and json_content["buyer_id"] == buyer_id
 
 
+@pytest.mark.django_db
+def test_user_buyer_acct_listing_get_etag():
+    listing = random.choice(ToBuyListing.objects.filter(buyer_id__isnull=False))
+    listing_id, buyer_id = listing.to_buy_listing_id, listing.buyer_id
+    user_id = User.objects.get(buyer_id=buyer_id).user_id
+    url = f"/users/{user_id}/buyer_account/{buyer_id}/listings/{listing_id}"
+    response = single_user_single_buyer_account_single_listing(
+        request_factory.get(url), user_id, buyer_id, listing_id
+    )
+    etag = response["ETag"]
+    request = request_factory.get(url, HTTP_IF_NONE_MATCH=etag)
+    with CaptureQueriesContext(connection) as captured_queries:
+        response = single_user_single_buyer_account_single_listing(
+            request, user_id, buyer_id, listing_id
+        )
+    assert len(captured_queries) == 1
+    assert response.status_code == 304
+    listing.max_accepting_price += 1
+    listing.save()
+    response = single_user_single_buyer_account_single_listing(
+        request, user_id, buyer_id, listing_id
+    )
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+
+
 # TEST single_user_single_buyer_account_single_listing()
 @pytest.mark.django_db
 def test_user_buyer_acct_listing_get_nonext_user_id():
@@ -1114,3 +1249,75 @@ def test_user_buyer_acct_listing_delete_nonext_listing_id():
 # functions that returned them; that ensures the seller-side functions
 # are correct, since it's the same code either way. Testing the
 # seller-side endpoint functions would be duplicative.
+
+
+# TEST the async counterparts served under ASGI. Their lookups run on
+# database threads, which don't see a test's uncommitted writes, so
+# these only read rows that are already there.
+@pytest.mark.django_db
+def test_async_user_buyer_acct_listing_get():
+    listing = ToBuyListing.objects.order_by("to_buy_listing_id").first()
+    listing_id, buyer_id = listing.to_buy_listing_id, listing.buyer_id
+    user_id = User.objects.get(buyer_id=buyer_id).user_id
+    async_view_function = async_to_sync(
+        async_view(single_user_single_buyer_account_single_listing)
+    )
+    url = f"/users/{user_id}/buyer_account/{buyer_id}/listings/{listing_id}"
+    response = async_view_function(
+        request_factory.get(url), user_id, buyer_id, listing_id
+    )
+    sync_response = single_user_single_buyer_account_single_listing(
+        request_factory.get(url), user_id, buyer_id, listing_id
+    )
+    assert response.status_code == 200
+    assert json.loads(response.content) == json.loads(sync_response.content)
+    assert response["ETag"] == sync_response["ETag"]
+    # A conditional GET is answered by the synchronous endpoint.
+    request = request_factory.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+    response = async_view_function(request, user_id, buyer_id, listing_id)
+    assert response.status_code == 304
+    # Every lookup fails, and the user's 404 is the one returned.
+    nonext_id = 10**9
+    url = f"/users/{nonext_id}/buyer_account/{nonext_id}/listings/{nonext_id}"
+    response = async_view_function(
+        request_factory.get(url), nonext_id, nonext_id, nonext_id
+    )
+    assert response.status_code == 404
+    assert json.loads(response.content) == {
+        "message": f"no user with user_id={nonext_id}"
+    }
+    url = f"/users/{user_id}/buyer_account/{nonext_id}/listings/{nonext_id}"
+    response = async_view_function(
+        request_factory.get(url), user_id, nonext_id, nonext_id
+    )
+    assert response.status_code == 404
+    assert json.loads(response.content) == {
+        "message": f"no buyer account with buyer_id={nonext_id}"
+    }
+
+
+@pytest.mark.django_db
+def test_async_user_buyer_acct_any_listing_get():
+    buyer_id = ToBuyListing.objects.order_by("to_buy_listing_id").first().buyer_id
+    user_id = User.objects.get(buyer_id=buyer_id).user_id
+    async_view_function = async_to_sync(
+        async_view(single_user_single_buyer_account_any_listing)
+    )
+    url = f"/users/{user_id}/buyer_account/{buyer_id}/listings"
+    response = async_view_function(request_factory.get(url), user_id, buyer_id)
+    sync_response = single_user_single_buyer_account_any_listing(
+        request_factory.get(url), user_id, buyer_id
+    )
+    assert response.status_code == 200
+    assert json.loads(response.content) == json.loads(sync_response.content)
+    # A stream is read to the end on the database thread.
+    response = async_view_function(
+        request_factory.get(url, {"stream": "1"}), user_id, buyer_id
+    )
+    assert not response.streaming
+    assert [
+        json.loads(line) for line in response.content.decode().splitlines()
+    ] == json.loads(sync_response.content)
+    # Methods without an async function go to the synchronous endpoint.
+    response = async_view_function(request_factory.put(url), user_id, buyer_id)
+    assert response.status_code == 405
@@ -8,6 +8,8 @@ from django.http.response import JsonResponse
 from rest_framework.decorators import api_view
 from rest_framework import status
 
+from moundmusic.cacheutils import cached_model_obj
+from moundmusic.dbutils import insert_model_obj
 from moundmusic.viewutils import (
     index_defclo,
     single_model_defclo,
@@ -35,9 +37,7 @@ from .models import (
 # A utility function that represents repeated code in this file. Manages
 # testing input for a endpoint that handles POSTed password input.
 def validate_user_password_input(request, user_id):
-    try:
-        User.objects.get(user_id=user_id)
-    except User.DoesNotExist:
+    if cached_model_obj(User, user_id) is None:
         return JsonResponse(
             {"message": f"no user with user_id={user_id}"},
             status=status.HTTP_404_NOT_FOUND,
@@ -88,24 +88,13 @@ def single_user_password_set_password(request, model_obj_id):
     try:
         user_password = UserPassword.objects.get(user_id=model_obj_id)
     except UserPassword.DoesNotExist:
-        # This handles a bug where attempting to save a new model class
-        # object yields an IntegrityError that claims a pre-existing
-        # primary key column value was used. This when no primary key
-        # column value was set. (This bug is likely in pytest-django,
-        # not psycopg2.) This workaround pre-determines the next primary
-        # key column value.
-        max_password_id = max(
-            user_password.password_id for user_password in UserPassword.objects.filter()
-        )
-        user_password = UserPassword(
-            password_id=max_password_id + 1,
-            encrypted_password=encrypted_password,
-            user_id=model_obj_id,
+        user_password = insert_model_obj(
+            UserPassword, encrypted_password=encrypted_password, user_id=model_obj_id
         )
     else:
         user_password.encrypted_password = encrypted_password
+        user_password.save()
 
-    user_password.save()
     return JsonResponse(
         user_password.serialize(), status=status.HTTP_200_OK, safe=False
     )